@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Answer Layouts
+Precompiled markdown list layouts the rich ShareGPT converters render records with
+"""
+
+from typing import Callable, Iterable
+
+Layout = Callable[[Iterable[str]], str]
+
+def list_layout(heading: str, prefix: str = "• ", suffix: str = "") -> Layout:
+    """Renderer for a heading line followed by one f"{prefix}{item}{suffix}" line per item
+    
+    The heading and separators are built once; rendering a record is then a
+    single str.join instead of one formatted string and list append per item.
+    Items must be strings; the record decoders format any other list entries.
+    """
+    head = f"{heading}\n{prefix}"
+    separator = f"{suffix}\n{prefix}"
+    
+    def render(items: Iterable[str]) -> str:
+        return head + separator.join(items) + suffix
+    
+    return render
+
+def section(title: str, prefix: str = "• ", suffix: str = "") -> Layout:
+    """A blank line, a **title**: heading and its bullet lines"""
+    return list_layout(f"\n**{title}**:", prefix, suffix)
+
+def sub_list(label: str) -> Layout:
+    """An italic label and indented dash lines, continuing a step block"""
+    return list_layout(f"\n{label}", "  - ")
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite
+Times the converters, process_file, JSON decoding and encoding, the quality
+statistics and the dataset build on synthetic fixtures of every data type,
+compares records/sec and peak RSS against a saved baseline, and checks that
+the JSON backends give the same conversations
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional
+
+import improved_convert_to_sharegpt as convert
+import json_backend
+from create_final_fixed_dataset import build_in_memory, build_out_of_core, quality_report
+from dataset_stats import compute_stats, stats_path
+from json_backend import JSON_BACKENDS
+from record_schemas import RecordDecoder
+from run_metrics import peak_rss_bytes
+from sharegpt_io import encode_conversation, iter_sharegpt_file, read_sharegpt_file
+
+# Input file of each data type, as in convert_all_data
+INPUT_FILES = {
+    "cot": "combined_cot_data.json",
+    "semantic_memory": "combined_semantic_memory.jsonl",
+    "episodic_memory": "combined_episodic_memory.jsonl",
+    "procedural_memory": "combined_procedural_memory.jsonl",
+    "realtime_reflection": "combined_realtime_reflection.jsonl",
+    "strategy_reflection": "combined_strategy_reflection.jsonl",
+    "deep_reflection": "combined_deep_reflection.jsonl"
+}
+
+CASE_GROUPS = ("convert", "process_file", "json", "quality", "build")
+
+BENCHMARK_VERSION = 1
+
+WORDS = (
+    "analysis", "baseline", "boundary", "calibration", "constraint", "dataset", "dependency", "estimate",
+    "evidence", "experiment", "feedback", "gradient", "hypothesis", "interface", "iteration", "latency",
+    "measurement", "model", "objective", "outcome", "pipeline", "precision", "protocol", "resource",
+    "review", "sample", "schedule", "signal", "stakeholder", "structure", "threshold", "validation",
+    "variance", "workflow", "état", "naïve", "coöperation"
+)
+DOMAINS = ("physics", "biology", "software engineering", "economics", "mathematics", "medicine")
+
+def phrase(rng: random.Random, low: int = 3, high: int = 9) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def phrases(rng: random.Random, low: int = 1, high: int = 5) -> List[str]:
+    return [phrase(rng) for _ in range(rng.randint(low, high))]
+
+def synthetic_record(data_type: str, rng: random.Random, index: int) -> Dict[str, Any]:
+    """One raw record with the fields the data type's converter reads, at realistic sizes"""
+    
+    title = f"{phrase(rng, 2, 4).title()} {index}"
+    domain = rng.choice(DOMAINS)
+    
+    if data_type == "cot":
+        return {
+            "title": title,
+            "domain": domain,
+            "description": phrase(rng, 10, 30),
+            "complexity": rng.choice(("low", "medium", "high", "expert")),
+            "prerequisites": phrases(rng, 0, 4),
+            "steps": [
+                {
+                    "description": phrase(rng),
+                    "input_requirements": phrases(rng, 0, 3),
+                    "validation_criteria": phrases(rng, 0, 3),
+                    "potential_errors": phrases(rng, 0, 3),
+                    "expected_outcomes": phrases(rng, 0, 2)
+                }
+                for _ in range(rng.randint(3, 8))
+            ],
+            "key_concepts": phrases(rng, 0, 5),
+            "best_practices": phrases(rng, 0, 4),
+            "common_applications": phrases(rng, 0, 4)
+        }
+    
+    if data_type == "semantic_memory":
+        concepts = [
+            {"id": f"c{index}_{i}", "name": phrase(rng, 1, 3), "definition": phrase(rng, 8, 40),
+             "type": rng.choice(("entity", "process", "property", ""))}
+            for i in range(rng.randint(1, 8))
+        ]
+        return {
+            "domain": domain,
+            "description": phrase(rng, 8, 20),
+            "memory_content": {
+                "concepts": concepts,
+                "relationships": [
+                    {"source": rng.choice(concepts)["name"], "target": rng.choice(concepts)["name"],
+                     "type": rng.choice(("causes", "is_a", "part_of", "depends_on")),
+                     "confidence": rng.choice((0, 60, 75, 90))}
+                    for _ in range(rng.randint(0, 6))
+                ],
+                "attributes": [{"name": phrase(rng, 1, 2), "value": phrase(rng, 1, 4)} for _ in range(rng.randint(0, 4))]
+            }
+        }
+    
+    if data_type == "episodic_memory":
+        return {
+            "scenario": {"description": phrase(rng, 5, 12)},
+            "context": {"setting": phrase(rng, 4, 10)},
+            "timeline": [{"description": phrase(rng, 5, 15)} for _ in range(rng.randint(2, 8))],
+            "outcome": {"success": rng.random() < 0.7, "lessons_learned": phrases(rng, 0, 4)}
+        }
+    
+    if data_type == "procedural_memory":
+        return {
+            "title": f"Implementing {title}",
+            "domain": domain,
+            "description": phrase(rng, 10, 25),
+            "memory_content": {
+                "steps": [
+                    {"step_id": f"s{i}", "description": phrase(rng), "action": phrase(rng, 2, 5),
+                     "expected_duration": f"{rng.randint(5, 90)} minutes", "details": phrases(rng, 0, 3)}
+                    for i in range(rng.randint(3, 9))
+                ],
+                "conditions": phrases(rng, 0, 3),
+                "best_practices": phrases(rng, 0, 4),
+                "common_pitfalls": phrases(rng, 0, 4)
+            }
+        }
+    
+    if data_type == "realtime_reflection":
+        return {
+            "scenario_description": phrase(rng, 5, 12),
+            "current_situation": {"current_state": phrase(rng, 5, 15)},
+            "immediate_observations": phrases(rng, 0, 5),
+            "immediate_adjustments": phrases(rng, 0, 5),
+            "quick_wins": phrases(rng, 0, 3),
+            "warning_signs": phrases(rng, 0, 3)
+        }
+    
+    if data_type == "strategy_reflection":
+        return {
+            "scenario_description": phrase(rng, 5, 12),
+            "strategic_context": {"timeframe": f"{rng.randint(1, 24)} months"},
+            "strategic_patterns": phrases(rng, 0, 5),
+            "opportunities": phrases(rng, 0, 5),
+            "risks": phrases(rng, 0, 5),
+            "strategic_recommendations": phrases(rng, 0, 5)
+        }
+    
+    if data_type == "deep_reflection":
+        return {
+            "scenario_description": phrase(rng, 5, 12),
+            "fundamental_analysis": {"core_issue": phrase(rng, 5, 15)},
+            "underlying_patterns": phrases(rng, 0, 5),
+            "root_causes": phrases(rng, 0, 5),
+            "long_term_implications": phrases(rng, 0, 5),
+            "learning_insights": phrases(rng, 0, 4),
+            "system_level_recommendations": phrases(rng, 0, 5)
+        }
+    
+    raise ValueError(f"Unknown data type: {data_type}")
+
+def write_fixtures(fixture_dir: Path, size: int, seed: int):
+    """Write size raw records per data type, plus a JSONL copy of the cot records
+    
+    The records are converted once so the quality and build cases have
+    ShareGPT input; every file is reproducible from seed and size.
+    """
+    
+    raw_dir = fixture_dir / "raw"
+    converted_dir = fixture_dir / "converted"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    converted_dir.mkdir(parents=True, exist_ok=True)
+    
+    for data_type, filename in INPUT_FILES.items():
+        rng = random.Random(f"{seed}:{data_type}")
+        records = [synthetic_record(data_type, rng, index) for index in range(size)]
+        
+        if filename.endswith('.json'):
+            with open(raw_dir / filename, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2, ensure_ascii=False)
+            jsonl_file = raw_dir / f"{Path(filename).stem}.jsonl"
+        else:
+            jsonl_file = raw_dir / filename
+        
+        with open(jsonl_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        
+        with redirect_stdout(io.StringIO()):
+            convert.process_file(str(raw_dir / filename), data_type,
+                                 str(converted_dir / f"rich_sharegpt_{data_type}.json"))
+
+def case_names(groups: List[str]) -> List[str]:
+    names = []
+    if "convert" in groups:
+        names += [f"convert/{data_type}" for data_type in INPUT_FILES]
+    if "process_file" in groups:
+        names += ["process_file/json", "process_file/jsonl"]
+    if "json" in groups:
+        names += ["json/loads", "json/dumps"]
+    if "quality" in groups:
+        names.append("quality")
+    if "build" in groups:
+        names += ["build/in_memory", "build/out_of_core"]
+    return names
+
+def prepare_case(name: str, fixture_dir: Path, output_dir: Path) -> Callable[[], int]:
+    """Load what case name needs and return a function that runs it once and returns the records handled"""
+    
+    raw_dir = fixture_dir / "raw"
+    converted = [fixture_dir / "converted" / f"rich_sharegpt_{data_type}.json" for data_type in INPUT_FILES]
+    
+    group, _, variant = name.partition("/")
+    if group == "convert":
+        converter = convert.CONVERSION_FUNCTIONS[variant]
+        with open(raw_dir / f"{Path(INPUT_FILES[variant]).stem}.jsonl", encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        
+        def run():
+            decoder = RecordDecoder(variant)
+            for record in records:
+                converter(decoder.decode(record), convert.SYSTEM_MESSAGE)
+            return len(records)
+        return run
+    
+    if group == "process_file":
+        input_file = str(raw_dir / f"combined_cot_data.{variant}")
+        output_file = str(output_dir / "rich_sharegpt_cot_data.json")
+        return lambda: convert.process_file(input_file, "cot", output_file)
+    
+    if group == "json" and variant == "loads":
+        lines = []
+        for filename in INPUT_FILES.values():
+            with open(raw_dir / f"{Path(filename).stem}.jsonl", 'rb') as f:
+                lines += f.readlines()
+        
+        def run():
+            for line in lines:
+                json_backend.loads(line)
+            return len(lines)
+        return run
+    
+    if group == "json":
+        conversations = [conv for filepath in converted for conv in iter_sharegpt_file(str(filepath))]
+        
+        def run():
+            for conv in conversations:
+                encode_conversation(conv, "json")
+            return len(conversations)
+        return run
+    
+    if group == "quality":
+        conversations = [list(iter_sharegpt_file(str(filepath))) for filepath in converted]
+        
+        def run():
+            for filepath, file_conversations in zip(converted, conversations):
+                quality_report(compute_stats(file_conversations), filepath.name)
+            return sum(map(len, conversations))
+        return run
+    
+    if group == "build":
+        build = build_in_memory if variant == "in_memory" else build_out_of_core
+        filepaths = [(filepath.name, str(filepath)) for filepath in converted]
+        
+        def run():
+            # The statistics sidecars would let later repeats skip the quality pass
+            for filepath in converted:
+                if os.path.exists(stats_path(str(filepath))):
+                    os.remove(stats_path(str(filepath)))
+            random.seed(42)
+            total, _ = build(filepaths, output_dir)
+            return total
+        return run
+    
+    raise ValueError(f"Unknown benchmark case: {name}")
+
+def run_case(name: str, fixture_dir: str, output_dir: str, repeat: int, backend: str = "auto") -> Dict[str, Any]:
+    """Pool task: run one case repeat times in a fresh process and keep the fastest run
+    
+    Peak RSS covers the whole process, fixtures included, so each case runs in
+    its own process to keep one case's memory out of another's figure.
+    """
+    
+    json_backend.set_backend(backend)
+    os.makedirs(output_dir, exist_ok=True)
+    with redirect_stdout(io.StringIO()):
+        run = prepare_case(name, Path(fixture_dir), Path(output_dir))
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            records = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    
+    return {
+        "records": records,
+        "seconds": best,
+        "records_per_sec": records / best if best else 0.0,
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+# Documents where orjson on its own would differ from the standard library
+JSON_EDGE_CASES = (
+    b'{"id": 123456789012345678901234567890, "n": -9223372036854775809}',
+    b'{"value": NaN, "limit": Infinity, "tiny": 1e-400, "huge": 1e400}',
+    b'{"text": "\\ud800 lone surrogate", "nested": [[[]]], "empty": {}}',
+    b'{"float": 0.1, "exponent": 1e16, "digits": "12345678901234567890"}',
+    b'{"broken": ',
+    b'\xff\xfe'
+)
+
+def decode_outcome(data: bytes) -> Any:
+    """What loads returns, or the type of error it raises"""
+    try:
+        return ("value", json_backend.loads(data))
+    except ValueError as e:
+        return ("error", type(e).__name__)
+
+def check_json_backends(fixture_dir: Path, output_dir: Path) -> List[str]:
+    """Compare the orjson backend with the standard library and describe every difference
+    
+    Raw records and the edge cases must decode to equal values (NaN compared
+    by repr) with the same errors, and every fixture must convert to equal
+    conversations in the json and jsonl formats; the json files and the
+    in-memory dataset build, which only hold strings, must match byte for
+    byte.
+    """
+    
+    raw_dir = fixture_dir / "raw"
+    documents = list(JSON_EDGE_CASES)
+    for filename in INPUT_FILES.values():
+        with open(raw_dir / f"{Path(filename).stem}.jsonl", 'rb') as f:
+            documents += f.readlines()
+    
+    outcomes = {}
+    for backend in ("json", "orjson"):
+        json_backend.set_backend(backend)
+        decoded = [repr(decode_outcome(document)) for document in documents]
+        
+        converted = {}
+        for data_type, filename in INPUT_FILES.items():
+            for output_format in ("json", "jsonl"):
+                output_file = str(output_dir / backend / f"rich_sharegpt_{data_type}.{output_format}")
+                with redirect_stdout(io.StringIO()):
+                    convert.process_file(str(raw_dir / filename), data_type, output_file,
+                                         output_format=output_format)
+                with open(output_file, 'rb') as f:
+                    converted[output_file] = (f.read(), read_sharegpt_file(output_file))
+        
+        build_dir = output_dir / backend / "build"
+        build_dir.mkdir(parents=True, exist_ok=True)
+        filepaths = [(f"rich_sharegpt_{data_type}.json", str(output_dir / backend / f"rich_sharegpt_{data_type}.json"))
+                     for data_type in INPUT_FILES]
+        with redirect_stdout(io.StringIO()):
+            random.seed(42)
+            build_in_memory(filepaths, build_dir)
+        for split_name in ("train", "validation", "test"):
+            with open(build_dir / f"{split_name}.json", 'rb') as f:
+                converted[f"build/{split_name}.json"] = (f.read(), None)
+        
+        outcomes[backend] = decoded, list(converted.values()), list(converted)
+    json_backend.set_backend()
+    
+    differences = []
+    (json_decoded, json_files, names), (orjson_decoded, orjson_files, _) = outcomes["json"], outcomes["orjson"]
+    for document, expected, actual in zip(documents, json_decoded, orjson_decoded):
+        if expected != actual:
+            differences.append(f"decoding {document[:60]!r}: {actual[:80]} instead of {expected[:80]}")
+    for name, (expected_bytes, expected), (actual_bytes, actual) in zip(names, json_files, orjson_files):
+        if name.endswith('.jsonl'):
+            if actual != expected:
+                differences.append(f"{os.path.basename(name)}: conversations differ")
+        elif actual_bytes != expected_bytes:
+            differences.append(f"{os.path.basename(name)}: bytes differ")
+    return differences
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Describe every case that got slower or bigger than baseline by more than threshold"""
+    
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        
+        if result["records_per_sec"] < previous["records_per_sec"] * (1 - threshold):
+            regressions.append(f"{key}: {result['records_per_sec']:,.0f} records/sec, "
+                               f"baseline {previous['records_per_sec']:,.0f}")
+        if result["peak_rss_bytes"] and previous.get("peak_rss_bytes") and \
+                result["peak_rss_bytes"] > previous["peak_rss_bytes"] * (1 + threshold):
+            regressions.append(f"{key}: peak RSS {result['peak_rss_bytes'] / 2**20:,.1f} MB, "
+                               f"baseline {previous['peak_rss_bytes'] / 2**20:,.1f} MB")
+    return regressions
+
+def change(value: Optional[float], previous: Optional[float]) -> str:
+    if not value or not previous:
+        return ""
+    return f"{(value / previous - 1) * 100:+.1f}%"
+
+def print_results(results: Dict[str, Any], baseline: Dict[str, Any]):
+    print(f"\n{'case':<32} {'records/sec':>12} {'vs base':>8} {'peak RSS MB':>12} {'vs base':>8}")
+    for key, result in results.items():
+        previous = baseline.get(key, {})
+        rss = result["peak_rss_bytes"]
+        print(f"{key:<32} {result['records_per_sec']:>12,.0f} "
+              f"{change(result['records_per_sec'], previous.get('records_per_sec')):>8} "
+              f"{rss / 2**20 if rss else float('nan'):>12,.1f} "
+              f"{change(rss, previous.get('peak_rss_bytes')):>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversion, statistics and dataset build throughput")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000],
+                        help="Records per data type in the synthetic fixtures (default: %(default)s)")
+    parser.add_argument("--cases", nargs="+", choices=CASE_GROUPS, default=list(CASE_GROUPS),
+                        help="Groups of cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per case; the fastest counts (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic fixtures")
+    parser.add_argument("--work-dir", help="Keep fixtures and outputs here instead of a temporary directory")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --output or --save-baseline")
+    parser.add_argument("--save-baseline", help="Save the results as the new baseline file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Fractional slowdown or RSS growth that counts as a regression (default: %(default)s)")
+    parser.add_argument("--json-backend", choices=JSON_BACKENDS, default="auto",
+                        help="JSON backend the cases run with (default: %(default)s)")
+    parser.add_argument("--check-json", action="store_true",
+                        help="Also check that the orjson backend gives the same results as the standard "
+                             "library on the fixtures; differences fail the run")
+    args = parser.parse_args()
+    
+    if args.check_json:
+        json_backend.set_backend("orjson")
+    backend = json_backend.set_backend(args.json_backend)
+    
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+    
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="sharegpt-bench-"))
+    names = case_names(args.cases)
+    results = {}
+    differences = []
+    
+    print("=== ShareGPT Pipeline Benchmarks ===")
+    try:
+        for size in args.sizes:
+            fixture_dir = work_dir / f"fixtures_{size}_{args.seed}"
+            if not (fixture_dir / "converted").is_dir():
+                print(f"Writing fixtures: {size:,} records per data type...")
+                write_fixtures(fixture_dir, size, args.seed)
+            
+            if args.check_json:
+                print(f"Checking JSON backends on {size:,} records per data type...")
+                # In its own process too, since children inherit the peak RSS of the parent
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    differences += executor.submit(check_json_backends, fixture_dir,
+                                                   work_dir / "outputs" / f"check_json_{size}").result()
+            
+            for name in names:
+                output_dir = work_dir / "outputs" / name.replace("/", "_")
+                # A fresh process per case keeps the peak RSS figures independent
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    result = executor.submit(run_case, name, str(fixture_dir), str(output_dir), args.repeat,
+                                             backend).result()
+                key = f"{name}@{size}"
+                results[key] = {"case": name, "size": size, **result}
+                print(f"  {key}: {result['records_per_sec']:,.0f} records/sec")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    print_results(results, baseline)
+    
+    report = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "json_backend": backend,
+        "results": results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResults saved to {path}")
+    
+    if args.check_json:
+        if differences:
+            print(f"\n⚠ {len(differences)} difference(s) between the orjson and json backends:")
+            for difference in differences:
+                print(f"  {difference}")
+        else:
+            print("\n✓ The orjson and json backends give the same results")
+    
+    if args.baseline:
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠ {len(regressions)} regression(s) beyond {args.threshold * 100:.0f}% against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\n✓ No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}")
+    
+    if differences:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
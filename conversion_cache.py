@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Conversion Cache
+Content-addressed store of rendered conversations, keyed by the hash of the
+input record and the version of the converter that rendered it
+"""
+
+import os
+import sqlite3
+from typing import Optional, Tuple
+
+class ConversionCache:
+    """SQLite-backed cache of encoded conversations shared by all pool workers.
+    
+    Every conversion run is a new generation. Entries that are read or written
+    during a run are stamped with its generation, and evict() drops entries
+    that no recent run has used. Pass the generation of an already started
+    run to attach a worker process to it. hits and misses are run totals kept
+    by the caller, since lookups happen in whichever process converts a chunk.
+    """
+    
+    def __init__(self, path: str, generation: int = None, batch_size: int = 1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        
+        self._pending = []
+        self._touched = []
+        
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        
+        # Caches written before content digests were stored cannot serve dedup, start them over
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+        if columns and "content_hash" not in columns:
+            self._conn.execute("DROP TABLE entries")
+        
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                record_hash TEXT NOT NULL,
+                converter_version TEXT NOT NULL,
+                text TEXT NOT NULL,
+                assistant_length INTEGER NOT NULL,
+                content_hash BLOB NOT NULL,
+                generation INTEGER NOT NULL,
+                PRIMARY KEY (record_hash, converter_version)
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        
+        if generation is None:
+            # Start a new run
+            with self._conn:
+                row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+                generation = (row[0] if row else 0) + 1
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (generation,))
+        
+        self.generation = generation
+    
+    def get(self, record_hash: str, converter_version: str) -> Optional[Tuple[str, int, bytes]]:
+        """Return (text, assistant_length, content_hash) for a cached conversation, or None"""
+        row = self._conn.execute(
+            "SELECT text, assistant_length, content_hash FROM entries WHERE record_hash = ? AND converter_version = ?",
+            (record_hash, converter_version)
+        ).fetchone()
+        
+        if row is None:
+            return None
+        
+        self._touched.append((self.generation, record_hash, converter_version))
+        if len(self._touched) >= self.batch_size:
+            self.commit()
+        return row
+    
+    def put(self, record_hash: str, converter_version: str, text: str, assistant_length: int, content_hash: bytes):
+        """Queue a rendered conversation, written on the next commit()"""
+        self._pending.append((record_hash, converter_version, text, assistant_length, content_hash, self.generation))
+        if len(self._pending) >= self.batch_size:
+            self.commit()
+    
+    def commit(self):
+        """Write queued entries and refresh the generation of entries that were read"""
+        if not self._pending and not self._touched:
+            return
+        
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", self._pending)
+            self._conn.executemany(
+                "UPDATE entries SET generation = ? WHERE record_hash = ? AND converter_version = ?",
+                self._touched
+            )
+        
+        self._pending = []
+        self._touched = []
+    
+    def evict(self, keep_generations: int = 2) -> int:
+        """Drop entries unused by the last keep_generations runs, returning how many were removed"""
+        self.commit()
+        
+        with self._conn:
+            cursor = self._conn.execute("DELETE FROM entries WHERE generation <= ?",
+                                        (self.generation - keep_generations,))
+        return cursor.rowcount
+    
+    def close(self):
+        """Commit outstanding work and close the database"""
+        self.commit()
+        self._conn.close()
@@ -4,129 +4,259 @@ Create Final Rich Dataset from Fixed ShareGPT Conversions
 This uses the improved conversion with complete answers
 """
 
+import argparse
 import json
+import math
 import os
 import random
+import shutil
+import struct
+import tempfile
+import time
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, Any, Callable, Iterable, Iterator, List
 
-def load_sharegpt_file(filepath: str) -> list:
-    """Load a ShareGPT formatted JSON file"""
-    print(f"Loading {os.path.basename(filepath)}...")
+import json_backend
+from dataset_stats import file_stats
+from json_backend import JSON_BACKENDS
+from near_duplicates import NEAR_DUP_MODES, NearDuplicateFilter
+from run_metrics import RunMetrics, peak_rss_bytes, print_stages
+from sharegpt_io import (
+    ParquetFileWriter, ShareGPTWriter, encode_conversation, find_sharegpt_file, iter_sharegpt_file,
+    json_size, path_size, read_sharegpt_file, require_format_support
+)
+
+SPLIT_NAMES = ("train", "validation", "test")
+
+# Split file extension per --split-format; Parquet splits load directly in datasets/Axolotl
+SPLIT_FORMATS = {"json": ".json", "parquet": ".parquet"}
+
+def remove_other_split_formats(output_dir: Path, split_name: str, split_format: str):
+    """Delete a split written earlier in another format so loaders see only one file per split"""
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    for other_format, suffix in SPLIT_FORMATS.items():
+        stale = output_dir / f"{split_name}{suffix}"
+        if other_format != split_format and stale.exists():
+            stale.unlink()
+
+def open_split_writer(output_dir: Path, split_name: str, split_format: str = "json"):
+    """Streaming writer for one split file"""
     
-    print(f"  Loaded {len(data):,} conversations")
-    return data
+    remove_other_split_formats(output_dir, split_name, split_format)
+    output_file = str(output_dir / f"{split_name}{SPLIT_FORMATS[split_format]}")
+    if split_format == "parquet":
+        return ParquetFileWriter(output_file, keep_empty=True)
+    return ShareGPTWriter(output_file, "json", keep_empty=True)
 
-def analyze_data_quality(conversations: list, source_name: str) -> dict:
-    """Analyze the quality of conversations"""
+def stream_sharegpt_file(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Yield the conversations of a ShareGPT file or shard directory with loading messages"""
+    print(f"Loading {os.path.basename(filepath)}...")
     
-    total = len(conversations)
-    valid_count = 0
-    total_length = 0
-    has_think_tag = 0
+    count = 0
+    for conversation in iter_sharegpt_file(filepath):
+        count += 1
+        yield conversation
     
-    # Sample analysis
-    sample_lengths = []
+    print(f"  Loaded {count:,} conversations")
+
+def load_sharegpt_file(filepath: str) -> list:
+    """Load a ShareGPT formatted JSON or JSONL file"""
+    print(f"Loading {os.path.basename(filepath)}...")
     
-    for conv in conversations:
-        if 'messages' in conv and len(conv['messages']) >= 3:
-            assistant_msg = conv['messages'][2]['content']
-            
-            # Check validity
-            if '<think>' in assistant_msg and '</think>' in assistant_msg:
-                has_think_tag += 1
-                
-            # Check completeness
-            msg_length = len(assistant_msg)
-            total_length += msg_length
-            
-            if msg_length > 300:  # Reasonable threshold for complete answer
-                valid_count += 1
-                
-            if len(sample_lengths) < 10:
-                sample_lengths.append(msg_length)
+    conversations = read_sharegpt_file(filepath)
     
-    avg_length = total_length / total if total > 0 else 0
+    print(f"  Loaded {len(conversations):,} conversations")
+    return conversations
+
+def quality_report(stats: dict, source_name: str) -> dict:
+    """Summarize the quality of one file from its dataset_stats report"""
+    
+    total = stats['conversations']
+    quality = stats['quality']
+    assistant = stats['overall']['roles'].get('assistant', {"count": 0})
     
     quality_report = {
         'source': source_name,
         'total': total,
-        'valid': valid_count,
-        'validity_rate': (valid_count / total * 100) if total > 0 else 0,
-        'has_think_tag': has_think_tag,
-        'think_tag_rate': (has_think_tag / total * 100) if total > 0 else 0,
-        'avg_length': avg_length,
-        'sample_lengths': sample_lengths
+        'valid': quality['valid'],
+        'validity_rate': (quality['valid'] / total * 100) if total > 0 else 0,
+        'has_think_tag': quality['has_think_tag'],
+        'think_tag_rate': (quality['has_think_tag'] / total * 100) if total > 0 else 0,
+        'avg_length': quality['assistant_chars'] / total if total > 0 else 0,
+        'length_percentiles': assistant.get('percentiles', {}),
+        'sections': {
+            section: summary.get('mean', 0)
+            for section, summary in stats['overall']['sections'].items()
+        }
     }
     
     return quality_report
 
-def create_train_val_test_splits(all_conversations: list, split_ratios: tuple = (0.9, 0.05, 0.05)) -> dict:
-    """Create train, validation, and test splits"""
+class StratifiedSplitAssigner:
+    """Assign conversations to splits so that every data source is split in split_ratios.
+    
+    Each source is dealt out on its own: when its m-th conversation arrives,
+    every split's deficit is its share ratio * m less the conversations it
+    already holds. A split a whole conversation behind takes it; otherwise the
+    seeded RNG draws one of the splits behind their share, with probability
+    proportional to the deficit. At every point of the stream each split then
+    holds its exact share of every source to within one conversation, so a
+    small source is never short in validation or test, yet which conversations
+    land in a split does not follow from their positions in the input. No
+    counts have to be known in advance. counts[split][source] is the split's
+    source distribution, kept up to date as conversations are assigned.
+    """
+    
+    def __init__(self, split_ratios: tuple = (0.9, 0.05, 0.05), seed: int = 42):
+        self.split_ratios = split_ratios
+        self.rng = random.Random(seed)
+        self.counts = {split_name: {} for split_name in SPLIT_NAMES}
+        self._seen = {}
+    
+    def assign(self, conversation: Dict[str, Any]) -> str:
+        """Pick the split of one conversation and count it"""
+        
+        source = conversation.get('data_source', 'unknown')
+        seen = self._seen[source] = self._seen.get(source, 0) + 1
+        
+        # The deficits sum to one, so some split is always behind its share
+        weights = []
+        for split_name, ratio in zip(SPLIT_NAMES, self.split_ratios):
+            deficit = ratio * seen - self.counts[split_name].get(source, 0)
+            if deficit >= 1:
+                break
+            weights.append(max(deficit, 0))
+        else:
+            split_name = self.rng.choices(SPLIT_NAMES, weights)[0]
+        
+        counts = self.counts[split_name]
+        counts[source] = counts.get(source, 0) + 1
+        return split_name
+
+def create_train_val_test_splits(all_conversations: list, split_ratios: tuple = (0.9, 0.05, 0.05),
+                                 seed: int = 42, source_counts: dict = None) -> dict:
+    """Create train, validation, and test splits, stratified by data source
+    
+    The conversations are shuffled, then split in one pass by a
+    StratifiedSplitAssigner; source_counts, if given, receives each split's
+    data source distribution.
+    """
     
     # Shuffle the data
     random.shuffle(all_conversations)
     
-    total = len(all_conversations)
-    train_size = int(total * split_ratios[0])
-    val_size = int(total * split_ratios[1])
+    assigner = StratifiedSplitAssigner(split_ratios, seed)
+    splits = {split_name: [] for split_name in SPLIT_NAMES}
+    for conversation in all_conversations:
+        splits[assigner.assign(conversation)].append(conversation)
     
-    splits = {
-        'train': all_conversations[:train_size],
-        'validation': all_conversations[train_size:train_size + val_size],
-        'test': all_conversations[train_size + val_size:]
-    }
+    if source_counts is not None:
+        source_counts.update(assigner.counts)
     
     return splits
 
-def main():
-    """Main dataset creation function"""
+class OutOfCoreSplitter:
+    """Assign conversations to splits as they stream past and shuffle each split on disk.
     
-    # Set random seed for reproducibility
-    random.seed(42)
-    
-    # Setup directories - using the FIXED data
-    base_dir = Path("processed_rich_fixed")  # NEW SOURCE DIRECTORY
-    output_dir = Path("final_rich_dataset_fixed")  # NEW OUTPUT DIRECTORY
-    
-    # Create output directory
-    output_dir.mkdir(exist_ok=True)
+    Splits are assigned by a StratifiedSplitAssigner in input order, so every
+    data source is split in split_ratios exactly without the input order
+    deciding which conversations are held out; each conversation then draws
+    one of its split's bucket files from a seeded RNG. On write,
+    each bucket is shuffled in memory on its own and appended to the split file
+    (Rao-Sandelius shuffle), which gives a uniform shuffle of the whole split
+    while holding only one bucket of about bucket_bytes at a time.
+    """
     
-    print("=== Creating Final Rich Dataset (FIXED VERSION) ===")
-    print(f"Source: {base_dir}")
-    print(f"Output: {output_dir}\n")
+    def __init__(self, work_dir: Path, expected_bytes: int, split_ratios: tuple = (0.9, 0.05, 0.05),
+                 seed: int = 42, bucket_bytes: int = 1 << 28, max_buckets: int = 256, head_size: int = 100):
+        self.rng = random.Random(seed)
+        self.split_ratios = split_ratios
+        self.head_size = head_size
+        self.head = []  # first conversations fed, in input order
+        self.preview = []  # first conversations written to the train split
+        self.total = 0
+        self.assigner = StratifiedSplitAssigner(split_ratios, seed)
+        self.source_counts = self.assigner.counts
+        
+        self._work_dir = tempfile.mkdtemp(prefix=".shuffle-", dir=work_dir)
+        self._buckets = {}
+        for split_name, ratio in zip(SPLIT_NAMES, split_ratios):
+            bucket_count = min(max(math.ceil(expected_bytes * ratio / bucket_bytes), 1), max_buckets)
+            self._buckets[split_name] = [
+                open(os.path.join(self._work_dir, f"{split_name}_{index:03d}.bin"), 'w+b')
+                for index in range(bucket_count)
+            ]
     
-    # Define which files to include (skip reflection data for core training)
-    files_to_include = [
-        "rich_sharegpt_cot_data.json",
-        "rich_sharegpt_semantic_memory.json",
-        "rich_sharegpt_episodic_memory.json",
-        "rich_sharegpt_procedural_memory.json"
-    ]
+    def feed(self, conversations: Iterable[Dict[str, Any]],
+             accept: Callable[[Dict[str, Any]], bool] = None) -> Iterator[Dict[str, Any]]:
+        """Assign every conversation to a split bucket and pass it through
+        
+        Conversations rejected by accept are passed through without being assigned.
+        """
+        
+        for conversation in conversations:
+            if accept is not None and not accept(conversation):
+                yield conversation
+                continue
+            
+            split_name = self.assigner.assign(conversation)
+            data = encode_conversation(conversation, "json").encode('utf-8')
+            buckets = self._buckets[split_name]
+            bucket = buckets[self.rng.randrange(len(buckets))]
+            bucket.write(struct.pack('<I', len(data)))
+            bucket.write(data)
+            self.total += 1
+            
+            if len(self.head) < self.head_size:
+                self.head.append(conversation)
+            
+            yield conversation
     
-    # Load all conversations
-    all_conversations = []
-    quality_reports = []
+    def _read_bucket(self, bucket) -> List[bytes]:
+        """Read back the length-prefixed conversations of one bucket"""
+        
+        bucket.seek(0)
+        blobs = []
+        while True:
+            header = bucket.read(4)
+            if not header:
+                return blobs
+            blobs.append(bucket.read(struct.unpack('<I', header)[0]))
     
-    for filename in files_to_include:
-        filepath = base_dir / filename
+    def write_splits(self, output_dir: Path, split_format: str = "json") -> Dict[str, int]:
+        """Shuffle every split into output_dir/<split>.json (or .parquet) and return the split sizes"""
         
-        if filepath.exists():
-            conversations = load_sharegpt_file(filepath)
-            all_conversations.extend(conversations)
-            
-            # Analyze quality
-            quality = analyze_data_quality(conversations, filename)
-            quality_reports.append(quality)
-        else:
-            print(f"Warning: {filename} not found!")
+        sizes = {}
+        try:
+            for split_name in SPLIT_NAMES:
+                with open_split_writer(output_dir, split_name, split_format) as writer:
+                    for bucket in self._buckets[split_name]:
+                        blobs = self._read_bucket(bucket)
+                        bucket.close()
+                        self.rng.shuffle(blobs)
+                        
+                        for blob in blobs:
+                            text = blob.decode('utf-8')
+                            writer.write_encoded(text)
+                            if split_name == "train" and len(self.preview) < 20:
+                                self.preview.append(json_backend.loads(text))
+                sizes[split_name] = writer.count
+        finally:
+            self.close()
+        
+        return sizes
     
-    print(f"\nTotal conversations loaded: {len(all_conversations):,}")
+    def close(self):
+        """Remove the bucket files"""
+        for buckets in self._buckets.values():
+            for bucket in buckets:
+                bucket.close()
+        shutil.rmtree(self._work_dir, ignore_errors=True)
+
+def print_quality_reports(quality_reports: list):
+    """Print the per-source quality analysis"""
     
-    # Print quality analysis
     print("\n=== Data Quality Analysis ===")
     for report in quality_reports:
         print(f"\n{report['source']}:")
@@ -134,12 +264,19 @@ def main():
         print(f"  Valid (>300 chars): {report['valid']:,} ({report['validity_rate']:.1f}%)")
         print(f"  Has <think> tags: {report['has_think_tag']:,} ({report['think_tag_rate']:.1f}%)")
         print(f"  Average length: {report['avg_length']:.0f} characters")
-        print(f"  Sample lengths: {report['sample_lengths'][:5]}")
+        percentiles = report['length_percentiles']
+        if percentiles:
+            print(f"  Length percentiles: p50 {percentiles['p50']:,}, p90 {percentiles['p90']:,}, "
+                  f"p99 {percentiles['p99']:,} characters")
+        print(f"  Mean <think> / answer length: {report['sections']['think']:.0f} / "
+              f"{report['sections']['answer']:.0f} characters")
+
+def check_improvements(conversations: list):
+    """Verify on a few CoT examples that responses are complete"""
     
-    # Check improvement over original
     print("\n=== Checking Improvements ===")
     # Sample a few CoT examples to verify they're complete
-    cot_examples = [conv for conv in all_conversations[:100] if conv.get('data_source') == 'cot']
+    cot_examples = [conv for conv in conversations[:100] if conv.get('data_source') == 'cot']
     if cot_examples:
         sample = cot_examples[0]
         assistant_msg = sample['messages'][2]['content']
@@ -153,35 +290,18 @@ def main():
             print("✓ CONFIRMED: Responses now include complete details!")
         else:
             print("⚠ WARNING: Responses may still be incomplete")
+
+def save_dataset_info(output_dir: Path, total_conversations: int, split_info: dict, build_mode: str,
+                      extra_info: dict = None):
+    """Write dataset_info.json, with extra_info entries describing optional build steps"""
     
-    # Create splits
-    print("\n=== Creating Train/Val/Test Splits ===")
-    splits = create_train_val_test_splits(all_conversations)
-    
-    # Save splits
-    for split_name, split_data in splits.items():
-        output_file = output_dir / f"{split_name}.json"
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(split_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"{split_name}: {len(split_data):,} conversations saved")
-        
-        # Analyze data source distribution
-        source_counts = {}
-        for conv in split_data:
-            source = conv.get('data_source', 'unknown')
-            source_counts[source] = source_counts.get(source, 0) + 1
-        
-        print(f"  Data distribution: {dict(source_counts)}")
-    
-    # Create dataset info file
     dataset_info = {
         "dataset_name": "Phi-4 Informius Rich Training Dataset (FIXED)",
         "description": "Enhanced ShareGPT formatted dataset with COMPLETE answers for Phi-4 finetuning",
         "version": "3.0_complete_answers",
         "created_date": datetime.now().isoformat(),
-        "total_conversations": len(all_conversations),
+        "total_conversations": total_conversations,
+        "build_mode": build_mode,
         "improvements_over_v2": [
             "All CoT responses include complete step-by-step details",
             "Full validation criteria and input requirements included",
@@ -189,16 +309,7 @@ def main():
             "Detailed summaries and conclusions",
             "Average response length significantly increased"
         ],
-        "splits": {
-            split_name: {
-                "conversations": len(split_data),
-                "percentage": len(split_data) / len(all_conversations) * 100,
-                "data_source_distribution": dict(source_counts)
-            }
-            for split_name, split_data in splits.items()
-            for source_counts in [{}]
-            if [source_counts.update({conv.get('data_source', 'unknown'): source_counts.get(conv.get('data_source', 'unknown'), 0) + 1}) for conv in split_data]
-        },
+        "splits": split_info,
         "data_sources": {
             "cot_data": "Chain-of-thought reasoning with complete step details and validation",
             "semantic_memory": "Knowledge networks with concepts, relationships, and attributes",
@@ -225,19 +336,17 @@ def main():
             "Comprehensive explanations with validation"
         ]
     }
+    dataset_info.update(extra_info or {})
     
     # Save dataset info
     with open(output_dir / "dataset_info.json", 'w', encoding='utf-8') as f:
         json.dump(dataset_info, f, indent=2, ensure_ascii=False)
+
+def show_sample_response(conversations: list):
+    """Print the first long CoT response among conversations"""
     
-    print(f"\n=== Dataset Creation Complete ===")
-    print(f"Output directory: {output_dir}")
-    print(f"Total conversations: {len(all_conversations):,}")
-    print("\nThe dataset now contains COMPLETE answers and is ready for training!")
-    
-    # Show a complete example
     print("\n=== Sample Complete Response ===")
-    for conv in all_conversations[:20]:
+    for conv in conversations[:20]:
         if conv.get('data_source') == 'cot' and len(conv['messages'][2]['content']) > 1000:
             print(f"User: {conv['messages'][1]['content']}")
             print(f"\nAssistant response preview (first 800 chars):")
@@ -245,5 +354,260 @@ def main():
             print(f"\n... (Total length: {len(conv['messages'][2]['content'])} characters)")
             break
 
+def print_near_duplicate_summary(near_dups: NearDuplicateFilter):
+    """Print how many near-duplicates were removed per source"""
+    
+    summary = near_dups.summary()
+    print(f"Near-duplicates ({summary['mode']}, similarity >= {summary['threshold']}): "
+          f"{summary['clusters']:,} clusters, {summary['dropped']:,} conversations removed")
+    for source, count in summary['dropped_by_source'].items():
+        print(f"  {source}: {count:,}")
+
+def build_metrics_info(metrics: RunMetrics, total: int, run_start: float, cpu_start: float) -> dict:
+    """Run totals and stage metrics of a build, printed and recorded in dataset_info.json"""
+    
+    run_seconds = time.perf_counter() - run_start
+    print_stages(metrics, run_seconds)
+    return {
+        "wall_seconds": round(run_seconds, 3),
+        "cpu_seconds": round(time.process_time() - cpu_start, 3),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "conversations_per_sec": round(total / run_seconds, 1) if run_seconds > 0 else None,
+        "stages": metrics.to_dict()
+    }
+
+def build_extra_info(near_dups: NearDuplicateFilter = None, split_format: str = "json",
+                     metrics_info: dict = None) -> dict:
+    """dataset_info entries for the optional build steps that ran"""
+    
+    extra_info = {"json_backend": json_backend.backend_name()}
+    if split_format != "json":
+        extra_info["split_format"] = split_format
+    if near_dups is not None:
+        extra_info["near_duplicates"] = near_dups.summary()
+    if metrics_info is not None:
+        extra_info["metrics"] = metrics_info
+    return extra_info
+
+def build_in_memory(filepaths: list, output_dir: Path, near_dups: NearDuplicateFilter = None,
+                    split_format: str = "json"):
+    """Load every conversation, then shuffle and split them in memory"""
+    
+    run_start = time.perf_counter()
+    cpu_start = time.process_time()
+    metrics = RunMetrics()
+    
+    # Load all conversations
+    all_conversations = []
+    quality_reports = []
+    
+    for filename, filepath in filepaths:
+        with metrics.stage("parse") as stage:
+            conversations = load_sharegpt_file(filepath)
+            stage.records += len(conversations)
+            stage.bytes_read += path_size(filepath)
+        
+        if near_dups:
+            with metrics.stage("near_dups") as stage:
+                all_conversations.extend(near_dups.filter(conversations))
+                stage.records += len(conversations)
+        else:
+            all_conversations.extend(conversations)
+        
+        # Analyze quality, reusing the sidecar statistics of unchanged files
+        with metrics.stage("stats") as stage:
+            quality = quality_report(file_stats(filepath, conversations), filename)
+            stage.records += len(conversations)
+        quality_reports.append(quality)
+    
+    print(f"\nTotal conversations loaded: {len(all_conversations):,}")
+    if near_dups:
+        print_near_duplicate_summary(near_dups)
+    
+    print_quality_reports(quality_reports)
+    
+    # Check improvement over original
+    check_improvements(all_conversations)
+    
+    # Create splits
+    print("\n=== Creating Train/Val/Test Splits ===")
+    source_counts = {}
+    with metrics.stage("split") as stage:
+        splits = create_train_val_test_splits(all_conversations, source_counts=source_counts)
+        stage.records += len(all_conversations)
+    
+    total = len(all_conversations)
+    split_info = {}
+    
+    # Save splits
+    for split_name, split_data in splits.items():
+        with metrics.stage("write") as stage:
+            # The json split writer gives the bytes of json.dump(split_data, indent=2) and its index
+            with open_split_writer(output_dir, split_name, split_format) as writer:
+                for conv in split_data:
+                    writer.write(conv)
+            stage.records += len(split_data)
+            stage.bytes_written += path_size(writer.output_file)
+        
+        print(f"{split_name}: {len(split_data):,} conversations saved")
+        print(f"  Data distribution: {source_counts[split_name]}")
+        
+        split_info[split_name] = {
+            "conversations": len(split_data),
+            "percentage": len(split_data) / total * 100 if total else 0,
+            "data_source_distribution": source_counts[split_name]
+        }
+    
+    metrics_info = build_metrics_info(metrics, total, run_start, cpu_start)
+    save_dataset_info(output_dir, total, split_info, "in_memory",
+                      build_extra_info(near_dups, split_format, metrics_info))
+    
+    return total, all_conversations
+
+def build_out_of_core(filepaths: list, output_dir: Path, near_dups: NearDuplicateFilter = None,
+                      split_format: str = "json"):
+    """Stream every conversation once into on-disk split buckets, then shuffle each split"""
+    
+    run_start = time.perf_counter()
+    cpu_start = time.process_time()
+    metrics = RunMetrics()
+    
+    # Compressed shards are sized by their JSON size, which is what the buckets hold
+    expected_bytes = sum(json_size(filepath) for _, filepath in filepaths)
+    splitter = OutOfCoreSplitter(output_dir, expected_bytes)
+    quality_reports = []
+    
+    def keep(conversation: Dict[str, Any]) -> bool:
+        with metrics.stage("near_dups") as stage:
+            stage.records += 1
+            return near_dups.keep(conversation)
+    
+    try:
+        for filename, filepath in filepaths:
+            # Statistics consume the stream and the splitter spills it on the way; the nested
+            # timed iterators charge reading to "parse" and bucketing to "split"
+            stream = metrics.timed(stream_sharegpt_file(filepath), "parse")
+            conversations = metrics.timed(splitter.feed(stream, keep if near_dups else None), "split")
+            with metrics.stage("stats"):
+                quality = quality_report(file_stats(filepath, conversations), filename)
+            quality_reports.append(quality)
+            
+            # Cached statistics leave the stream unread
+            for _ in conversations:
+                pass
+            metrics.get("parse").bytes_read += path_size(filepath)
+    except BaseException:
+        splitter.close()
+        raise
+    
+    total = splitter.total
+    print(f"\nTotal conversations loaded: {total:,}")
+    if near_dups:
+        print_near_duplicate_summary(near_dups)
+    
+    print_quality_reports(quality_reports)
+    
+    # Check improvement over original
+    check_improvements(splitter.head)
+    
+    print("\n=== Creating Train/Val/Test Splits (out-of-core) ===")
+    with metrics.stage("write") as stage:
+        sizes = splitter.write_splits(output_dir, split_format)
+        stage.records += total
+        stage.bytes_written += sum(path_size(str(output_dir / f"{split_name}{SPLIT_FORMATS[split_format]}"))
+                                   for split_name in SPLIT_NAMES)
+    
+    split_info = {}
+    for split_name in SPLIT_NAMES:
+        print(f"{split_name}: {sizes[split_name]:,} conversations saved")
+        print(f"  Data distribution: {splitter.source_counts[split_name]}")
+        
+        split_info[split_name] = {
+            "conversations": sizes[split_name],
+            "percentage": sizes[split_name] / total * 100 if total else 0,
+            "data_source_distribution": splitter.source_counts[split_name]
+        }
+    
+    metrics_info = build_metrics_info(metrics, total, run_start, cpu_start)
+    save_dataset_info(output_dir, total, split_info, "out_of_core",
+                      build_extra_info(near_dups, split_format, metrics_info))
+    
+    return total, splitter.preview
+
+def main():
+    """Main dataset creation function"""
+    
+    parser = argparse.ArgumentParser(description="Create the final train/validation/test splits")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Stream the conversions and shuffle the splits through on-disk buckets "
+                             "instead of loading everything into memory")
+    parser.add_argument("--near-dups", choices=NEAR_DUP_MODES, default="off",
+                        help="Drop near-duplicate conversations, or keep about sqrt(n) of each cluster of n "
+                             "(downweight) (default: %(default)s)")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.8,
+                        help="Estimated Jaccard similarity of near-duplicates (default: %(default)s)")
+    parser.add_argument("--split-format", choices=SPLIT_FORMATS, default="json",
+                        help="Write the splits as indented JSON or as zstd-compressed Parquet, which needs "
+                             "pyarrow (default: %(default)s)")
+    parser.add_argument("--json-backend", choices=JSON_BACKENDS, default="auto",
+                        help="JSON encoder/decoder for loading and writing conversations; auto uses orjson "
+                             "when it is installed (default: %(default)s)")
+    parser.add_argument("--source-dir", default="processed_rich_fixed",
+                        help="Directory with the ShareGPT conversions, such as a token_mixture.py selection "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    
+    require_format_support(args.split_format)
+    json_backend.set_backend(args.json_backend)
+    
+    # Set random seed for reproducibility
+    random.seed(42)
+    
+    # Setup directories - using the FIXED data
+    base_dir = Path(args.source_dir)
+    output_dir = Path("final_rich_dataset_fixed")  # NEW OUTPUT DIRECTORY
+    
+    # Create output directory
+    output_dir.mkdir(exist_ok=True)
+    
+    print("=== Creating Final Rich Dataset (FIXED VERSION) ===")
+    print(f"Source: {base_dir}")
+    print(f"Output: {output_dir}\n")
+    
+    # Define which files to include (skip reflection data for core training)
+    files_to_include = [
+        "rich_sharegpt_cot_data.json",
+        "rich_sharegpt_semantic_memory.json",
+        "rich_sharegpt_episodic_memory.json",
+        "rich_sharegpt_procedural_memory.json"
+    ]
+    
+    filepaths = []
+    for filename in files_to_include:
+        # Streaming conversions may have been written as JSONL or compressed shards
+        filepath = find_sharegpt_file(str(base_dir / Path(filename).stem))
+        
+        if filepath is not None:
+            filepaths.append((filename, filepath))
+        else:
+            print(f"Warning: {filename} not found!")
+    
+    near_dups = None
+    if args.near_dups != "off":
+        near_dups = NearDuplicateFilter(args.near_dups, args.near_dup_threshold)
+    
+    if args.out_of_core:
+        total, sample_conversations = build_out_of_core(filepaths, output_dir, near_dups, args.split_format)
+    else:
+        total, sample_conversations = build_in_memory(filepaths, output_dir, near_dups, args.split_format)
+    
+    print(f"\n=== Dataset Creation Complete ===")
+    print(f"Output directory: {output_dir}")
+    print(f"Total conversations: {total:,}")
+    print("\nThe dataset now contains COMPLETE answers and is ready for training!")
+    
+    # Show a complete example
+    show_sample_response(sample_conversations)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Dataset Statistics
+Single-pass length statistics for ShareGPT files, cached in a sidecar report
+next to each file
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+from sharegpt_io import iter_sharegpt_file, write_json_atomic
+
+# Bump when the report layout or any statistic changes, so old sidecars are recomputed
+STATS_VERSION = 1
+
+PERCENTILES = (50, 90, 95, 99)
+
+def file_hash(filepath: str, block_size: int = 1 << 20) -> str:
+    """Content hash identifying the file (or shard directory) a sidecar report was computed from"""
+    
+    digest = hashlib.blake2b(digest_size=16)
+    if not os.path.isdir(filepath):
+        paths = [filepath]
+    else:
+        names = sorted(os.listdir(filepath))
+        digest.update("\0".join(names).encode('utf-8'))
+        paths = [os.path.join(filepath, name) for name in names]
+    
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def file_signature(filepath: str) -> Dict[str, int]:
+    """Size and modification time of a file or shard directory, compared before any hashing"""
+    
+    if not os.path.isdir(filepath):
+        stat = os.stat(filepath)
+        return {"file_size": stat.st_size, "file_mtime_ns": stat.st_mtime_ns}
+    
+    stats = [os.stat(filepath)] + [entry.stat() for entry in os.scandir(filepath) if entry.is_file()]
+    return {
+        "file_size": sum(stat.st_size for stat in stats[1:]),
+        "file_mtime_ns": max(stat.st_mtime_ns for stat in stats)
+    }
+
+def sidecar_is_current(sidecar: str, report: Dict[str, Any], filepath: str) -> bool:
+    """Whether a sidecar report was computed from filepath as it is now
+    
+    The report's file_size and file_mtime_ns are checked first, as the .idx
+    header of record_index is, so an unchanged file is not read at all. Only
+    when they differ is the content hashed and compared with file_hash; a
+    match (the file was copied or touched) saves the new signature to the
+    sidecar so the next lookup is cheap again.
+    """
+    
+    signature = file_signature(filepath)
+    if all(report.get(key) == value for key, value in signature.items()):
+        return True
+    if report.get("file_hash") != file_hash(filepath):
+        return False
+    
+    report.update(signature)
+    write_json_atomic(sidecar, report)
+    return True
+
+def stats_path(filepath: str) -> str:
+    """Sidecar report next to a ShareGPT file"""
+    return f"{filepath}.stats.json"
+
+def split_think(content: str) -> Tuple[Optional[str], str]:
+    """Split an assistant message into its <think> section (None if absent) and the answer"""
+    
+    start = content.find('<think>')
+    end = content.find('</think>', start + 7) if start != -1 else -1
+    if end == -1:
+        return None, content
+    return content[start + 7:end].strip(), content[end + 8:].strip()
+
+class LengthStats:
+    """Lengths collected into a compact array and summarized once at the end"""
+    
+    def __init__(self):
+        self.values = array('L')
+    
+    def add(self, length: int):
+        self.values.append(length)
+    
+    def summary(self) -> Dict[str, Any]:
+        """Count, mean, extremes, nearest-rank percentiles and a power-of-two histogram"""
+        
+        count = len(self.values)
+        if not count:
+            return {"count": 0}
+        
+        ordered = sorted(self.values)
+        
+        # Bin k holds lengths in [2**(k-1), 2**k), bin 0 holds zero
+        bins = Counter(length.bit_length() for length in ordered)
+        histogram = [
+            {"lower": (1 << (k - 1)) if k else 0, "upper": 1 << k, "count": bins.get(k, 0)}
+            for k in range(min(bins), max(bins) + 1)
+        ]
+        
+        return {
+            "count": count,
+            "mean": sum(ordered) / count,
+            "min": ordered[0],
+            "max": ordered[-1],
+            "percentiles": {f"p{p}": ordered[max(-(-p * count // 100) - 1, 0)] for p in PERCENTILES},
+            "histogram": histogram
+        }
+
+class GroupStats:
+    """Length statistics of one group of conversations (a data source, or all of them)"""
+    
+    def __init__(self):
+        self.conversations = 0
+        self.conversation = LengthStats()
+        self.roles = {}
+        self.think = LengthStats()
+        self.answer = LengthStats()
+    
+    def add(self, messages: list):
+        self.conversations += 1
+        total = 0
+        
+        for message in messages:
+            role = message.get('role', 'unknown')
+            content = message.get('content') or ''
+            total += len(content)
+            
+            self.roles.setdefault(role, LengthStats()).add(len(content))
+            
+            if role == 'assistant':
+                think, answer = split_think(content)
+                if think is not None:
+                    self.think.add(len(think))
+                self.answer.add(len(answer))
+        
+        self.conversation.add(total)
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "conversations": self.conversations,
+            "conversation_length": self.conversation.summary(),
+            "roles": {role: stats.summary() for role, stats in sorted(self.roles.items())},
+            "sections": {
+                "think": self.think.summary(),
+                "answer": self.answer.summary()
+            }
+        }
+
+def compute_stats(conversations: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Length statistics per data source, role and think/answer section in one pass
+    
+    Lengths are in characters. "quality" keeps the original completeness checks
+    on the third message (the assistant reply in system/user/assistant layout).
+    """
+    
+    overall = GroupStats()
+    sources = {}
+    total = 0
+    valid = 0
+    has_think_tag = 0
+    assistant_chars = 0
+    
+    for conv in conversations:
+        total += 1
+        messages = conv.get('messages') or []
+        
+        overall.add(messages)
+        sources.setdefault(conv.get('data_source', 'unknown'), GroupStats()).add(messages)
+        
+        if len(messages) >= 3:
+            assistant_msg = messages[2]['content']
+            if '<think>' in assistant_msg and '</think>' in assistant_msg:
+                has_think_tag += 1
+            assistant_chars += len(assistant_msg)
+            if len(assistant_msg) > 300:  # Reasonable threshold for complete answer
+                valid += 1
+    
+    return {
+        "conversations": total,
+        "quality": {
+            "valid": valid,
+            "has_think_tag": has_think_tag,
+            "assistant_chars": assistant_chars
+        },
+        "overall": overall.summary(),
+        "sources": {source: stats.summary() for source, stats in sorted(sources.items())}
+    }
+
+def load_cached_stats(filepath: str) -> Optional[Dict[str, Any]]:
+    """Return the sidecar statistics of filepath if they match its current content"""
+    
+    sidecar = stats_path(filepath)
+    if not os.path.exists(sidecar):
+        return None
+    
+    with open(sidecar, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    
+    if report.get("version") != STATS_VERSION:
+        return None
+    if not sidecar_is_current(sidecar, report, filepath):
+        return None
+    return report["stats"]
+
+def file_stats(filepath: str, conversations: Iterable[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Statistics of a ShareGPT file, from its sidecar or computed and saved in one pass
+    
+    conversations may supply the file's already loaded or streaming contents so
+    the file is not parsed a second time; it is left untouched when the sidecar
+    is current.
+    """
+    
+    stats = load_cached_stats(filepath)
+    if stats is not None:
+        print(f"  Using cached statistics from {os.path.basename(stats_path(filepath))}")
+        return stats
+    
+    if conversations is None:
+        conversations = iter_sharegpt_file(filepath)
+    stats = compute_stats(conversations)
+    
+    write_json_atomic(stats_path(filepath), {
+        "version": STATS_VERSION,
+        "file": os.path.basename(filepath),
+        "file_hash": file_hash(filepath),
+        **file_signature(filepath),
+        "created": datetime.now().isoformat(),
+        "stats": stats
+    })
+    return stats
+
+def print_stats(name: str, stats: Dict[str, Any]):
+    """Print a compact per-source summary of a statistics report"""
+    
+    print(f"\n{name}: {stats['conversations']:,} conversations")
+    for source, group in stats["sources"].items():
+        print(f"  {source} ({group['conversations']:,}):")
+        rows = [(role, summary) for role, summary in group["roles"].items()]
+        rows += [(f"<{section}>", summary) for section, summary in group["sections"].items()]
+        for label, summary in rows:
+            if not summary["count"]:
+                continue
+            p = summary["percentiles"]
+            print(f"    {label:<12} mean {summary['mean']:>8.0f}  p50 {p['p50']:>7}  p90 {p['p90']:>7}  "
+                  f"p99 {p['p99']:>7}  max {summary['max']:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Length statistics for ShareGPT files")
+    parser.add_argument("files", nargs="+", help="ShareGPT .json, .jsonl or .parquet files or shard directories")
+    args = parser.parse_args()
+    
+    for filepath in args.files:
+        print_stats(os.path.basename(filepath), file_stats(filepath))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Exact Deduplication
+Normalized content digests of converted conversations and compact sets that
+remember which digests a conversion has already written
+"""
+
+import hashlib
+import math
+import os
+from array import array
+from typing import Dict, Any, Optional
+
+# "exact" never drops a unique record; "bloom" uses a fixed amount of memory
+# but may drop a unique record with probability error_rate
+DEDUP_MODES = ("off", "exact", "bloom")
+
+DIGEST_SIZE = 16
+
+def normalize_content(text: str) -> str:
+    """Case and whitespace differences do not make a record unique"""
+    return " ".join(text.lower().split())
+
+def content_digest(conversation: Dict[str, Any]) -> bytes:
+    """Digest of the normalized user and assistant messages of a conversation"""
+    
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for message in conversation.get('messages') or []:
+        if message.get('role') in ('user', 'assistant'):
+            digest.update(f"{message['role']}\x1f{normalize_content(message.get('content') or '')}\x1e".encode('utf-8'))
+    return digest.digest()
+
+class DigestSet:
+    """Open-addressing hash set of 64-bit digest prefixes stored in one flat array.
+    
+    Each entry takes 8 bytes (16 at the 50% maximum load), against roughly
+    100 bytes for a bytes object in a Python set.
+    """
+    
+    def __init__(self, capacity: int = 1 << 16):
+        size = 1
+        while size < 2 * capacity:
+            size *= 2
+        self._table = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self.count = 0
+    
+    def add(self, digest: bytes) -> bool:
+        """Insert a digest, returning False if it was already present"""
+        
+        # 0 marks an empty slot
+        value = int.from_bytes(digest[:8], 'little') or 1
+        index = value & self._mask
+        while True:
+            current = self._table[index]
+            if current == value:
+                return False
+            if not current:
+                break
+            index = (index + 1) & self._mask
+        
+        self._table[index] = value
+        self.count += 1
+        if 2 * self.count > len(self._table):
+            self._grow()
+        return True
+    
+    def _grow(self):
+        old = self._table
+        self._table = array('Q', bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        for value in old:
+            if value:
+                index = value & self._mask
+                while self._table[index]:
+                    index = (index + 1) & self._mask
+                self._table[index] = value
+    
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._table) * self._table.itemsize
+
+class BloomFilter:
+    """Bit array sized for capacity digests at the given false-positive rate"""
+    
+    def __init__(self, capacity: int, error_rate: float = 1e-6):
+        self.bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(round(self.bits / capacity * math.log(2)), 1)
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+    
+    def add(self, digest: bytes) -> bool:
+        """Insert a digest, returning False if it was (probably) already present"""
+        
+        # Double hashing over the two halves of the digest
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        present = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self._array[byte] & mask:
+                present = False
+                self._array[byte] |= mask
+        
+        if not present:
+            self.count += 1
+        return not present
+    
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._array)
+
+class DuplicateFilter:
+    """Drop records whose content digest was already written by this conversion.
+    
+    With log_file, the digests of kept records are appended to it so a
+    resumed conversion can rebuild the set: checkpoint() makes the log
+    durable and returns its length, and passing that back as resume_offset
+    drops digests logged after the checkpoint and replays the rest.
+    """
+    
+    def __init__(self, mode: str = "exact", capacity: int = 1 << 16, error_rate: float = 1e-6,
+                 log_file: str = None, resume_offset: int = None):
+        if mode == "exact":
+            self._set = DigestSet(capacity)
+        elif mode == "bloom":
+            self._set = BloomFilter(capacity, error_rate)
+        else:
+            raise ValueError(f"Unknown dedup mode: {mode}")
+        
+        self.mode = mode
+        self.duplicates = 0
+        self.log_file = log_file
+        self._log = None
+        
+        if log_file is None:
+            return
+        
+        if resume_offset is None:
+            self._log = open(log_file, 'wb')
+            return
+        
+        self._log = open(log_file, 'r+b')
+        self._log.truncate(resume_offset)
+        while True:
+            digest = self._log.read(DIGEST_SIZE)
+            if len(digest) < DIGEST_SIZE:
+                break
+            self._set.add(digest)
+        self._log.seek(resume_offset)
+    
+    def is_duplicate(self, digest: bytes) -> bool:
+        """Record digest and return True if it has been kept before"""
+        
+        if self._set.add(digest):
+            if self._log is not None:
+                self._log.write(digest)
+            return False
+        
+        self.duplicates += 1
+        return True
+    
+    def checkpoint(self) -> Optional[int]:
+        """Make the digest log durable and return its length"""
+        if self._log is None:
+            return None
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        return self._log.tell()
+    
+    @property
+    def memory_bytes(self) -> int:
+        return self._set.memory_bytes
+    
+    def close(self, remove_log: bool = True):
+        """Close the digest log, deleting it once it is no longer needed for a resume"""
+        if self._log is None:
+            return
+        self._log.close()
+        self._log = None
+        if remove_log and os.path.exists(self.log_file):
+            os.remove(self.log_file)
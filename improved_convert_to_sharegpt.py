@@ -5,155 +5,161 @@ This version includes FULL content in answers, not just placeholders
 Output goes to 'processed_rich_fixed/' directory
 """
 
+import argparse
+import ast
+import hashlib
+import inspect
 import json
 import os
-import random
-from typing import Dict, Any, List
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from datetime import datetime
 
-def convert_cot_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+import answer_layouts
+import json_backend
+import record_schemas
+from answer_layouts import list_layout, section, sub_list
+from conversion_cache import ConversionCache
+from exact_dedup import DEDUP_MODES, DuplicateFilter, content_digest, normalize_content
+from json_backend import JSON_BACKENDS
+from pipeline import WriterStage, read_ahead
+from quarantine import ERROR_KINDS, Quarantine
+from record_schemas import (
+    CotRecord, DeepRecord, EpisodicRecord, ProceduralRecord, RealtimeRecord, RecordDecoder, RecordError,
+    SemanticRecord, StrategyRecord
+)
+from run_metrics import (
+    LapTimer, RunMetrics, SamplingProfiler, peak_rss_bytes, print_stages, top_functions, write_collapsed_stacks
+)
+from sampling import SAMPLE_MODES, build_sample
+from sharegpt_io import (
+    OUTPUT_FORMATS, canonical_json, encode_conversation, iter_chunk_records, iter_input_records, open_writer,
+    output_path_for_format, partial_path, path_size, plan_input_chunks, record_bytes,
+    require_format_support, write_json_atomic
+)
+
+# Mixed into every template hash so the whole dataset can be re-rolled at once
+TEMPLATE_SEED = 42
+
+# Keyed once; each record hashes with a copy of this state
+_TEMPLATE_HASH = hashlib.blake2b(digest_size=8, key=str(TEMPLATE_SEED).encode('utf-8'))
+
+def template_index(item: Dict[str, Any], count: int) -> int:
+    """Index of the question template to use for a record, from a stable hash of it
+    
+    The choice depends only on the record content and TEMPLATE_SEED, so output
+    is the same whatever order, chunking or worker count records are processed in.
+    """
+    digest = _TEMPLATE_HASH.copy()
+    digest.update(canonical_json(item).encode('utf-8'))
+    return int.from_bytes(digest.digest(), 'big') % count
+
+# Map complexity to descriptions
+COT_COMPLEXITY = {
+    'low': 'basic',
+    'medium': 'intermediate',
+    'high': 'advanced',
+    'expert': 'expert: highly complex reasoning with multiple interdependent components'
+}
+
+# Question templates are str.format patterns: only the chosen one is filled in per record,
+# and list sections are precompiled layouts rendered with one join
+COT_QUESTIONS = (
+    "I need help with {title} in {domain}. Can you walk me through the systematic approach?",
+    "Walk me through {title} - I need to understand the reasoning process.",
+    "Please explain the complete methodology for {title} in {domain} with all steps and details.",
+    "Can you provide a detailed, step-by-step guide for {title}? Include all validation steps and potential issues.",
+    "I want to master {title} in {domain}. Give me the comprehensive framework with examples."
+)
+COT_PREREQUISITES = section("Prerequisites")
+COT_INPUTS = sub_list("*Required Inputs:*")
+COT_VALIDATION = sub_list("*How to Validate:*")
+COT_ERRORS = sub_list("*Common Pitfalls to Avoid:*")
+COT_OUTCOMES = sub_list("*Expected Outcomes:*")
+COT_CONCEPTS = section("Key Concepts Explained", "• **", "**: Essential for understanding this framework")
+COT_BEST_PRACTICES = section("Best Practices")
+COT_APPLICATIONS = section("Common Applications")
+
+def convert_cot_to_sharegpt_rich(record: CotRecord, system_message: str) -> Dict[str, Any]:
     """Convert Chain-of-Thought data with COMPLETE step details in the answer"""
     
-    # Extract all available content
-    title = item.get('title', 'Chain-of-Thought Reasoning')
-    domain = item.get('domain', 'general')
-    description = item.get('description', '')
-    complexity = item.get('complexity', 'medium')
-    
-    # Map complexity to descriptions
-    complexity_map = {
-        'low': 'basic',
-        'medium': 'intermediate',
-        'high': 'advanced',
-        'expert': 'expert: highly complex reasoning with multiple interdependent components'
-    }
-    complexity_desc = complexity_map.get(complexity, complexity)
-    
-    # Create varied question templates
-    question_templates = [
-        f"I need help with {title.lower()} in {domain}. Can you walk me through the systematic approach?",
-        f"Walk me through {title.lower()} - I need to understand the reasoning process.",
-        f"Please explain the complete methodology for {title.lower()} in {domain} with all steps and details.",
-        f"Can you provide a detailed, step-by-step guide for {title.lower()}? Include all validation steps and potential issues.",
-        f"I want to master {title.lower()} in {domain}. Give me the comprehensive framework with examples."
-    ]
+    title = record.title
+    domain = record.domain
+    description = record.description
+    complexity_desc = COT_COMPLEXITY.get(record.complexity, record.complexity)
+    title_lower = title.lower()
     
-    user_question = random.choice(question_templates)
+    user_question = COT_QUESTIONS[template_index(record.raw, len(COT_QUESTIONS))].format(title=title_lower, domain=domain)
     
-    # Build detailed reasoning from actual steps
-    reasoning_parts = []
-    reasoning_parts.append(f"I need to apply {title} for this {domain} problem at {complexity_desc} level.")
+    reasoning_parts = [f"I need to apply {title} for this {domain} problem at {complexity_desc} level."]
+    answer_parts = [f"For {title_lower} in {domain}, here is the complete systematic approach:"]
     
     if description:
         reasoning_parts.append(f"This framework: {description}")
-    
-    # Extract and use actual steps from the pattern
-    steps = item.get('steps', [])
-    if steps:
-        reasoning_parts.append("Let me break this down systematically:")
-        
-        for i, step in enumerate(steps, 1):
-            step_desc = step.get('description', f'Step {i}')
-            reasoning_parts.append(f"Step {i}: {step_desc}")
-            
-            # Add input requirements if available
-            inputs = step.get('input_requirements', [])
-            if inputs:
-                reasoning_parts.append(f"  Required inputs: {', '.join(inputs)}")
-            
-            # Add validation criteria
-            validation = step.get('validation_criteria', [])
-            if validation:
-                reasoning_parts.append(f"  Validation: {', '.join(validation)}")
-            
-            # Add potential errors
-            errors = step.get('potential_errors', [])
-            if errors:
-                reasoning_parts.append(f"  Watch out for: {', '.join(errors)}")
-    
-    # Add prerequisites and key concepts if available
-    prerequisites = item.get('prerequisites', [])
-    if prerequisites:
-        reasoning_parts.append(f"Prerequisites needed: {', '.join(prerequisites)}")
-    
-    key_concepts = item.get('key_concepts', [])
-    if key_concepts:
-        reasoning_parts.append(f"Key concepts involved: {', '.join(key_concepts)}")
-    
-    reasoning_text = "\n".join(reasoning_parts)
-    
-    # Create COMPREHENSIVE answer with ALL details
-    answer_parts = []
-    answer_parts.append(f"For {title.lower()} in {domain}, here is the complete systematic approach:")
-    
-    # Add description if available
-    if description:
         answer_parts.append(f"\n**Overview**: {description}")
     
-    # Add prerequisites upfront if they exist
+    prerequisites = record.prerequisites
     if prerequisites:
-        answer_parts.append("\n**Prerequisites**:")
-        for prereq in prerequisites:
-            answer_parts.append(f"• {prereq}")
+        answer_parts.append(COT_PREREQUISITES(prerequisites))
     
-    # Add ALL steps with FULL details
+    # One pass over the steps renders both the reasoning line and the answer block
+    steps = record.steps
     if steps:
+        reasoning_parts.append("Let me break this down systematically:")
         answer_parts.append("\n**Detailed Step-by-Step Process**:")
+        
         for i, step in enumerate(steps, 1):
-            step_desc = step.get('description', f'Step {i}')
-            answer_parts.append(f"\n**Step {i}: {step_desc}**")
+            step_desc = step.description if step.description is not None else f'Step {i}'
+            reasoning = f"Step {i}: {step_desc}"
+            block = f"\n**Step {i}: {step_desc}**"
             
-            # Add ALL input requirements
-            inputs = step.get('input_requirements', [])
+            inputs = step.input_requirements
             if inputs:
-                answer_parts.append("*Required Inputs:*")
-                for inp in inputs:
-                    answer_parts.append(f"  - {inp}")
+                reasoning += f"\n  Required inputs: {', '.join(inputs)}"
+                block += COT_INPUTS(inputs)
             
-            # Add ALL validation criteria
-            validation = step.get('validation_criteria', [])
+            validation = step.validation_criteria
             if validation:
-                answer_parts.append("*How to Validate:*")
-                for val in validation:
-                    answer_parts.append(f"  - {val}")
+                reasoning += f"\n  Validation: {', '.join(validation)}"
+                block += COT_VALIDATION(validation)
             
-            # Add ALL potential errors
-            errors = step.get('potential_errors', [])
+            errors = step.potential_errors
             if errors:
-                answer_parts.append("*Common Pitfalls to Avoid:*")
-                for err in errors:
-                    answer_parts.append(f"  - {err}")
+                reasoning += f"\n  Watch out for: {', '.join(errors)}"
+                block += COT_ERRORS(errors)
             
-            # Add expected outcomes if available
-            outcomes = step.get('expected_outcomes', [])
+            outcomes = step.expected_outcomes
             if outcomes:
-                answer_parts.append("*Expected Outcomes:*")
-                for outcome in outcomes:
-                    answer_parts.append(f"  - {outcome}")
+                block += COT_OUTCOMES(outcomes)
+            
+            reasoning_parts.append(reasoning)
+            answer_parts.append(block)
     
-    # Add key concepts with explanations
+    if prerequisites:
+        reasoning_parts.append(f"Prerequisites needed: {', '.join(prerequisites)}")
+    
+    key_concepts = record.key_concepts
     if key_concepts:
-        answer_parts.append("\n**Key Concepts Explained**:")
-        for concept in key_concepts:
-            answer_parts.append(f"• **{concept}**: Essential for understanding this framework")
+        reasoning_parts.append(f"Key concepts involved: {', '.join(key_concepts)}")
+        answer_parts.append(COT_CONCEPTS(key_concepts))
     
-    # Add best practices if available
-    best_practices = item.get('best_practices', [])
+    best_practices = record.best_practices
     if best_practices:
-        answer_parts.append("\n**Best Practices**:")
-        for practice in best_practices:
-            answer_parts.append(f"• {practice}")
+        answer_parts.append(COT_BEST_PRACTICES(best_practices))
     
-    # Add common applications
-    applications = item.get('common_applications', [])
+    applications = record.common_applications
     if applications:
-        answer_parts.append("\n**Common Applications**:")
-        for app in applications:
-            answer_parts.append(f"• {app}")
+        answer_parts.append(COT_APPLICATIONS(applications))
     
     # Add comprehensive conclusion
-    answer_parts.append(f"\n**Summary**: This {complexity_desc} framework for {domain} provides a complete, validated methodology for {title.lower()}. By following these detailed steps and validation criteria, you can systematically approach and solve complex problems while avoiding common pitfalls.")
+    answer_parts.append(f"\n**Summary**: This {complexity_desc} framework for {domain} provides a complete, validated methodology for {title_lower}. By following these detailed steps and validation criteria, you can systematically approach and solve complex problems while avoiding common pitfalls.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -164,109 +170,83 @@ def convert_cot_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> D
         ]
     }
 
-def convert_semantic_memory_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+SEMANTIC_QUESTIONS = (
+    "Can you explain {concept} and its relationships in {domain}?",
+    "How does {concept} connect to other concepts in {domain}?",
+    "What are the key attributes and relationships of {concept}?",
+    "Help me understand the concept network around {concept} in {domain}.",
+    "Analyze {concept} - what should I know about its role in {domain}?"
+)
+SEMANTIC_RELATED = section("Related Concepts")
+
+def convert_semantic_memory_to_sharegpt_rich(record: SemanticRecord, system_message: str) -> Dict[str, Any]:
     """Convert semantic memory using actual concept networks"""
     
-    # Extract rich semantic content
-    memory_content = item.get('memory_content', {})
-    concepts = memory_content.get('concepts', [])
-    relationships = memory_content.get('relationships', [])
-    title = item.get('title', 'Concept Analysis')
-    domain = item.get('domain', 'knowledge')
-    description = item.get('description', '')
-    
-    if not concepts:
-        # Fallback for different data structures
-        concept_data = item.get('concept', {})
-        concept_name = concept_data.get('name', 'concept')
-        domain = concept_data.get('domain', 'general')
-    else:
-        # Use first main concept
-        main_concept = concepts[0]
-        concept_name = main_concept.get('name', main_concept.get('id', 'concept'))
-    
-    # Create specific questions based on actual content
-    question_templates = [
-        f"Can you explain {concept_name} and its relationships in {domain}?",
-        f"How does {concept_name} connect to other concepts in {domain}?",
-        f"What are the key attributes and relationships of {concept_name}?",
-        f"Help me understand the concept network around {concept_name} in {domain}.",
-        f"Analyze {concept_name} - what should I know about its role in {domain}?"
-    ]
+    # The decoder has named the concept from the first concept of the network or the concept object
+    concepts = record.concepts
+    relationships = record.relationships
+    concept_name = record.concept_name
+    domain = record.domain
+    description = record.description
     
-    user_question = random.choice(question_templates)
+    question_template = SEMANTIC_QUESTIONS[template_index(record.raw, len(SEMANTIC_QUESTIONS))]
+    user_question = question_template.format(concept=concept_name, domain=domain)
     
     # Build reasoning from actual semantic structure
-    reasoning_parts = []
-    reasoning_parts.append(f"I need to retrieve information about {concept_name} from my semantic memory in the {domain} domain.")
+    reasoning_parts = [f"I need to retrieve information about {concept_name} from my semantic memory in the {domain} domain."]
     
     if description:
         reasoning_parts.append(f"Context: {description}")
     
-    # Process actual concepts
     if concepts:
         reasoning_parts.append("Let me examine the key concepts in this network:")
         for concept in concepts[:5]:  # Limit to 5 main concepts
-            name = concept.get('name', concept.get('id', 'unnamed'))
-            definition = concept.get('definition', concept.get('description', ''))
-            concept_type = concept.get('type', '')
+            name = concept.label if concept.label is not None else 'unnamed'
+            definition = concept.definition
+            concept_type = concept.type
             
-            reasoning_parts.append(f"- {name}: {definition[:100]}{'...' if len(definition) > 100 else ''}")
+            line = f"- {name}: {definition[:100]}{'...' if len(definition) > 100 else ''}"
             if concept_type:
-                reasoning_parts.append(f"  Type: {concept_type}")
+                line += f"\n  Type: {concept_type}"
+            reasoning_parts.append(line)
     
-    # Process actual relationships
     if relationships:
         reasoning_parts.append("\nImportant relationships I should consider:")
         for rel in relationships[:4]:  # Limit to 4 key relationships
-            source = rel.get('source', '')
-            target = rel.get('target', '') 
-            rel_type = rel.get('type', rel.get('relation', 'related to'))
-            
-            reasoning_parts.append(f"- {source} {rel_type} {target}")
-            
-            # Add confidence if available
-            confidence = rel.get('confidence', 0)
-            if confidence:
-                reasoning_parts.append(f"  (confidence: {confidence}%)")
+            relation = rel.relation if rel.relation is not None else 'related to'
+            line = f"- {rel.source} {relation} {rel.target}"
+            if rel.confidence:
+                line += f"\n  (confidence: {rel.confidence}%)"
+            reasoning_parts.append(line)
     
-    # Add attributes if available
-    attributes = memory_content.get('attributes', [])
+    attributes = record.attributes
     if attributes:
         reasoning_parts.append("\nKey attributes to highlight:")
         for attr in attributes[:3]:
-            name = attr.get('name', attr.get('attribute_name', ''))
-            value = attr.get('value', attr.get('attribute_value', ''))
-            reasoning_parts.append(f"- {name}: {value}")
-    
-    reasoning_text = "\n".join(reasoning_parts)
+            reasoning_parts.append(f"- {attr.name}: {attr.value}")
     
     # Create detailed answer based on semantic structure
-    answer_parts = []
-    answer_parts.append(f"**{concept_name}** is a key concept in {domain}.")
+    answer_parts = [f"**{concept_name}** is a key concept in {domain}."]
     
-    if concepts and len(concepts) > 0:
-        main_concept = concepts[0]
-        definition = main_concept.get('definition', main_concept.get('description', ''))
+    if concepts:
+        definition = concepts[0].definition
         if definition:
             answer_parts.append(f"\n**Definition**: {definition}")
     
     if relationships:
         answer_parts.append("\n**Key Relationships**:")
         for rel in relationships[:3]:
-            source = rel.get('source', '')
-            target = rel.get('target', '')
-            rel_type = rel.get('type', rel.get('relation', 'relates to'))
-            answer_parts.append(f"• {source} {rel_type} {target}")
+            relation = rel.relation if rel.relation is not None else 'relates to'
+            answer_parts.append(f"• {rel.source} {relation} {rel.target}")
     
-    if concepts and len(concepts) > 1:
-        answer_parts.append("\n**Related Concepts**:")
-        for concept in concepts[1:4]:  # Show 3 related concepts
-            name = concept.get('name', concept.get('id', ''))
-            answer_parts.append(f"• {name}")
+    if len(concepts) > 1:
+        answer_parts.append(SEMANTIC_RELATED([
+            concept.label if concept.label is not None else '' for concept in concepts[1:4]  # Show 3 related concepts
+        ]))
     
     answer_parts.append(f"\nThis semantic network in {domain} shows the interconnected nature of knowledge and how {concept_name} fits into the broader conceptual framework.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -277,76 +257,56 @@ def convert_semantic_memory_to_sharegpt_rich(item: Dict[str, Any], system_messag
         ]
     }
 
-def convert_episodic_memory_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+EPISODIC_QUESTIONS = (
+    "I'm facing a situation similar to {scenario}. Can you share relevant experience?",
+    "Tell me about your experience with {scenario} and what lessons you learned.",
+    "How would you approach {scenario} based on past experience?",
+    "What insights can you share from dealing with {scenario}?",
+    "Walk me through a similar experience to {scenario} and the outcomes."
+)
+EPISODIC_LESSONS = section("Key Lessons")
+
+def convert_episodic_memory_to_sharegpt_rich(record: EpisodicRecord, system_message: str) -> Dict[str, Any]:
     """Convert episodic memory using actual episode content"""
     
-    # Extract episode details
-    scenario = item.get('scenario', {})
-    scenario_desc = scenario.get('description', item.get('scenario_description', 'a research experience'))
-    
-    context = item.get('context', {})
-    timeline = item.get('timeline', [])
-    outcome = item.get('outcome', {})
-    
-    # Create specific questions based on episode content
-    question_templates = [
-        f"I'm facing a situation similar to {scenario_desc}. Can you share relevant experience?",
-        f"Tell me about your experience with {scenario_desc} and what lessons you learned.",
-        f"How would you approach {scenario_desc} based on past experience?",
-        f"What insights can you share from dealing with {scenario_desc}?",
-        f"Walk me through a similar experience to {scenario_desc} and the outcomes."
-    ]
+    scenario_desc = record.scenario
+    timeline = record.timeline
     
-    user_question = random.choice(question_templates)
+    user_question = EPISODIC_QUESTIONS[template_index(record.raw, len(EPISODIC_QUESTIONS))].format(scenario=scenario_desc)
     
     # Build reasoning from actual episode
-    reasoning_parts = []
-    reasoning_parts.append(f"Let me recall my episodic memory related to {scenario_desc}...")
+    reasoning_parts = [f"Let me recall my episodic memory related to {scenario_desc}..."]
     
-    # Add context
-    if context:
-        setting = context.get('setting', '')
-        if setting:
-            reasoning_parts.append(f"Setting: {setting}")
+    if record.setting:
+        reasoning_parts.append(f"Setting: {record.setting}")
     
-    # Process timeline events
     if timeline:
         reasoning_parts.append("Key events from this experience:")
         for event in timeline[:5]:
-            event_desc = event.get('description', '')
-            timestamp = event.get('timestamp', '')
+            event_desc = event.description
             if event_desc:
                 reasoning_parts.append(f"- {event_desc}")
     
-    reasoning_text = "\n".join(reasoning_parts)
-    
     # Create detailed answer
-    answer_parts = []
-    answer_parts.append(f"Based on my experience with {scenario_desc}, here's what I learned:")
+    answer_parts = [f"Based on my experience with {scenario_desc}, here's what I learned:"]
     
-    # Add timeline narrative
     if timeline:
         answer_parts.append("\n**What Happened**:")
         for i, event in enumerate(timeline[:6], 1):
-            event_desc = event.get('description', '')
+            event_desc = event.description
             if event_desc:
                 answer_parts.append(f"{i}. {event_desc}")
     
-    # Add outcomes
-    if outcome:
-        success = outcome.get('success', True)
-        lessons = outcome.get('lessons_learned', [])
-        
-        answer_parts.append("\n**Outcome**:")
-        answer_parts.append(f"The approach was {'successful' if success else 'challenging'}.")
+    if record.has_outcome:
+        lessons = record.lessons_learned
         
+        answer_parts.append("\n**Outcome**:\nThe approach was " + ("successful." if record.success else "challenging."))
         if lessons:
-            answer_parts.append("\n**Key Lessons**:")
-            for lesson in lessons[:3]:
-                answer_parts.append(f"• {lesson}")
+            answer_parts.append(EPISODIC_LESSONS(lessons[:3]))
     
     answer_parts.append(f"\nThis experience with {scenario_desc} provides valuable insights for similar situations.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -357,102 +317,78 @@ def convert_episodic_memory_to_sharegpt_rich(item: Dict[str, Any], system_messag
         ]
     }
 
-def convert_procedural_memory_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+PROCEDURAL_QUESTIONS = (
+    "How do I {procedure} step by step?",
+    "Can you walk me through the complete process of {procedure}?",
+    "I need detailed instructions for {procedure} in {domain}.",
+    "What's the proper methodology for {procedure}? Include all details.",
+    "Explain the complete procedure for {procedure} with best practices."
+)
+PROCEDURAL_PREREQUISITES = section("Prerequisites")
+PROCEDURAL_DETAILS = sub_list("*Additional Details:*")
+PROCEDURAL_BEST_PRACTICES = section("Best Practices")
+PROCEDURAL_PITFALLS = section("Common Pitfalls to Avoid")
+
+def convert_procedural_memory_to_sharegpt_rich(record: ProceduralRecord, system_message: str) -> Dict[str, Any]:
     """Convert procedural memory with COMPLETE methodology details"""
     
-    # Extract procedural content
-    memory_content = item.get('memory_content', {})
-    steps = memory_content.get('steps', [])
-    title = item.get('title', 'Procedural Knowledge')
-    domain = item.get('domain', 'general')
-    description = item.get('description', '')
-    
-    procedure_name = title.lower().replace('implementing', '').replace('performing', '').strip()
-    
-    # Create specific questions
-    question_templates = [
-        f"How do I {procedure_name} step by step?",
-        f"Can you walk me through the complete process of {procedure_name}?",
-        f"I need detailed instructions for {procedure_name} in {domain}.",
-        f"What's the proper methodology for {procedure_name}? Include all details.",
-        f"Explain the complete procedure for {procedure_name} with best practices."
-    ]
+    steps = record.steps
+    domain = record.domain
+    description = record.description
     
-    user_question = random.choice(question_templates)
+    procedure_name = record.title.lower().replace('implementing', '').replace('performing', '').strip()
     
-    # Build reasoning
-    reasoning_parts = []
-    reasoning_parts.append(f"Let me retrieve the procedural knowledge for {procedure_name} in {domain}...")
+    question_template = PROCEDURAL_QUESTIONS[template_index(record.raw, len(PROCEDURAL_QUESTIONS))]
+    user_question = question_template.format(procedure=procedure_name, domain=domain)
+    
+    reasoning_parts = [f"Let me retrieve the procedural knowledge for {procedure_name} in {domain}..."]
+    answer_parts = [f"Here's the complete procedure for {procedure_name}:"]
     
     if description:
         reasoning_parts.append(f"Overview: {description}")
+        answer_parts.append(f"\n**Overview**: {description}")
     
-    # Add step preview
     if steps:
         reasoning_parts.append(f"This involves {len(steps)} key steps that must be performed in sequence.")
     
-    reasoning_text = "\n".join(reasoning_parts)
-    
-    # Create COMPLETE answer with all procedural details
-    answer_parts = []
-    answer_parts.append(f"Here's the complete procedure for {procedure_name}:")
-    
-    if description:
-        answer_parts.append(f"\n**Overview**: {description}")
-    
-    # Add conditions/prerequisites
-    conditions = memory_content.get('conditions', [])
+    conditions = record.conditions
     if conditions:
-        answer_parts.append("\n**Prerequisites**:")
-        for condition in conditions:
-            answer_parts.append(f"• {condition}")
+        answer_parts.append(PROCEDURAL_PREREQUISITES(conditions))
     
-    # Add ALL steps with complete details
     if steps:
         answer_parts.append("\n**Detailed Step-by-Step Process**:")
         for i, step in enumerate(steps, 1):
-            step_desc = step.get('description', step.get('action', f'Step {i}'))
-            answer_parts.append(f"\n**Step {i}: {step_desc}**")
+            step_desc = step.description if step.description is not None else f'Step {i}'
+            block = f"\n**Step {i}: {step_desc}**"
             
-            # Add step ID if available
-            step_id = step.get('step_id', '')
-            if step_id:
-                answer_parts.append(f"*Step ID: {step_id}*")
+            if step.step_id:
+                block += f"\n*Step ID: {step.step_id}*"
             
-            # Add expected duration
-            duration = step.get('expected_duration', '')
-            if duration:
-                answer_parts.append(f"*Expected Duration: {duration}*")
+            if step.expected_duration:
+                block += f"\n*Expected Duration: {step.expected_duration}*"
             
-            # Add specific actions
-            action = step.get('action', '')
+            action = step.action
             if action and action != step_desc:
-                answer_parts.append(f"*Action: {action}*")
+                block += f"\n*Action: {action}*"
             
-            # Add any additional details
-            details = step.get('details', [])
+            details = step.details
             if details:
-                answer_parts.append("*Additional Details:*")
-                for detail in details:
-                    answer_parts.append(f"  - {detail}")
+                block += PROCEDURAL_DETAILS(details)
+            
+            answer_parts.append(block)
     
-    # Add best practices
-    best_practices = memory_content.get('best_practices', [])
+    best_practices = record.best_practices
     if best_practices:
-        answer_parts.append("\n**Best Practices**:")
-        for practice in best_practices:
-            answer_parts.append(f"• {practice}")
+        answer_parts.append(PROCEDURAL_BEST_PRACTICES(best_practices))
     
-    # Add common pitfalls
-    pitfalls = memory_content.get('common_pitfalls', [])
+    pitfalls = record.common_pitfalls
     if pitfalls:
-        answer_parts.append("\n**Common Pitfalls to Avoid**:")
-        for pitfall in pitfalls:
-            answer_parts.append(f"• {pitfall}")
+        answer_parts.append(PROCEDURAL_PITFALLS(pitfalls))
     
     # Add comprehensive conclusion
     answer_parts.append(f"\n**Summary**: This complete procedural guide for {procedure_name} ensures systematic and effective execution. Follow each step carefully, paying attention to the prerequisites and best practices for optimal results.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -463,68 +399,54 @@ def convert_procedural_memory_to_sharegpt_rich(item: Dict[str, Any], system_mess
         ]
     }
 
-def convert_realtime_reflection_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+REALTIME_QUESTIONS = (
+    "I'm in the middle of {scenario} and need quick reflection on my approach. Help me adjust in real-time.",
+    "Can you give me immediate feedback on my current strategy for {scenario}?",
+    "I need rapid course correction for {scenario}. What should I adjust right now?",
+    "Quick reflection needed: How should I modify my approach to {scenario}?",
+    "Real-time guidance please - I'm working on {scenario} and need immediate insights."
+)
+REALTIME_OBSERVATIONS = list_layout("Key observations:", "- ")
+REALTIME_ADJUSTMENTS = section("Immediate Adjustments Needed")
+REALTIME_QUICK_WINS = section("Quick Wins Available")
+REALTIME_WARNINGS = section("Watch Out For")
+
+def convert_realtime_reflection_to_sharegpt_rich(record: RealtimeRecord, system_message: str) -> Dict[str, Any]:
     """Convert real-time reflection using actual reflection content"""
     
-    scenario_desc = item.get('scenario_description', 'complex problem-solving')
-    current_situation = item.get('current_situation', {})
+    scenario_desc = record.scenario
     
-    # Create specific questions based on reflection content
-    question_templates = [
-        f"I'm in the middle of {scenario_desc} and need quick reflection on my approach. Help me adjust in real-time.",
-        f"Can you give me immediate feedback on my current strategy for {scenario_desc}?",
-        f"I need rapid course correction for {scenario_desc}. What should I adjust right now?",
-        f"Quick reflection needed: How should I modify my approach to {scenario_desc}?",
-        f"Real-time guidance please - I'm working on {scenario_desc} and need immediate insights."
-    ]
-    
-    user_question = random.choice(question_templates)
+    user_question = REALTIME_QUESTIONS[template_index(record.raw, len(REALTIME_QUESTIONS))].format(scenario=scenario_desc)
     
     # Build quick reflection reasoning (real-time constraint)
-    reasoning_parts = []
-    reasoning_parts.append(f"Quick real-time reflection on {scenario_desc}...")
+    reasoning_parts = [f"Quick real-time reflection on {scenario_desc}..."]
     
-    # Add current state analysis
-    current_state = current_situation.get('current_state', '')
+    current_state = record.current_state
     if current_state:
         reasoning_parts.append(f"Current state: {current_state}")
     
-    # Add immediate observations
-    observations = item.get('immediate_observations', [])
+    observations = record.immediate_observations
     if observations:
-        reasoning_parts.append("Key observations:")
-        for obs in observations[:3]:
-            reasoning_parts.append(f"- {obs}")
-    
-    reasoning_text = "\n".join(reasoning_parts)
+        reasoning_parts.append(REALTIME_OBSERVATIONS(observations[:3]))
     
     # Create rapid reflection answer
-    answer_parts = []
-    answer_parts.append(f"**Quick reflection on {scenario_desc}:**")
+    answer_parts = [f"**Quick reflection on {scenario_desc}:**"]
     
-    # Add immediate adjustments
-    adjustments = item.get('immediate_adjustments', [])
+    adjustments = record.immediate_adjustments
     if adjustments:
-        answer_parts.append("\n**Immediate Adjustments Needed**:")
-        for adj in adjustments[:3]:
-            answer_parts.append(f"• {adj}")
+        answer_parts.append(REALTIME_ADJUSTMENTS(adjustments[:3]))
     
-    # Add quick wins
-    quick_wins = item.get('quick_wins', [])
+    quick_wins = record.quick_wins
     if quick_wins:
-        answer_parts.append("\n**Quick Wins Available**:")
-        for win in quick_wins[:2]:
-            answer_parts.append(f"• {win}")
+        answer_parts.append(REALTIME_QUICK_WINS(quick_wins[:2]))
     
-    # Add warning signs
-    warning_signs = item.get('warning_signs', [])
+    warning_signs = record.warning_signs
     if warning_signs:
-        answer_parts.append("\n**Watch Out For**:")
-        for sign in warning_signs[:2]:
-            answer_parts.append(f"• {sign}")
+        answer_parts.append(REALTIME_WARNINGS(warning_signs[:2]))
     
     answer_parts.append("\nMake these adjustments now for better outcomes.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -535,69 +457,43 @@ def convert_realtime_reflection_to_sharegpt_rich(item: Dict[str, Any], system_me
         ]
     }
 
-def convert_strategy_reflection_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+STRATEGY_QUESTIONS = (
+    "I need strategic reflection on {scenario}. What patterns and approaches should I consider?",
+    "Can you analyze the strategic landscape for {scenario}?",
+    "Help me develop a strategic approach to {scenario} based on reflection and analysis.",
+    "What strategic insights can you share about {scenario}?",
+    "I'm planning my strategy for {scenario}. What should I consider?"
+)
+STRATEGY_SECTIONS = (
+    ('strategic_patterns', section("Key Strategic Patterns")),
+    ('opportunities', section("Strategic Opportunities")),
+    ('risks', section("Strategic Risks")),
+    ('strategic_recommendations', section("Strategic Recommendations"))
+)
+
+def convert_strategy_reflection_to_sharegpt_rich(record: StrategyRecord, system_message: str) -> Dict[str, Any]:
     """Convert strategy reflection using actual strategic analysis"""
     
-    scenario_desc = item.get('scenario_description', 'strategic planning')
+    scenario_desc = record.scenario
     
-    # Create strategic questions
-    question_templates = [
-        f"I need strategic reflection on {scenario_desc}. What patterns and approaches should I consider?",
-        f"Can you analyze the strategic landscape for {scenario_desc}?",
-        f"Help me develop a strategic approach to {scenario_desc} based on reflection and analysis.",
-        f"What strategic insights can you share about {scenario_desc}?",
-        f"I'm planning my strategy for {scenario_desc}. What should I consider?"
-    ]
-    
-    user_question = random.choice(question_templates)
+    user_question = STRATEGY_QUESTIONS[template_index(record.raw, len(STRATEGY_QUESTIONS))].format(scenario=scenario_desc)
     
     # Build strategic reasoning
-    reasoning_parts = []
-    reasoning_parts.append(f"Strategic reflection on {scenario_desc}...")
+    reasoning_parts = [f"Strategic reflection on {scenario_desc}..."]
     
-    # Add strategic context
-    context = item.get('strategic_context', {})
-    if context:
-        timeframe = context.get('timeframe', '')
-        if timeframe:
-            reasoning_parts.append(f"Timeframe: {timeframe}")
+    if record.timeframe:
+        reasoning_parts.append(f"Timeframe: {record.timeframe}")
     
-    reasoning_text = "\n".join(reasoning_parts)
-    
-    # Create strategic answer
-    answer_parts = []
-    answer_parts.append(f"**Strategic reflection on {scenario_desc}:**")
-    
-    # Add strategic patterns
-    patterns = item.get('strategic_patterns', [])
-    if patterns:
-        answer_parts.append("\n**Key Strategic Patterns**:")
-        for pattern in patterns[:3]:
-            answer_parts.append(f"• {pattern}")
-    
-    # Add opportunities
-    opportunities = item.get('opportunities', [])
-    if opportunities:
-        answer_parts.append("\n**Strategic Opportunities**:")
-        for opp in opportunities[:3]:
-            answer_parts.append(f"• {opp}")
-    
-    # Add risks
-    risks = item.get('risks', [])
-    if risks:
-        answer_parts.append("\n**Strategic Risks**:")
-        for risk in risks[:3]:
-            answer_parts.append(f"• {risk}")
-    
-    # Add recommendations
-    recommendations = item.get('strategic_recommendations', [])
-    if recommendations:
-        answer_parts.append("\n**Strategic Recommendations**:")
-        for rec in recommendations[:3]:
-            answer_parts.append(f"• {rec}")
+    # Patterns, opportunities, risks and recommendations, three of each
+    answer_parts = [f"**Strategic reflection on {scenario_desc}:**"]
+    for field, layout in STRATEGY_SECTIONS:
+        values = getattr(record, field)
+        if values:
+            answer_parts.append(layout(values[:3]))
     
     answer_parts.append(f"\nThis strategic analysis of {scenario_desc} provides a foundation for informed decision-making.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -608,76 +504,44 @@ def convert_strategy_reflection_to_sharegpt_rich(item: Dict[str, Any], system_me
         ]
     }
 
-def convert_deep_reflection_to_sharegpt_rich(item: Dict[str, Any], system_message: str) -> Dict[str, Any]:
+DEEP_QUESTIONS = (
+    "I need deep reflection on {scenario}. What are the fundamental patterns and implications?",
+    "Can you provide a comprehensive analysis of {scenario} at a fundamental level?",
+    "Help me understand the deeper implications of {scenario}.",
+    "What systemic insights emerge from deep reflection on {scenario}?",
+    "Analyze {scenario} deeply - what are the root causes and long-term effects?"
+)
+DEEP_SECTIONS = (
+    ('underlying_patterns', section("Underlying Patterns"), 3),
+    ('root_causes', section("Root Causes"), 3),
+    ('long_term_implications', section("Long-term Implications"), 3),
+    ('learning_insights', section("Key Learning"), 2),
+    ('system_level_recommendations', section("System-Level Changes"), 3)
+)
+
+def convert_deep_reflection_to_sharegpt_rich(record: DeepRecord, system_message: str) -> Dict[str, Any]:
     """Convert deep reflection using comprehensive analysis"""
     
-    scenario_desc = item.get('scenario_description', 'complex situation')
-    
-    # Create deep reflection questions
-    question_templates = [
-        f"I need deep reflection on {scenario_desc}. What are the fundamental patterns and implications?",
-        f"Can you provide a comprehensive analysis of {scenario_desc} at a fundamental level?",
-        f"Help me understand the deeper implications of {scenario_desc}.",
-        f"What systemic insights emerge from deep reflection on {scenario_desc}?",
-        f"Analyze {scenario_desc} deeply - what are the root causes and long-term effects?"
-    ]
+    scenario_desc = record.scenario
     
-    user_question = random.choice(question_templates)
+    user_question = DEEP_QUESTIONS[template_index(record.raw, len(DEEP_QUESTIONS))].format(scenario=scenario_desc)
     
     # Build deep reflection reasoning
-    reasoning_parts = []
-    reasoning_parts.append(f"Deep reflection and analysis of {scenario_desc}...")
+    reasoning_parts = [f"Deep reflection and analysis of {scenario_desc}..."]
     
-    # Add fundamental analysis
-    fundamentals = item.get('fundamental_analysis', {})
-    if fundamentals:
-        core_issue = fundamentals.get('core_issue', '')
-        if core_issue:
-            reasoning_parts.append(f"Core issue: {core_issue}")
+    if record.core_issue:
+        reasoning_parts.append(f"Core issue: {record.core_issue}")
     
-    reasoning_text = "\n".join(reasoning_parts)
-    
-    # Create comprehensive deep reflection answer
-    answer_parts = []
-    answer_parts.append(f"**Deep reflection analysis of {scenario_desc}:**")
-    
-    # Add fundamental insights
-    patterns = item.get('underlying_patterns', [])
-    if patterns:
-        answer_parts.append("\n**Underlying Patterns**:")
-        for pattern in patterns[:3]:
-            answer_parts.append(f"• {pattern}")
-    
-    # Add root causes
-    root_causes = item.get('root_causes', [])
-    if root_causes:
-        answer_parts.append("\n**Root Causes**:")
-        for cause in root_causes[:3]:
-            answer_parts.append(f"• {cause}")
-    
-    # Add implications
-    implications = item.get('long_term_implications', [])
-    if implications:
-        answer_parts.append("\n**Long-term Implications**:")
-        for implication in implications[:3]:
-            answer_parts.append(f"• {implication}")
-    
-    # Add learning insights
-    learning_insights = item.get('learning_insights', [])
-    if learning_insights:
-        answer_parts.append("\n**Key Learning**:")
-        for insight in learning_insights[:2]:
-            answer_parts.append(f"• {insight}")
-    
-    # Add system recommendations
-    system_recommendations = item.get('system_level_recommendations', [])
-    if system_recommendations:
-        answer_parts.append("\n**System-Level Changes**:")
-        for rec in system_recommendations[:3]:
-            answer_parts.append(f"• {rec}")
+    # Patterns, root causes, implications, learning and system-level changes
+    answer_parts = [f"**Deep reflection analysis of {scenario_desc}:**"]
+    for field, layout, limit in DEEP_SECTIONS:
+        values = getattr(record, field)
+        if values:
+            answer_parts.append(layout(values[:limit]))
     
     answer_parts.append(f"\nThis deep reflection reveals the fundamental dynamics underlying {scenario_desc} and provides a foundation for systemic improvements.")
     
+    reasoning_text = "\n".join(reasoning_parts)
     answer = "\n".join(answer_parts)
     
     return {
@@ -688,114 +552,737 @@ def convert_deep_reflection_to_sharegpt_rich(item: Dict[str, Any], system_messag
         ]
     }
 
-def process_file(input_file: str, data_type: str, output_file: str, max_examples: int = None) -> int:
-    """Process a consolidated data file and convert to ShareGPT format using rich content"""
+# Define system message
+SYSTEM_MESSAGE = "You are Phi, an AI assistant trained to provide detailed reasoning before answering questions. You excel at chain-of-thought reasoning, memory integration, and reflective analysis."
+
+# Define conversion functions
+CONVERSION_FUNCTIONS = {
+    "cot": convert_cot_to_sharegpt_rich,
+    "semantic_memory": convert_semantic_memory_to_sharegpt_rich,
+    "episodic_memory": convert_episodic_memory_to_sharegpt_rich,
+    "procedural_memory": convert_procedural_memory_to_sharegpt_rich,
+    "realtime_reflection": convert_realtime_reflection_to_sharegpt_rich,
+    "strategy_reflection": convert_strategy_reflection_to_sharegpt_rich,
+    "deep_reflection": convert_deep_reflection_to_sharegpt_rich
+}
+
+@lru_cache(maxsize=None)
+def template_source(function) -> str:
+    """Source of the module-level assignments function reads, such as its question templates and layouts"""
+    
+    names = set()
+    code_objects = [function.__code__]
+    while code_objects:
+        code = code_objects.pop()
+        names.update(code.co_names)
+        code_objects.extend(const for const in code.co_consts if inspect.iscode(const))
+    
+    source = inspect.getsource(sys.modules[function.__module__])
+    return "\n".join(
+        ast.get_source_segment(source, node)
+        for node in ast.parse(source).body
+        if isinstance(node, ast.Assign)
+        and any(isinstance(target, ast.Name) and target.id in names for target in node.targets)
+    )
+
+def converter_version(data_type: str, output_format: str, backend: str) -> str:
+    """Fingerprint everything that shapes a rendered conversation of this data type
+    
+    Editing the converter, its question templates and section layouts, the
+    record schemas, the template choice, the system message, the encoder or the
+    dedup digest changes the fingerprint, so stale cache entries are never
+    reused. The JSON backend is part of it because orjson writes compact JSONL
+    without spaces after separators.
+    """
+    converter = CONVERSION_FUNCTIONS[data_type]
+    parts = [
+        inspect.getsource(converter),
+        template_source(converter),
+        inspect.getsource(record_schemas),
+        inspect.getsource(answer_layouts),
+        inspect.getsource(template_index),
+        inspect.getsource(canonical_json),
+        inspect.getsource(encode_conversation),
+        inspect.getsource(content_digest),
+        inspect.getsource(normalize_content),
+        str(TEMPLATE_SEED),
+        SYSTEM_MESSAGE,
+        data_type,
+        output_format,
+        backend
+    ]
+    return hashlib.blake2b("\0".join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+def record_hash(raw: Optional[bytes], item: Any) -> str:
+    """Content hash of an input record, from its raw JSONL line when available"""
+    return hashlib.blake2b(record_bytes(raw, item), digest_size=16).hexdigest()
+
+class ConversionResult(NamedTuple):
+    """Outcome of converting one input record"""
+    record_no: int  # 0-based line (JSONL) or array index (JSON)
+    text: Optional[str]  # encoded conversation, None if the record failed
+    error: Optional[str]  # one of quarantine.ERROR_KINDS when the record failed
+    message: str
+    assistant_length: int
+    cached: bool = False
+    content_hash: Optional[bytes] = None  # normalized user/assistant digest for dedup
+    error_class: Optional[str] = None  # exception type of a failed record
+    record: Optional[bytes] = None  # input record of a failed record, for the quarantine
+
+def _iter_conversions(input_file: str, data_type: str, output_format: str, start: int = 0, end: int = None,
+                      cache: ConversionCache = None, metrics: RunMetrics = None,
+                      data: bytes = None) -> Iterator[ConversionResult]:
+    """Convert and encode every record of input_file (or of one byte range of it)
+    
+    data is the byte range already read into memory, when a reader stage has read it.
+    
+    Records are decoded into the typed records of record_schemas before they are
+    converted; a record that does not fit its schema fails as "invalid", with the
+    path of the offending value as the message.
+    
+    With metrics, the time spent reading and parsing records, looking them up in
+    the cache, decoding, converting and serializing them (JSON encoding and
+    content digest) is added to its "parse", "cache", "decode", "convert" and
+    "serialize" stages
+    when the generator finishes or is closed; time spent by the consumer between
+    records is left out.
+    """
+    
+    converter = CONVERSION_FUNCTIONS[data_type]
+    decoder = RecordDecoder(data_type)
+    version = converter_version(data_type, output_format, json_backend.backend_name()) if cache is not None else None
+    
+    timer = LapTimer()
+    parsed = decoded = converted = serialized = 0
+    if input_file.endswith('.json'):
+        # Array ranges are read whole; an unranged array counts as the rest of the file
+        bytes_read = (end if end is not None else os.path.getsize(input_file)) - start
+    else:
+        bytes_read = 0
     
-    print(f"Processing {data_type} data from {os.path.basename(input_file)}...")
+    if data is not None:
+        records = iter_chunk_records(data, input_file.endswith('.json'))
+    else:
+        records = iter_input_records(input_file, start, end)
+    
+    try:
+        for record_no, (raw, item) in enumerate(records):
+            if raw is not None:
+                bytes_read += len(raw)
+            timer.lap("parse")
+            
+            if cache is not None:
+                key = record_hash(raw, item)
+                cached = cache.get(key, version)
+                timer.lap("cache")
+                if cached is not None:
+                    yield ConversionResult(record_no, cached[0], None, "", cached[1], True, cached[2])
+                    timer.restart()
+                    continue
+            
+            if item is None:
+                try:
+                    item = json_backend.loads(raw)
+                except ValueError as e:  # JSONDecodeError, or UnicodeDecodeError for invalid UTF-8
+                    timer.lap("parse")
+                    yield ConversionResult(record_no, None, "malformed", str(e), 0,
+                                           error_class=type(e).__name__, record=record_bytes(raw, None))
+                    timer.restart()
+                    continue
+                timer.lap("parse")
+            parsed += 1
+            
+            try:
+                record = decoder.decode(item)
+            except RecordError as e:
+                timer.lap("decode")
+                yield ConversionResult(record_no, None, "invalid", str(e), 0,
+                                       error_class=type(e).__name__, record=record_bytes(raw, item))
+                timer.restart()
+                continue
+            decoded += 1
+            timer.lap("decode")
+            
+            try:
+                conversation = converter(record, SYSTEM_MESSAGE)
+                conversation['data_source'] = data_type
+                converted += 1
+                timer.lap("convert")
+                text = encode_conversation(conversation, output_format)
+            except Exception as e:
+                timer.lap("convert")
+                yield ConversionResult(record_no, None, "convert", str(e), 0,
+                                       error_class=type(e).__name__, record=record_bytes(raw, item))
+                timer.restart()
+                continue
+            
+            assistant_length = len(conversation['messages'][2]['content'])
+            digest = content_digest(conversation)
+            serialized += 1
+            timer.lap("serialize")
+            if cache is not None:
+                cache.put(key, version, text, assistant_length, digest)
+                timer.lap("cache")
+            
+            yield ConversionResult(record_no, text, None, "", assistant_length, False, digest)
+            timer.restart()
+    finally:
+        if cache is not None:
+            cache.commit()
+        if metrics is not None:
+            timer.record(metrics, {"parse": parsed, "decode": decoded, "convert": converted, "serialize": serialized},
+                         {"parse": bytes_read})
+
+# Per-process cache handle used by pool workers
+_worker_cache = None
+
+def _get_worker_cache(cache_path: str, cache_generation: int) -> ConversionCache:
+    """Open (or reuse) this worker's connection to the run's conversion cache"""
+    global _worker_cache
+    
+    if _worker_cache is None or (_worker_cache.path, _worker_cache.generation) != (cache_path, cache_generation):
+        if _worker_cache is not None:
+            _worker_cache.close()
+        _worker_cache = ConversionCache(cache_path, cache_generation)
+    
+    return _worker_cache
+
+def _convert_chunk(input_file: str, data_type: str, output_format: str, start: int, end: int,
+                   cache_path: str = None, cache_generation: int = None, profile: bool = False,
+                   backend: str = "auto", data: bytes = None) -> Tuple[List[ConversionResult], RunMetrics]:
+    """Pool task: convert the records in one byte range of input_file, with the worker's stage metrics
+    
+    The worker reads the range itself unless its bytes are passed as data.
+    """
+    
+    # Workers that were not forked do not inherit the parent's choice
+    json_backend.set_backend(backend)
+    cache = _get_worker_cache(cache_path, cache_generation) if cache_path else None
+    metrics = RunMetrics()
+    if not profile:
+        return list(_iter_conversions(input_file, data_type, output_format, start, end, cache, metrics, data)), metrics
+    
+    with SamplingProfiler() as profiler:
+        results = list(_iter_conversions(input_file, data_type, output_format, start, end, cache, metrics, data))
+    metrics.samples.update(profiler.samples)
+    return results, metrics
+
+def _iter_serial_chunks(input_file: str, data_type: str, output_format: str, chunk_bytes: Optional[int],
+                        start: int, cache: ConversionCache = None,
+                        metrics: RunMetrics = None) -> Iterator[Tuple[Optional[int], Iterator[ConversionResult]]]:
+    """Yield (end_offset, results) for each byte-range chunk, converted in this process
     
-    conversations = []
+    Without chunk_bytes the whole file is a single chunk read by the streaming parsers.
+    """
     
-    # Define system message
-    system_message = "You are Phi, an AI assistant trained to provide detailed reasoning before answering questions. You excel at chain-of-thought reasoning, memory integration, and reflective analysis."
+    if chunk_bytes is None:
+        ranges = [(0, None)]
+    else:
+        ranges = plan_input_chunks(input_file, chunk_bytes, start)
+    
+    for chunk_start, chunk_end in ranges:
+        results = _iter_conversions(input_file, data_type, output_format, chunk_start, chunk_end, cache, metrics)
+        try:
+            yield chunk_end, results
+        finally:
+            results.close()
+
+def _iter_parallel_chunks(executor: Executor, workers: int, input_file: str, data_type: str,
+                          output_format: str, chunk_bytes: int, start: int, cache: ConversionCache = None,
+                          metrics: RunMetrics = None, profile: bool = False) -> Iterator[Tuple[int, List[ConversionResult]]]:
+    """Convert byte-range chunks in the pool and yield (end_offset, results) in file order
+    
+    At most 2 * workers chunks are in flight, and chunks are only planned as
+    they are submitted, so stopping early at max_examples leaves the rest of
+    the file unread. The workers' stage metrics (and profile samples) of every
+    chunk received are merged into metrics.
+    """
+    
+    pending = deque()
+    cache_args = (cache.path, cache.generation) if cache is not None else (None, None)
+    
+    def receive(future) -> List[ConversionResult]:
+        results, chunk_metrics = future.result()
+        if metrics is not None:
+            metrics.merge(chunk_metrics)
+        return results
+    
+    try:
+        for chunk_start, chunk_end in plan_input_chunks(input_file, chunk_bytes, start):
+            future = executor.submit(_convert_chunk, input_file, data_type, output_format, chunk_start, chunk_end,
+                                     *cache_args, profile, json_backend.backend_name())
+            pending.append((chunk_end, future))
+            if len(pending) >= 2 * workers:
+                chunk_end, future = pending.popleft()
+                yield chunk_end, receive(future)
+        
+        while pending:
+            chunk_end, future = pending.popleft()
+            yield chunk_end, receive(future)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+def _read_chunks(input_file: str, chunk_bytes: int, start: int,
+                 metrics: RunMetrics = None) -> Iterator[Tuple[int, int, bytes]]:
+    """Reader stage: (start, end, bytes) of each byte-range chunk of input_file
     
-    # Define conversion functions
-    conversion_functions = {
-        "cot": convert_cot_to_sharegpt_rich,
-        "semantic_memory": convert_semantic_memory_to_sharegpt_rich,
-        "episodic_memory": convert_episodic_memory_to_sharegpt_rich,
-        "procedural_memory": convert_procedural_memory_to_sharegpt_rich,
-        "realtime_reflection": convert_realtime_reflection_to_sharegpt_rich,
-        "strategy_reflection": convert_strategy_reflection_to_sharegpt_rich,
-        "deep_reflection": convert_deep_reflection_to_sharegpt_rich
+    Planning and reading time goes to the "read" stage of metrics, with the
+    CPU time of the reading thread alone.
+    """
+    
+    wall = cpu = 0.0
+    bytes_read = 0
+    try:
+        with open(input_file, 'rb') as f:
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            for chunk_start, chunk_end in plan_input_chunks(input_file, chunk_bytes, start):
+                f.seek(chunk_start)
+                data = f.read(chunk_end - chunk_start)
+                bytes_read += len(data)
+                wall += time.perf_counter() - wall_start
+                cpu += time.thread_time() - cpu_start
+                yield chunk_start, chunk_end, data
+                wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    finally:
+        if metrics is not None:
+            metrics.add("read", wall, cpu, bytes_read=bytes_read)
+
+def _iter_pipelined_chunks(executor: Optional[Executor], workers: int, input_file: str, data_type: str,
+                           output_format: str, chunk_bytes: int, start: int, cache: ConversionCache = None,
+                           metrics: RunMetrics = None, profile: bool = False,
+                           queue_depth: int = 4) -> Iterator[Tuple[int, List[ConversionResult]]]:
+    """Converter stage: yield (end_offset, results) in file order from chunks read by a reader thread
+    
+    A background thread plans and reads the chunks, at most queue_depth ahead;
+    they are converted here, or with workers > 1 in the pool with at most
+    2 * workers in flight. Each chunk's results are complete lists, ready to
+    be handed to a writer stage.
+    """
+    
+    chunks = read_ahead(_read_chunks(input_file, chunk_bytes, start, metrics), queue_depth, name="reader")
+    try:
+        if workers <= 1:
+            for chunk_start, chunk_end, data in chunks:
+                results = _iter_conversions(input_file, data_type, output_format, chunk_start, chunk_end, cache,
+                                            metrics, data)
+                yield chunk_end, list(results)
+            return
+        
+        pending = deque()
+        cache_args = (cache.path, cache.generation) if cache is not None else (None, None)
+        
+        def receive(future) -> List[ConversionResult]:
+            results, chunk_metrics = future.result()
+            if metrics is not None:
+                metrics.merge(chunk_metrics)
+            return results
+        
+        try:
+            for chunk_start, chunk_end, data in chunks:
+                future = executor.submit(_convert_chunk, input_file, data_type, output_format, chunk_start,
+                                         chunk_end, *cache_args, profile, json_backend.backend_name(), data)
+                pending.append((chunk_end, future))
+                if len(pending) >= 2 * workers:
+                    chunk_end, future = pending.popleft()
+                    yield chunk_end, receive(future)
+            
+            while pending:
+                chunk_end, future = pending.popleft()
+                yield chunk_end, receive(future)
+        finally:
+            for _, future in pending:
+                future.cancel()
+    finally:
+        chunks.close()
+
+def checkpoint_path(output_file: str) -> str:
+    """Manifest recording how far the conversion of output_file has got"""
+    return f"{output_file}.checkpoint.json"
+
+def profile_path(output_file: str) -> str:
+    """Sampled stacks of a profiled conversion, in the folded format of flame graph tools"""
+    return f"{output_file}.profile.folded"
+
+def quarantine_path(output_file: str) -> str:
+    """Input records that failed to convert, one JSON line each (see quarantine.Quarantine)"""
+    return f"{output_file}.quarantine.jsonl"
+
+def dedup_log_path(output_file: str) -> str:
+    """Digests of the conversations kept so far, replayed when a deduplicated conversion resumes"""
+    return f"{output_file}.dedup"
+
+def _input_fingerprint(input_file: str, data_type: str, output_format: str, max_examples: Optional[int],
+                       dedup: str = "off") -> Dict[str, Any]:
+    """Everything a checkpoint must match before a run may continue from it"""
+    stat = os.stat(input_file)
+    return {
+        "input_file": os.path.abspath(input_file),
+        "input_size": stat.st_size,
+        "input_mtime": stat.st_mtime,
+        "data_type": data_type,
+        "output_format": output_format,
+        "max_examples": max_examples,
+        "dedup": dedup,
+        "converter_version": converter_version(data_type, output_format, json_backend.backend_name())
     }
+
+def _load_checkpoint(output_file: str, fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the usable checkpoint state for output_file, or None to start over"""
+    
+    manifest_file = checkpoint_path(output_file)
+    if not os.path.exists(manifest_file):
+        return None
     
-    converter = conversion_functions.get(data_type)
-    if not converter:
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    
+    if any(state.get(key) != value for key, value in fingerprint.items()):
+        print("  Checkpoint is for a different input or converter, starting over")
+        return None
+    
+    if state["status"] == "complete":
+        return state if os.path.exists(output_file) or state["count"] == 0 else None
+    
+    if not os.path.exists(partial_path(output_file)) or path_size(partial_path(output_file)) < state["output_offset"]:
+        print("  Partial output is missing or shorter than its checkpoint, starting over")
+        return None
+    
+    quarantined = state.get("quarantine")
+    if quarantined and quarantined["offset"] and (
+            not os.path.exists(quarantine_path(output_file))
+            or path_size(quarantine_path(output_file)) < quarantined["offset"]):
+        print("  Quarantine file is missing or shorter than its checkpoint, starting over")
+        return None
+    
+    return state
+
+def process_file(input_file: str, data_type: str, output_file: str, max_examples: int = None,
+                 output_format: str = "json", workers: int = 1, executor: Executor = None,
+                 chunk_bytes: int = None, cache: ConversionCache = None,
+                 checkpoint: bool = False, resume: bool = False, sample: str = "first",
+                 sample_seed: int = 42, stratify_by: str = "domain", dedup: str = "off",
+                 dedup_capacity: int = None, duplicate_counts: Dict[str, int] = None,
+                 quarantine_summaries: Dict[str, Dict[str, Any]] = None,
+                 metrics: RunMetrics = None, profile: bool = False, pipeline: bool = False,
+                 queue_depth: int = 4) -> int:
+    """Process a consolidated data file and convert to ShareGPT format using rich content
+    
+    Conversations are streamed to output_file as they are converted, either as a
+    JSON array ("json"), as one conversation per line ("jsonl") or as a
+    directory of compressed shards ("jsonl.zst", "parquet"; see ShardWriter). With
+    workers > 1 the input is split into byte-range chunks that are converted in
+    a process pool (executor, or a pool created for this file); the output is
+    byte-identical to a serial run. With a cache, records whose content and
+    converter are unchanged since an earlier run are reused instead of reconverted.
+    
+    pipeline overlaps the stages of the conversion: a reader thread reads the
+    input chunks ahead, they are converted here (or in the pool), and a writer
+    thread deduplicates, quarantines, writes and checkpoints the results. The
+    stages are connected by queues of at most queue_depth chunks, so memory
+    stays bounded, and the output is byte-identical to a run without pipeline.
+    
+    With checkpoint, the partial output is made durable after every chunk and a
+    manifest next to output_file records the input offset, output offset and
+    counts reached. resume continues from that manifest, or returns the saved
+    count straight away if the file was already finished. An error that stops
+    the conversion is raised again with the manifest and the partial output
+    left in place, so a resumed run picks up from the last checkpoint; only a
+    manifest for a different input or converter makes it start over.
+    
+    sample chooses which max_examples records are converted: "first" keeps the
+    first ones, "uniform" and "stratified" (by the stratify_by field) draw a
+    reproducible sample in one pass with sampling.build_sample and convert that.
+    
+    dedup drops records whose normalized user and assistant content was already
+    written: "exact" keeps 8-byte digest prefixes in a flat hash table, "bloom"
+    uses a Bloom filter sized for dedup_capacity records (estimated from the
+    input size by default). Duplicates do not count towards max_examples, and
+    the number dropped is stored in duplicate_counts[data_type] if given.
+    
+    Records that cannot be parsed, decoded or converted are skipped and saved
+    with their line number and error to a quarantine file next to output_file
+    (see quarantine_path); only the first few are printed, then running counts.
+    Their summary is stored in quarantine_summaries[data_type] if given.
+    
+    Stage timings, counts and bytes ("sample", "read", "parse", "cache", "decode",
+    "convert", "serialize", "quarantine", "dedup", "write") are added to
+    metrics if given. profile runs a sampling profiler over the conversion (in
+    every worker when parallel) and saves the sampled stacks next to
+    output_file (see profile_path).
+    """
+    
+    print(f"Processing {data_type} data from {os.path.basename(input_file)}...")
+    
+    if metrics is None:
+        metrics = RunMetrics()
+    
+    if data_type not in CONVERSION_FUNCTIONS:
         print(f"Warning: No converter for {data_type}")
         return 0
     
-    # Process based on file format
-    count = 0
+    if sample != "first" and max_examples:
+        sample_file = f"{output_file}.sample.jsonl"
+        with metrics.stage("sample") as stage:
+            summary = build_sample(input_file, sample_file, max_examples, sample, sample_seed, stratify_by)
+            stage.records += summary['selected']
+        print(f"  {'Reusing' if summary['reused'] else 'Drew'} {sample} sample of {summary['selected']:,} "
+              f"from {summary['records_seen']:,} records (seed {sample_seed})")
+        if summary['malformed']:
+            print(f"  Skipped {summary['malformed']:,} malformed records while sampling")
+        
+        # Convert the whole sample; line numbers below refer to the sample file
+        input_file = sample_file
+        max_examples = None
+    
+    is_json = input_file.endswith('.json')
+    checkpoint = checkpoint or resume
+    fingerprint = _input_fingerprint(input_file, data_type, output_format, max_examples, dedup) if checkpoint else None
+    
+    state = _load_checkpoint(output_file, fingerprint) if resume else None
+    if state is not None and state["status"] == "complete":
+        print(f"  Already converted, {state['count']:,} conversations in {output_file}")
+        if dedup != "off" and duplicate_counts is not None:
+            duplicate_counts[data_type] = state["duplicates"]
+        if quarantine_summaries is not None and state.get("quarantine") is not None:
+            quarantine_summaries[data_type] = {
+                key: value for key, value in state["quarantine"].items() if key != "offset"
+            }
+        return state["count"]
+    
+    if state is not None:
+        input_offset = state["input_offset"]
+        record_offset = state["record_offset"]
+        count = state["count"]
+        reused = state["reused"]
+        sample_length = state["sample_length"]
+        duplicates = state["duplicates"]
+        dedup_offset = state["dedup_offset"]
+        writer = open_writer(output_file, output_format, resume_offset=state["output_offset"], resume_count=count)
+        print(f"  Resuming after record {record_offset:,} with {count:,} conversations already saved")
+    else:
+        input_offset = 0
+        record_offset = 0
+        count = 0
+        reused = 0
+        sample_length = None
+        duplicates = 0
+        dedup_offset = None
+        writer = open_writer(output_file, output_format)
+    
+    quarantine = Quarantine(quarantine_path(output_file), "item" if is_json else "line",
+                            resume=state.get("quarantine") if state is not None else None)
+    
+    duplicate_filter = None
+    if dedup != "off":
+        duplicate_filter = DuplicateFilter(
+            dedup, dedup_capacity or max(os.path.getsize(input_file) // 256, 1 << 16),
+            log_file=dedup_log_path(output_file) if checkpoint else None, resume_offset=dedup_offset
+        )
+    
+    def save_checkpoint(status: str, input_offset: int, output_offset: int):
+        write_json_atomic(checkpoint_path(output_file), {
+            **fingerprint,
+            "status": status,
+            "input_offset": input_offset,
+            "record_offset": record_offset,
+            "output_offset": output_offset,
+            "count": count,
+            "reused": reused,
+            "sample_length": sample_length,
+            "duplicates": duplicates,
+            "dedup_offset": duplicate_filter.checkpoint() if duplicate_filter else None,
+            "quarantine": quarantine.checkpoint(),
+            "updated": datetime.now().isoformat()
+        })
+    
+    timer = LapTimer()
+    checked = failed = 0
+    
+    def consume_chunk(chunk_end: Optional[int], results: Iterable[ConversionResult]) -> bool:
+        """Write the conversions of one chunk and checkpoint after it; True once max_examples is reached"""
+        nonlocal record_offset, count, reused, sample_length, duplicates, checked, failed
+        
+        chunk_records = 0
+        for result in results:
+            timer.restart()
+            chunk_records = result.record_no + 1
+            record_no = record_offset + result.record_no
+            
+            if result.error:
+                failed += 1
+                quarantine.add(record_no + 1, result.error, result.error_class, result.message, result.record)
+                timer.lap("quarantine")
+                continue
+            
+            if duplicate_filter is not None:
+                checked += 1
+                is_duplicate = duplicate_filter.is_duplicate(result.content_hash)
+                timer.lap("dedup")
+                if is_duplicate:
+                    duplicates += 1
+                    continue
+            
+            writer.write_encoded(result.text)
+            timer.lap("write")
+            count += 1
+            reused += result.cached
+            
+            if sample_length is None:
+                sample_length = result.assistant_length
+            
+            if count % 1000 == 0:
+                print(f"  Processed {count:,} {data_type} examples...")
+            
+            # Stop reading as soon as the limit is reached
+            if max_examples and count >= max_examples:
+                return True
+        
+        record_offset += chunk_records
+        if checkpoint:
+            timer.restart()
+            save_checkpoint("partial", chunk_end, writer.checkpoint())
+            timer.lap("write")
+        return False
+    
+    own_executor = None
+    chunks = None
+    profiler = SamplingProfiler() if profile and workers <= 1 else None
     
     try:
-        if input_file.endswith('.json'):
-            # Handle JSON format (for CoT data)
-            with open(input_file, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        items = data
-                    else:
-                        items = [data]
-                except json.JSONDecodeError:
-                    print(f"Error reading JSON file: {input_file}")
-                    return 0
-                    
-            for item in items:
-                if max_examples and count >= max_examples:
-                    break
-                    
-                try:
-                    conversation = converter(item, system_message)
-                    conversation['data_source'] = data_type
-                    conversations.append(conversation)
-                    count += 1
-                    
-                    if count % 1000 == 0:
-                        print(f"  Processed {count:,} {data_type} examples...")
-                        
-                except Exception as e:
-                    print(f"  Error processing item: {str(e)[:100]}")
-                    continue
-                    
+        if profiler is not None:
+            profiler.start()
+        
+        if workers > 1:
+            if executor is None:
+                executor = own_executor = ProcessPoolExecutor(max_workers=workers)
+            if chunk_bytes is None:
+                # Several chunks per worker keeps the pool busy until the end of the file
+                chunk_bytes = min(max(os.path.getsize(input_file) // (workers * 4), 1 << 18), 1 << 24)
+        elif pipeline and chunk_bytes is None:
+            # Small enough that reading, converting and writing chunks overlap from the start
+            chunk_bytes = 1 << 20
+        
+        if pipeline:
+            chunks = _iter_pipelined_chunks(executor, workers, input_file, data_type, output_format,
+                                            chunk_bytes, input_offset, cache, metrics, profile, queue_depth)
+        elif workers > 1:
+            chunks = _iter_parallel_chunks(executor, workers, input_file, data_type, output_format,
+                                           chunk_bytes, input_offset, cache, metrics, profile)
         else:
-            # Handle JSONL format
-            with open(input_file, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f):
-                    if max_examples and count >= max_examples:
+            if chunk_bytes is None and checkpoint:
+                # Checkpoint every few MB of input
+                chunk_bytes = 1 << 22
+            chunks = _iter_serial_chunks(input_file, data_type, output_format, chunk_bytes, input_offset, cache,
+                                         metrics)
+        
+        if pipeline:
+            # Writer stage: consume_chunk runs in its own thread, in chunk order
+            writer_stage = WriterStage(lambda chunk: consume_chunk(*chunk), queue_depth, name="writer")
+            try:
+                for chunk in chunks:
+                    if writer_stage.stopped:
                         break
-                        
-                    try:
-                        item = json.loads(line.strip())
-                        conversation = converter(item, system_message)
-                        conversation['data_source'] = data_type
-                        conversations.append(conversation)
-                        count += 1
-                        
-                        if count % 1000 == 0:
-                            print(f"  Processed {count:,} {data_type} examples...")
-                            
-                    except json.JSONDecodeError:
-                        print(f"  Skipping malformed line {line_num + 1}")
-                        continue
-                    except Exception as e:
-                        print(f"  Error on line {line_num + 1}: {str(e)[:100]}")
-                        continue
-    
-    except Exception as e:
-        print(f"Error reading file {input_file}: {e}")
-        return 0
+                    writer_stage.put(chunk)
+            except BaseException:
+                writer_stage.abort()
+                raise
+            writer_stage.close()
+        else:
+            for chunk_end, results in chunks:
+                if consume_chunk(chunk_end, results):
+                    break
     
-    # Save conversations
-    if conversations:
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(conversations, f, indent=2, ensure_ascii=False)
-        
+    except BaseException as e:
+        if isinstance(e, json.JSONDecodeError):
+            # Raised only for .json inputs, JSONL lines are skipped individually
+            print(f"Error reading JSON file: {input_file}")
+        elif isinstance(e, Exception):
+            print(f"Error converting {input_file}: {e}")
+        # Keep the last checkpoint and everything it covers, so --resume continues from there
+        if checkpoint:
+            writer.release()
+        else:
+            writer.abort()
+        quarantine.close()
+        if duplicate_filter is not None:
+            duplicate_filter.close(remove_log=not checkpoint)
+        raise
+    finally:
+        # Stops the reader thread of a pipeline and cancels chunks still queued in the pool
+        if chunks is not None:
+            chunks.close()
+        if own_executor is not None:
+            own_executor.shutdown(cancel_futures=True)
+        if profiler is not None:
+            metrics.samples.update(profiler.stop())
+    
+    # Finish the streamed output
+    with metrics.stage("write") as stage:
+        writer.close()
+        if checkpoint:
+            save_checkpoint("complete", fingerprint["input_size"], path_size(output_file) if count else 0)
+        stage.bytes_written += path_size(output_file) if os.path.exists(output_file) else 0
+    timer.record(metrics, {"quarantine": failed, "dedup": checked, "write": count})
+    
+    quarantine.close()
+    if quarantine_summaries is not None:
+        quarantine_summaries[data_type] = quarantine.summary()
+    
+    if duplicate_filter is not None:
+        # A finished file is never resumed, so its digest log can go
+        duplicate_filter.close()
+        if duplicate_counts is not None:
+            duplicate_counts[data_type] = duplicates
+        print(f"  Dropped {duplicates:,} duplicate records ({dedup}, "
+              f"{duplicate_filter.memory_bytes / (1 << 20):.1f} MB digest set)")
+    
+    if profile and metrics.samples:
+        write_collapsed_stacks(profile_path(output_file), metrics.samples)
+        print(f"  Profile: {sum(metrics.samples.values()):,} samples saved to {profile_path(output_file)}")
+        for function, hits in list(top_functions(metrics.samples).items())[:5]:
+            print(f"    {hits / sum(metrics.samples.values()) * 100:5.1f}%  {function}")
+    
+    if cache is not None:
+        cache.hits += reused
+        cache.misses += count - reused
+        print(f"  Cache: {reused:,} reused, {count - reused:,} converted")
+    
+    if count:
         print(f"  Saved {count:,} {data_type} conversations to {output_file}")
         
         # Show sample of improved output
-        if conversations:
-            sample = conversations[0]
-            assistant_msg = sample['messages'][2]['content']
-            print(f"  Sample output length: {len(assistant_msg)} characters")
-            if len(assistant_msg) > 500:
-                print("  ✓ Output includes complete details!")
+        print(f"  Sample output length: {sample_length} characters")
+        if sample_length > 500:
+            print("  ✓ Output includes complete details!")
     
     return count
 
-def convert_all_data():
-    """Convert all data files to ShareGPT format with complete content"""
+def convert_all_data(output_format: str = "json", workers: int = 1, cache_path: str = None,
+                     keep_generations: int = 2, checkpoint: bool = True, resume: bool = False,
+                     sample: str = "first", sample_seed: int = 42, stratify_by: str = "domain",
+                     dedup: str = "off", dedup_capacity: int = None, profile: List[str] = (),
+                     pipeline: bool = False):
+    """Convert all data files to ShareGPT format with complete content
+    
+    With workers > 1 one process pool is shared by all source files and each
+    file is converted in byte-range chunks; counts and conversion_info.json are
+    aggregated in file_mappings order exactly as in a serial run. cache_path
+    enables the conversion cache, keeping entries used by the last
+    keep_generations runs. Each file keeps a checkpoint manifest next to its
+    output, and resume continues interrupted or skips finished files. sample
+    selects how each file's max_examples records are chosen (see process_file).
+    dedup ("exact" or "bloom"; off by default) drops repeated records within
+    each source file. Bad records are quarantined per file and counted in
+    conversion_info.json, as are the stage metrics of every file and of the
+    whole run; the data types in profile are converted under the sampling
+    profiler. pipeline overlaps reading, converting and writing each file (see
+    process_file).
+    
+    A file whose conversion fails stops the run with its error, before
+    conversion_info.json is written. When a worker dies and breaks the pool,
+    the pool is replaced and the file is retried once from its checkpoint.
+    """
     
     # Set up directories - using NEW output directory
     base_dir = "raw_consolidated"
@@ -803,6 +1290,9 @@ def convert_all_data():
     
     os.makedirs(output_dir, exist_ok=True)
     
+    # Fail before converting anything if the format's optional package is missing
+    require_format_support(output_format)
+    
     print("=== Converting All Data to Rich ShareGPT Format (FIXED VERSION) ===\n")
     print(f"Output directory: {output_dir}\n")
     
@@ -818,20 +1308,82 @@ def convert_all_data():
     ]
     
     total_conversations = 0
+    cache = ConversionCache(cache_path) if cache_path else None
+    duplicate_counts = {}
+    quarantine_summaries = {}
     
+    tasks = []
     for input_filename, data_type, output_filename, max_examples in file_mappings:
         input_file = os.path.join(base_dir, input_filename)
-        output_file = os.path.join(output_dir, output_filename)
+        output_file = output_path_for_format(os.path.join(output_dir, output_filename), output_format)
         
         if os.path.exists(input_file):
-            count = process_file(input_file, data_type, output_file, max_examples)
-            total_conversations += count
+            tasks.append((input_file, data_type, output_file, max_examples, output_format))
         else:
             print(f"Warning: {input_filename} not found, skipping...")
     
+    run_start = time.perf_counter()
+    cpu_start = time.process_time()
+    source_metrics = {}
+    source_info = {}
+    
+    executor = None
+    if workers > 1:
+        print(f"Converting with {workers} workers\n")
+        executor = ProcessPoolExecutor(max_workers=workers)
+    
+    try:
+        for task in tasks:
+            data_type, output_file = task[1], task[2]
+            metrics = source_metrics[data_type] = RunMetrics()
+            file_start = time.perf_counter()
+            options = dict(workers=workers, cache=cache, checkpoint=checkpoint, sample=sample,
+                           sample_seed=sample_seed, stratify_by=stratify_by, dedup=dedup,
+                           dedup_capacity=dedup_capacity, duplicate_counts=duplicate_counts,
+                           quarantine_summaries=quarantine_summaries, metrics=metrics,
+                           profile=data_type in profile, pipeline=pipeline)
+            try:
+                count = process_file(*task, executor=executor, resume=resume, **options)
+            except BrokenProcessPool:
+                # A worker died (killed for memory, say) and took the shared pool with it; every
+                # later file would fail too. Retry this one once on a new pool, from its checkpoint.
+                print("  A worker process died, restarting the pool and resuming the file")
+                executor.shutdown(cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=workers)
+                count = process_file(*task, executor=executor, resume=resume or checkpoint, **options)
+            total_conversations += count
+            
+            elapsed = time.perf_counter() - file_start
+            source_info[data_type] = {
+                "conversations": count,
+                "wall_seconds": round(elapsed, 3),
+                "conversations_per_sec": round(count / elapsed, 1) if elapsed > 0 else None,
+                "stages": metrics.to_dict()
+            }
+            if metrics.samples:
+                source_info[data_type]["profile"] = {
+                    "file": profile_path(output_file),
+                    "samples": sum(metrics.samples.values()),
+                    "top_functions": top_functions(metrics.samples)
+                }
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    run_metrics = RunMetrics()
+    for metrics in source_metrics.values():
+        run_metrics.merge(metrics)
+    run_seconds = time.perf_counter() - run_start
+    
     print(f"\n=== Rich ShareGPT Conversion Complete ===")
     print(f"Total conversations created: {total_conversations:,}")
+    if dedup != "off":
+        print(f"Duplicate records dropped: {sum(duplicate_counts.values()):,}")
+    quarantined = sum(summary["records"] for summary in quarantine_summaries.values())
+    if quarantined:
+        print(f"Bad records quarantined: {quarantined:,}")
     print(f"All converted files saved in: {output_dir}")
+    print_stages(run_metrics, run_seconds)
     print("\nNOTE: This is the FIXED version with complete answers!")
     
     # Create info file
@@ -846,14 +1398,96 @@ def convert_all_data():
             "Best practices and applications added",
             "Comprehensive summaries provided"
         ],
-        "total_conversations": total_conversations
+        "output_format": output_format,
+        "json_backend": json_backend.backend_name(),
+        "sampling": {
+            "mode": sample,
+            "seed": sample_seed if sample != "first" else None,
+            "stratify_by": stratify_by if sample == "stratified" else None
+        },
+        "dedup": {
+            "mode": dedup,
+            "duplicates_dropped": sum(duplicate_counts.values()),
+            "duplicates_by_source": duplicate_counts
+        },
+        "quarantine": {
+            "records": quarantined,
+            "by_error": {
+                kind: sum(summary["by_error"].get(kind, 0) for summary in quarantine_summaries.values())
+                for kind in ERROR_KINDS
+            },
+            "by_source": quarantine_summaries
+        },
+        "total_conversations": total_conversations,
+        "metrics": {
+            "wall_seconds": round(run_seconds, 3),
+            "cpu_seconds": round(time.process_time() - cpu_start, 3),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "workers": workers,
+            "conversations_per_sec": round(total_conversations / run_seconds, 1) if run_seconds > 0 else None,
+            "stages": run_metrics.to_dict(),
+            "by_source": source_info
+        }
     }
     
+    if cache is not None:
+        evicted = cache.evict(keep_generations)
+        cache.close()
+        print(f"Cache: {cache.hits:,} reused, {cache.misses:,} converted, {evicted:,} stale entries evicted")
+        info["cache"] = {
+            "path": cache_path,
+            "generation": cache.generation,
+            "reused": cache.hits,
+            "converted": cache.misses,
+            "evicted": evicted
+        }
+    
     with open(os.path.join(output_dir, "conversion_info.json"), 'w') as f:
         json.dump(info, f, indent=2)
     
     return total_conversations
 
 if __name__ == "__main__":
-    random.seed(42)  # For reproducible sampling
-    convert_all_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert consolidated data to rich ShareGPT format")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="json",
+                        help="json writes indented arrays, jsonl writes one conversation per line, "
+                             "jsonl.zst (zstandard) and parquet (pyarrow) write compressed shard directories")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes converting chunks of each file")
+    parser.add_argument("--cache", metavar="PATH",
+                        help="reuse conversions of unchanged records from this cache database")
+    parser.add_argument("--cache-keep", type=int, default=2,
+                        help="evict cache entries not used by this many most recent runs")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the last checkpoint of each file instead of starting over")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help="do not write checkpoint manifests (disables --resume for this run)")
+    parser.add_argument("--sample", choices=SAMPLE_MODES, default="first",
+                        help="how to pick each file's max_examples records: first N, uniform or stratified sample")
+    parser.add_argument("--sample-seed", type=int, default=42,
+                        help="seed for uniform/stratified sampling")
+    parser.add_argument("--stratify-by", default="domain",
+                        help="dotted record field used as the stratum for --sample stratified")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default="off",
+                        help="drop repeated records by normalized user/assistant content (off by default); "
+                             "bloom bounds memory at a small false-positive rate")
+    parser.add_argument("--dedup-capacity", type=int,
+                        help="expected records per file for --dedup bloom (default: estimated from file size)")
+    parser.add_argument("--profile", nargs="+", choices=CONVERSION_FUNCTIONS, default=[], metavar="DATA_TYPE",
+                        help="sample the stacks of these data types' conversions and save them next to their "
+                             "output for flame graph tools")
+    parser.add_argument("--json-backend", choices=JSON_BACKENDS, default="auto",
+                        help="JSON encoder/decoder for records and conversations; auto uses orjson when it is "
+                             "installed (default: %(default)s)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="overlap reading, converting and writing each file in threads connected by "
+                             "bounded queues")
+    args = parser.parse_args()
+    
+    json_backend.set_backend(args.json_backend)
+    convert_all_data(output_format=args.output_format, workers=args.workers,
+                     cache_path=args.cache, keep_generations=args.cache_keep,
+                     checkpoint=not args.no_checkpoint, resume=args.resume, sample=args.sample,
+                     sample_seed=args.sample_seed, stratify_by=args.stratify_by,
+                     dedup=args.dedup, dedup_capacity=args.dedup_capacity, profile=args.profile,
+                     pipeline=args.pipeline)
\ No newline at end of file
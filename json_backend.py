@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+JSON Backend
+JSON decoding and encoding for conversations and records, done by orjson when
+it is installed and by the standard library json module otherwise
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library is used instead
+    orjson = None
+
+# "auto" picks orjson when it is installed
+JSON_BACKENDS = ("auto", "orjson", "json")
+
+# Built once: json.dumps with non-default options constructs a new encoder per call
+_COMPACT_ENCODER = json.JSONEncoder(ensure_ascii=False)
+_INDENTED_ENCODER = json.JSONEncoder(ensure_ascii=False, indent=2)
+
+# orjson reads integers wider than 64 bits as floats; documents with a run of
+# 19 or more digits are left to the standard library. Masking every byte to
+# "0" (digit) or " " finds such runs far faster than a regular expression.
+_DIGIT_MASK = bytes(ord("0") if byte in b"0123456789" else ord(" ") for byte in range(256))
+_LONG_DIGIT_RUN = b"0" * 19
+
+_backend = "json"
+
+def set_backend(name: str = "auto") -> str:
+    """Select the backend used by loads, dumps and dumps_indented and return its name"""
+    global _backend
+    
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("The orjson JSON backend needs the orjson package (pip install orjson)")
+    
+    _backend = name
+    return name
+
+def backend_name() -> str:
+    """The backend in use, orjson or json"""
+    return _backend
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode one JSON document, always to the value json.loads would return
+    
+    Documents orjson rejects or might read differently (NaN and infinities,
+    lone surrogates, integers beyond 64 bits, invalid UTF-8) are decoded by
+    the standard library, which also raises the same errors as before.
+    """
+    
+    if _backend == "orjson":
+        raw = data if isinstance(data, bytes) else data.encode('utf-8', 'surrogatepass')
+        if _LONG_DIGIT_RUN not in raw.translate(_DIGIT_MASK):
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(data)
+
+def dumps(value: Any) -> str:
+    """Encode a value on one line, as json.dumps(value, ensure_ascii=False)
+    
+    orjson leaves out the spaces after "," and ":", and values it cannot
+    encode (non-string keys, integers beyond 64 bits, lone surrogates) fall
+    back to the standard library.
+    """
+    
+    if _backend == "orjson":
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            pass
+    return _COMPACT_ENCODER.encode(value)
+
+def dumps_indented(value: Any) -> str:
+    """Encode a value as json.dumps(value, indent=2, ensure_ascii=False)
+    
+    Both backends give the same text for strings, integers, lists and dicts;
+    orjson spells some floats differently (1e16 for 1e+16) and writes NaN
+    and infinities as null.
+    """
+    
+    if _backend == "orjson":
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            pass
+    return _INDENTED_ENCODER.encode(value)
+
+set_backend()
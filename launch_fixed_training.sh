@@ -33,7 +33,7 @@ done
 # Check dataset files
 echo "📁 Verifying FIXED dataset files..."
 DATASET_DIR="final_rich_dataset_fixed"
-REQUIRED_FILES=("train.json" "validation.json" "test.json" "dataset_info.json")
+REQUIRED_FILES=("train" "validation" "test" "dataset_info.json")
 
 if [ ! -d "$DATASET_DIR" ]; then
     echo "❌ Fixed dataset directory '$DATASET_DIR' not found!"
@@ -42,6 +42,16 @@ if [ ! -d "$DATASET_DIR" ]; then
 fi
 
 for file in "${REQUIRED_FILES[@]}"; do
+    # Splits may be JSON or compressed Parquet (create_final_fixed_dataset.py --split-format parquet)
+    if [ ! -f "$DATASET_DIR/$file" ]; then
+        for suffix in ".json" ".parquet"; do
+            if [ -f "$DATASET_DIR/$file$suffix" ]; then
+                file="$file$suffix"
+                break
+            fi
+        done
+    fi
+
     if [ ! -f "$DATASET_DIR/$file" ]; then
         echo "❌ Required file '$DATASET_DIR/$file' not found!"
         exit 1
@@ -72,6 +82,12 @@ if [ "$FREE_SPACE_GB" -lt 100 ]; then
     fi
 fi
 
+# Check token lengths against sequence_len (counts are cached after the first run)
+echo "🔢 Checking token lengths..."
+if ! python token_counts.py --sequence-len 4096; then
+    echo "⚠️  Could not count tokens, over-length conversations will not be reported"
+fi
+
 # Show data quality improvements
 echo "📈 Dataset Quality Summary:"
 echo "   - CoT responses: ~4000 characters (vs ~300 original)"
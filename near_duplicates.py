@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Detection
+MinHash signatures with LSH banding to find conversations whose user and
+assistant text is nearly identical, in one streaming pass
+"""
+
+import argparse
+import hashlib
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Any, Iterable, Iterator, List
+
+from sharegpt_io import iter_sharegpt_file
+
+NEAR_DUP_MODES = ("off", "drop", "downweight")
+
+_WORD = re.compile(r'\w+')
+_MAX_HASH = (1 << 64) - 1
+
+def conversation_text(conversation: Dict[str, Any]) -> str:
+    """User and assistant content; the shared system prompt would only add noise"""
+    return "\n".join(
+        message.get('content') or ''
+        for message in conversation.get('messages') or []
+        if message.get('role') != 'system'
+    )
+
+def shingle_hashes(text: str, shingle_size: int = 5) -> List[int]:
+    """64-bit hashes of the overlapping word shingles of text"""
+    
+    words = _WORD.findall(text.lower())
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for shingle in set(shingles)
+    ]
+
+def minhash_signature(hashes: List[int], num_perm: int = 128) -> array:
+    """One-permutation MinHash: each shingle hash is routed to one of num_perm bins
+    
+    Every shingle is hashed once instead of num_perm times, which keeps the
+    pass linear in the text length. Empty bins borrow the value of the next
+    non-empty bin (rotation densification) so that, as with classic MinHash,
+    the fraction of equal bins estimates the Jaccard similarity.
+    """
+    
+    bins = [_MAX_HASH] * num_perm
+    for value in hashes:
+        index = value % num_perm
+        value //= num_perm
+        if value < bins[index]:
+            bins[index] = value
+    
+    if _MAX_HASH in bins and len(set(bins)) > 1:
+        bin_width = _MAX_HASH // num_perm + 1
+        filled = bins[:]
+        for index in range(num_perm):
+            if bins[index] != _MAX_HASH:
+                continue
+            offset = 1
+            while bins[(index + offset) % num_perm] == _MAX_HASH:
+                offset += 1
+            filled[index] = (bins[(index + offset) % num_perm] + offset * bin_width) & _MAX_HASH
+        bins = filled
+    
+    return array('Q', bins)
+
+def estimated_similarity(a: array, b: array) -> float:
+    """Fraction of equal MinHash bins, an estimate of the Jaccard similarity"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+class NearDuplicateFilter:
+    """Cluster near-duplicate conversations online and decide which ones to keep.
+    
+    Each conversation's signature is split into bands of rows values; two
+    conversations that share any band become candidates, and candidates whose
+    estimated similarity reaches threshold join the same cluster (union-find).
+    Each band bucket holds up to bucket_size conversations, so a newcomer is
+    compared with every earlier conversation it shares a band with, not only
+    the first one that landed in the bucket. The first conversation of a
+    cluster is always kept. "drop" keeps nothing else; "downweight" keeps
+    members number 1, 4, 9, 16, ... so a cluster of n contributes about
+    sqrt(n) conversations. Decisions depend only on the conversations seen
+    before, so the filter works on a stream.
+    
+    Memory is one signature of num_perm 64-bit values per conversation plus
+    one bucket entry per band, up to bucket_size entries per bucket.
+    """
+    
+    def __init__(self, mode: str = "drop", threshold: float = 0.8, num_perm: int = 128, bands: int = 16,
+                 bucket_size: int = 32):
+        if mode not in NEAR_DUP_MODES[1:]:
+            raise ValueError(f"Unknown near-duplicate mode: {mode}")
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        
+        self.mode = mode
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.bucket_size = bucket_size
+        
+        self.seen = 0
+        self.dropped = Counter()  # data_source -> conversations dropped
+        
+        self._signatures = []
+        self._parent = []
+        self._cluster_size = []
+        self._buckets = [{} for _ in range(bands)]
+    
+    def _find(self, index: int) -> int:
+        while self._parent[index] != index:
+            self._parent[index] = self._parent[self._parent[index]]
+            index = self._parent[index]
+        return index
+    
+    def _union(self, a: int, b: int) -> int:
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return a
+        if a > b:
+            a, b = b, a
+        # The older root stays the root so the first member keeps its decision
+        self._parent[b] = a
+        self._cluster_size[a] += self._cluster_size[b]
+        return a
+    
+    def keep(self, conversation: Dict[str, Any]) -> bool:
+        """Add a conversation to the clusters and return whether to keep it"""
+        
+        signature = minhash_signature(shingle_hashes(conversation_text(conversation)), self.num_perm)
+        index = self.seen
+        self.seen += 1
+        
+        self._signatures.append(signature)
+        self._parent.append(index)
+        self._cluster_size.append(1)
+        
+        candidates = set()
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            members = buckets.get(key)
+            if members is None:
+                # Most buckets only ever hold one conversation, kept as a bare index
+                buckets[key] = index
+                continue
+            if members.__class__ is int:
+                members = buckets[key] = [members]
+            candidates.update(members)
+            if len(members) < self.bucket_size:
+                members.append(index)
+        
+        root = index
+        for candidate in sorted(candidates):
+            if self._find(candidate) == root:
+                continue
+            if estimated_similarity(signature, self._signatures[candidate]) >= self.threshold:
+                root = self._union(root, candidate)
+        
+        member = self._cluster_size[self._find(index)]
+        if member == 1:
+            return True
+        
+        if self.mode == "downweight":
+            # Keep the members whose number is a perfect square
+            square_root = int(member ** 0.5)
+            if square_root * square_root == member:
+                return True
+        
+        self.dropped[conversation.get('data_source', 'unknown')] += 1
+        return False
+    
+    def filter(self, conversations: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield only the conversations to keep"""
+        for conversation in conversations:
+            if self.keep(conversation):
+                yield conversation
+    
+    def clusters(self) -> List[List[int]]:
+        """Indices of the conversations seen so far, grouped by cluster (only clusters of 2+)"""
+        
+        groups = {}
+        for index in range(self.seen):
+            groups.setdefault(self._find(index), []).append(index)
+        return [members for members in groups.values() if len(members) > 1]
+    
+    def summary(self) -> Dict[str, Any]:
+        clusters = self.clusters()
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "conversations_seen": self.seen,
+            "clusters": len(clusters),
+            "clustered_conversations": sum(len(members) for members in clusters),
+            "largest_cluster": max((len(members) for members in clusters), default=0),
+            "dropped": sum(self.dropped.values()),
+            "dropped_by_source": dict(sorted(self.dropped.items()))
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate clusters in ShareGPT files")
+    parser.add_argument("files", nargs="+", help="ShareGPT .json or .jsonl files, clustered together")
+    parser.add_argument("--threshold", type=float, default=0.8,
+                        help="Estimated Jaccard similarity that makes two conversations duplicates (default: %(default)s)")
+    args = parser.parse_args()
+    
+    near_dups = NearDuplicateFilter("drop", args.threshold)
+    conversations = []
+    for filepath in args.files:
+        print(f"Scanning {os.path.basename(filepath)}...")
+        for conversation in iter_sharegpt_file(filepath):
+            near_dups.keep(conversation)
+            conversations.append((os.path.basename(filepath), conversation.get('data_source', 'unknown')))
+    
+    summary = near_dups.summary()
+    print(f"\n{summary['conversations_seen']:,} conversations, {summary['clusters']:,} near-duplicate clusters "
+          f"covering {summary['clustered_conversations']:,} conversations")
+    print(f"Removable duplicates: {summary['dropped']:,}")
+    for source, count in summary["dropped_by_source"].items():
+        print(f"  {source}: {count:,}")
+    
+    largest = sorted(near_dups.clusters(), key=len, reverse=True)[:5]
+    if largest:
+        print("\nLargest clusters:")
+        for members in largest:
+            filename, source = conversations[members[0]]
+            print(f"  {len(members):,} conversations ({source}), first in {filename}")
+
+if __name__ == "__main__":
+    main()
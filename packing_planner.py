@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Sample Packing Planner
+Packs conversations into fixed-length training sequences offline from their
+token counts and measures how much of each sequence would be padding
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+from dataset_stats import sidecar_is_current
+from sharegpt_io import find_sharegpt_file, write_json_atomic
+from token_counts import DEFAULT_SEQUENCE_LEN, token_counts_path
+from tokenized_store import DEFAULT_STORE_DIR, TokenizedSplit
+
+def first_fit_decreasing(lengths: List[int], capacity: int) -> Tuple[List[List[int]], List[int]]:
+    """Pack record indices into bins of at most capacity tokens, longest records first
+    
+    Each record goes into the first bin it fits in. A max segment tree over the
+    remaining capacity of the bins finds that bin in O(log n), so planning the
+    whole dataset is O(n log n). Records longer than capacity cannot be packed
+    and are returned separately.
+    """
+    
+    order = sorted((i for i in range(len(lengths)) if lengths[i] <= capacity), key=lambda i: -lengths[i])
+    oversized = [i for i in range(len(lengths)) if lengths[i] > capacity]
+    
+    size = 1
+    while size < max(len(order), 1):
+        size *= 2
+    # Leaves are bins in opening order; unused bins still have full capacity
+    tree = [capacity] * (2 * size)
+    bins = []
+    
+    for index in order:
+        length = lengths[index]
+        
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= length else 2 * node + 1
+        
+        slot = node - size
+        if slot == len(bins):
+            bins.append([])
+        bins[slot].append(index)
+        
+        tree[node] -= length
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    
+    return bins, oversized
+
+def packing_summary(lengths: List[int], bins: List[List[int]], oversized: List[int], capacity: int) -> Dict[str, Any]:
+    """Fill ratio and padding waste of a plan, next to padding every record on its own"""
+    
+    packed_tokens = sum(lengths[i] for contents in bins for i in contents)
+    packed_slots = len(bins) * capacity
+    unpacked_records = len(lengths) - len(oversized)
+    unpacked_slots = unpacked_records * capacity
+    lower_bound = -(-packed_tokens // capacity)
+    
+    return {
+        "sequence_len": capacity,
+        "records": len(lengths),
+        "oversized_records": len(oversized),
+        "tokens": packed_tokens,
+        "sequences": len(bins),
+        "min_sequences": lower_bound,
+        "fill_ratio": packed_tokens / packed_slots if packed_slots else 0,
+        "padding_tokens": packed_slots - packed_tokens,
+        "records_per_sequence": unpacked_records / len(bins) if bins else 0,
+        "unpacked": {
+            "sequences": unpacked_records,
+            "fill_ratio": packed_tokens / unpacked_slots if unpacked_slots else 0,
+            "padding_tokens": unpacked_slots - packed_tokens
+        }
+    }
+
+def load_lengths(split_file: str) -> List[int]:
+    """Per-conversation token counts of a split from its token_counts sidecar"""
+    
+    sidecar = token_counts_path(split_file)
+    if not os.path.exists(sidecar):
+        raise FileNotFoundError(f"{sidecar} not found; run token_counts.py first")
+    
+    with open(sidecar, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    if not sidecar_is_current(sidecar, report, split_file):
+        raise ValueError(f"{sidecar} is out of date; run token_counts.py again")
+    return report["tokens"]
+
+def load_store_lengths(split_dir: str) -> List[int]:
+    """Per-conversation token counts from a tokenized_store split"""
+    
+    with TokenizedSplit(split_dir) as split:
+        return split.lengths()
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan sample packing for the final dataset splits")
+    parser.add_argument("--dataset-dir", default="final_rich_dataset_fixed",
+                        help="Directory with the split files (default: %(default)s)")
+    parser.add_argument("--splits", nargs="+", default=["train", "validation"])
+    parser.add_argument("--sequence-len", type=int, default=DEFAULT_SEQUENCE_LEN,
+                        help="Packed sequence length in tokens (default: %(default)s)")
+    parser.add_argument("--from-store", action="store_true",
+                        help="Take lengths from the pre-tokenized store instead of the token count sidecars")
+    parser.add_argument("--plan-dir", default="packing_plans",
+                        help="Directory for the plans, outside the dataset directory that Axolotl loads "
+                             "(default: %(default)s)")
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR,
+                        help="Pre-tokenized store directory for --from-store (default: %(default)s)")
+    args = parser.parse_args()
+    
+    print("=== Sample Packing Plan ===")
+    for split_name in args.splits:
+        split_base = os.path.join(args.dataset_dir, split_name)
+        split_file = find_sharegpt_file(split_base) or f"{split_base}.json"
+        if args.from_store:
+            lengths = load_store_lengths(os.path.join(args.store_dir, split_name))
+        else:
+            lengths = load_lengths(split_file)
+        
+        bins, oversized = first_fit_decreasing(lengths, args.sequence_len)
+        summary = packing_summary(lengths, bins, oversized, args.sequence_len)
+        
+        os.makedirs(args.plan_dir, exist_ok=True)
+        plan_file = os.path.join(args.plan_dir, f"packing_plan_{split_name}.json")
+        write_json_atomic(plan_file, {
+            "split": split_name,
+            "source": "tokenized_store" if args.from_store else "token_counts",
+            "algorithm": "first_fit_decreasing",
+            "created": datetime.now().isoformat(),
+            "summary": summary,
+            "oversized": oversized,
+            "sequences": bins
+        })
+        
+        print(f"\n{split_name}: {summary['records']:,} conversations, {summary['tokens']:,} tokens")
+        print(f"  Packed: {summary['sequences']:,} sequences (lower bound {summary['min_sequences']:,}), "
+              f"{summary['records_per_sequence']:.2f} conversations each")
+        print(f"  Fill ratio: {summary['fill_ratio'] * 100:.1f}%, "
+              f"padding {summary['padding_tokens']:,} tokens")
+        print(f"  Without packing: {summary['unpacked']['fill_ratio'] * 100:.1f}% fill, "
+              f"padding {summary['unpacked']['padding_tokens']:,} tokens")
+        if oversized:
+            print(f"  ⚠ {len(oversized):,} conversations exceed {args.sequence_len:,} tokens and cannot be packed")
+        print(f"  Plan saved to {plan_file}")
+
+if __name__ == "__main__":
+    main()
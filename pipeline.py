@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Pipeline
+Background stages connected by bounded queues, so reading input and writing
+output overlap with conversion while memory stays capped by the queue depths
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator
+
+_DONE = object()
+
+class _Failure:
+    """An exception raised in a stage's thread, passed on to the thread that reads its queue"""
+    
+    __slots__ = ("error",)
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def _put(items: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Put item once there is room, giving up (False) if stop is set first"""
+    
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def read_ahead(items: Iterable[Any], depth: int = 2, name: str = "reader") -> Iterator[Any]:
+    """Produce items in a background thread, at most depth items ahead of the consumer
+    
+    The producer waits while the queue is full, so memory is bounded by depth
+    items however far ahead it could read. Its exceptions are raised in the
+    consumer, and closing the returned iterator early stops the producer.
+    """
+    
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not _put(pending, item, stop):
+                    return
+            _put(pending, _DONE, stop)
+        except BaseException as e:
+            _put(pending, _Failure(e), stop)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+    
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if item.__class__ is _Failure:
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+class WriterStage:
+    """Call consume(item) in a background thread for each item put, in order.
+    
+    put() waits while depth items are queued, so a slow consumer (a disk, a
+    compressor) holds the producer back instead of letting results pile up.
+    consume returns True to stop early: stopped becomes True and the items
+    still queued are dropped. An exception raised by consume is raised again
+    by the next put() or by close(), and later items are dropped.
+    """
+    
+    def __init__(self, consume: Callable[[Any], bool], depth: int = 2, name: str = "writer"):
+        self.stopped = False
+        self._consume = consume
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if self.stopped or self._error is not None:
+                continue
+            try:
+                self.stopped = bool(self._consume(item))
+            except BaseException as e:
+                self._error = e
+    
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+    
+    def put(self, item: Any):
+        self._raise_error()
+        self._queue.put(item)
+    
+    def close(self):
+        """Wait until every item put has been consumed"""
+        self._queue.put(_DONE)
+        self._thread.join()
+        self._raise_error()
+    
+    def abort(self):
+        """Drop the queued items and wait for the item being consumed"""
+        self.stopped = True
+        self._queue.put(_DONE)
+        self._thread.join()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Quarantine
+Input records a conversion could not use, saved to a JSONL file for
+inspection and replay, and reported on the console as aggregated counters
+"""
+
+import os
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+
+import json_backend
+
+# Why a record failed: its JSON could not be parsed, it did not fit the
+# schema of its data type, or its converter raised
+ERROR_KINDS = ("malformed", "invalid", "convert")
+
+class Quarantine:
+    """Save failed input records to path and count them.
+    
+    Every failure is one JSON line {"line", "error", "error_class", "message",
+    "record"}: line is the 1-based line of a JSONL input (the item number for
+    a JSON array), error one of ERROR_KINDS, error_class the exception type
+    and record the raw input record as JSON text (bytes that are not valid
+    UTF-8 are replaced). The file is created by the first failure; a fresh
+    run removes the one left by an earlier run.
+    
+    The first verbose failures are printed one by one. After that the console
+    only gets a line of running counts, at most every interval seconds, so a
+    dirty input cannot flood stdout or slow the loop down.
+    
+    checkpoint() makes the file durable and returns the summary with the file
+    offset reached; passing that back as resume drops the entries written
+    after the checkpoint and restores the counts.
+    """
+    
+    def __init__(self, path: str, unit: str = "line", verbose: int = 10, interval: float = 5.0,
+                 resume: Dict[str, Any] = None):
+        self.path = path
+        self.unit = unit
+        self.verbose = verbose
+        self.interval = interval
+        self.counts = Counter()
+        self.classes = Counter()
+        self._file = None
+        self._next_report = 0.0
+        
+        if resume is None or not resume["offset"]:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        
+        self.counts.update(resume["by_error"])
+        self.classes.update(resume["by_class"])
+        self._file = open(path, 'r+b')
+        self._file.truncate(resume["offset"])
+        self._file.seek(resume["offset"])
+    
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+    
+    def add(self, line: int, error: str, error_class: str, message: str, record: Optional[bytes]):
+        """Quarantine one failed record and report it"""
+        
+        if self._file is None:
+            self._file = open(self.path, 'wb')
+        entry = {
+            "line": line,
+            "error": error,
+            "error_class": error_class,
+            "message": message,
+            "record": record.decode('utf-8', 'replace') if record is not None else None
+        }
+        self._file.write(f"{json_backend.dumps(entry)}\n".encode('utf-8'))
+        self.counts[error] += 1
+        self.classes[error_class] += 1
+        
+        total = self.total
+        if total <= self.verbose:
+            print(f"  Skipping {error} record on {self.unit} {line} ({error_class}): {message[:100]}")
+            if total == self.verbose:
+                print(f"  Further bad records are only counted; all are saved to {self.path}")
+                self._next_report = time.monotonic() + self.interval
+            return
+        
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            print(f"  {total:,} bad records so far ({self._breakdown()})")
+    
+    def _breakdown(self) -> str:
+        return ", ".join(f"{kind} {self.counts[kind]:,}" for kind in ERROR_KINDS if self.counts[kind])
+    
+    def checkpoint(self) -> Dict[str, Any]:
+        """Make the quarantine file durable and return the state to resume from"""
+        
+        offset = 0
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            offset = self._file.tell()
+        return {**self.summary(), "offset": offset}
+    
+    def close(self):
+        """Close the file and print the final counts"""
+        
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.total:
+            print(f"  Quarantined {self.total:,} bad records ({self._breakdown()}) to {self.path}")
+    
+    def summary(self) -> Dict[str, Any]:
+        """Counts for conversion_info.json"""
+        return {
+            "file": self.path if self.total else None,
+            "records": self.total,
+            "by_error": {kind: self.counts[kind] for kind in ERROR_KINDS},
+            "by_class": dict(self.classes)
+        }
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Record Index
+Random access to single conversations of large .json and .jsonl files through
+their byte-offset index sidecars, for spot checks and subset extraction
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+
+from sharegpt_io import ShareGPTWriter, build_index, index_path, load_index
+
+class RecordIndex:
+    """Fetch records of a ShareGPT .json array or .jsonl file by position.
+    
+    Offsets come from the file's index sidecar, which is rebuilt with one scan
+    if it is missing or out of date (and build is set). Every fetch is then a
+    single seek and read of that record alone.
+    """
+    
+    def __init__(self, filepath: str, build: bool = True):
+        if os.path.isdir(filepath) or filepath.endswith('.parquet'):
+            raise ValueError(f"{filepath} is compressed; only .json and .jsonl files have record indexes")
+        
+        offsets = load_index(filepath)
+        if offsets is None:
+            if not build:
+                raise FileNotFoundError(f"{index_path(filepath)} is missing or out of date")
+            offsets = build_index(filepath)
+        
+        self.filepath = filepath
+        self._offsets = offsets
+        self._decoder = json.JSONDecoder()
+        self._f = open(filepath, 'rb')
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def read_bytes(self, index: int) -> bytes:
+        """Raw bytes of record index, possibly followed by a separator"""
+        
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        
+        start = self._offsets[index]
+        self._f.seek(start)
+        return self._f.read(self._offsets[index + 1] - start)
+    
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        value, _ = self._decoder.raw_decode(self.read_bytes(index).decode('utf-8'))
+        return value
+    
+    def sample(self, count: int, seed: int = None, data_source: Optional[str] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """(index, record) pairs of a uniform random sample, in file order
+        
+        With data_source only records of that source are drawn; records are
+        visited in random order until count of them have been found.
+        """
+        
+        rng = random.Random(seed)
+        if data_source is None:
+            indices = rng.sample(range(len(self)), min(count, len(self)))
+            return [(index, self[index]) for index in sorted(indices)]
+        
+        found = []
+        for index in rng.sample(range(len(self)), len(self)):
+            record = self[index]
+            if record.get('data_source') == data_source:
+                found.append((index, record))
+                if len(found) >= count:
+                    break
+        return sorted(found, key=lambda pair: pair[0])
+    
+    def close(self):
+        self._f.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Build record indexes and fetch conversations by position")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    build_parser = subparsers.add_parser("build", help="Build or refresh the index sidecars of files")
+    build_parser.add_argument("files", nargs="+", help="ShareGPT .json or .jsonl files")
+    
+    show_parser = subparsers.add_parser("show", help="Print records by position")
+    show_parser.add_argument("file")
+    show_parser.add_argument("indices", nargs="+", type=int, help="Record positions, negative from the end")
+    
+    sample_parser = subparsers.add_parser("sample", help="Draw a random sample of records")
+    sample_parser.add_argument("file")
+    sample_parser.add_argument("-n", "--count", type=int, default=50)
+    sample_parser.add_argument("--seed", type=int, default=42)
+    sample_parser.add_argument("--data-source", help="Only sample records of this data_source")
+    sample_parser.add_argument("--output", help="Write the sample to this .json or .jsonl file instead of printing it")
+    args = parser.parse_args()
+    
+    if args.command == "build":
+        for filepath in args.files:
+            offsets = build_index(filepath)
+            print(f"{os.path.basename(filepath)}: {len(offsets) - 1:,} records -> {index_path(filepath)}")
+        return
+    
+    with RecordIndex(args.file) as records:
+        if args.command == "show":
+            for index in args.indices:
+                print(f"=== Record {index} of {len(records):,} ===")
+                print(json.dumps(records[index], indent=2, ensure_ascii=False))
+            return
+        
+        sample = records.sample(args.count, args.seed, args.data_source)
+        if args.output:
+            output_format = "jsonl" if args.output.endswith('.jsonl') else "json"
+            with ShareGPTWriter(args.output, output_format, keep_empty=True) as writer:
+                for _, record in sample:
+                    writer.write(record)
+            print(f"Saved {len(sample):,} of {len(records):,} records to {args.output}")
+        else:
+            for index, record in sample:
+                print(json.dumps({"index": index, "record": record}, ensure_ascii=False))
+            print(f"{len(sample):,} of {len(records):,} records", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
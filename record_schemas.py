@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Record Schemas
+Typed records for each raw_consolidated data type, decoded and validated
+before conversion so the converters read attributes instead of probing dicts
+"""
+
+from typing import Dict, Any, Callable, NamedTuple, Optional, Sequence, Union
+
+class RecordError(ValueError):
+    """A raw record that does not fit the schema of its data type
+    
+    path locates the offending value, e.g. "steps[2].input_requirements[0]",
+    and is empty when the record itself is not an object.
+    """
+    
+    def __init__(self, path: str, reason: str):
+        super().__init__(f"{path}: {reason}" if path else reason)
+        self.path = path
+        self.reason = reason
+    
+    def within(self, path: str) -> "RecordError":
+        """The same error for a value found at path of an enclosing record"""
+        return RecordError(_path(path, self.path) if self.path else path, self.reason)
+
+# Text that may also be written as a number, such as ids and durations
+Scalar = Union[str, int, float, bool]
+
+_JSON_KINDS = {str: "string", int: "number", float: "number", bool: "boolean", type(None): "null",
+               list: "array", dict: "object"}
+_SCALARS = (str, int, float, bool)
+_NO_ITEMS = ()
+_NO_FIELDS = {}  # shared stand-in for a missing object; never modified
+
+def _kind(value: Any) -> str:
+    return _JSON_KINDS.get(type(value), type(value).__name__)
+
+def _path(path: str, key: str) -> str:
+    return f"{path}.{key}" if path else key
+
+def _text(obj: Dict[str, Any], key: str, default: Optional[str] = "", path: str = "") -> Optional[str]:
+    """String field of obj, or default when the field is missing, null or empty; numbers render as their text"""
+    value = obj.get(key)
+    if value.__class__ is str:
+        return value
+    if value.__class__ in _SCALARS:
+        return f"{value}"
+    if not value:
+        return default
+    raise RecordError(_path(path, key), f"expected a string, got {_kind(value)}")
+
+def _scalar(obj: Dict[str, Any], key: str, default: Optional[Scalar] = "", path: str = "") -> Optional[Scalar]:
+    """String, number or boolean field of obj, or default when the field is missing or null"""
+    value = obj.get(key)
+    if value.__class__ in _SCALARS:
+        return value
+    if value is None:
+        return default
+    raise RecordError(_path(path, key), f"expected a string or number, got {_kind(value)}")
+
+def _texts(obj: Dict[str, Any], key: str, path: str = "") -> Sequence[str]:
+    """Array field of obj as strings, empty when the field is missing, null or empty
+    
+    Entries that are not strings are formatted as the converters' f-strings
+    always rendered them, so the layouts only ever join strings. A lone string
+    is read as a one-entry array.
+    """
+    
+    value = obj.get(key)
+    if value.__class__ is list:
+        for entry in value:
+            if entry.__class__ is not str:
+                return [entry if entry.__class__ is str else f"{entry}" for entry in value]
+        return value
+    if not value:
+        return _NO_ITEMS
+    if value.__class__ is str:
+        return [value]
+    raise RecordError(_path(path, key), f"expected an array, got {_kind(value)}")
+
+def _object(obj: Dict[str, Any], key: str, path: str = "") -> Dict[str, Any]:
+    """Object field of obj, empty when the field is missing, null or empty"""
+    value = obj.get(key)
+    if value.__class__ is dict:
+        return value
+    if not value:
+        return _NO_FIELDS
+    raise RecordError(_path(path, key), f"expected an object, got {_kind(value)}")
+
+def _not_object(value: Any):
+    raise RecordError("", f"expected an object, got {_kind(value)}")
+
+def _objects(obj: Dict[str, Any], key: str, decode: Callable[[Dict[str, Any]], Any], path: str = "") -> Sequence[Any]:
+    """Array-of-objects field of obj with every entry decoded, empty when the field is missing, null or empty
+    
+    decode reports paths relative to its entry; they are prefixed only when it raises.
+    """
+    
+    value = obj.get(key)
+    if value.__class__ is list:
+        try:
+            return [decode(entry) if entry.__class__ is dict else _not_object(entry) for entry in value]
+        except RecordError:
+            pass
+        
+        # Decode the entries again one at a time to tell which one failed
+        for index, entry in enumerate(value):
+            try:
+                decode(entry) if entry.__class__ is dict else _not_object(entry)
+            except RecordError as e:
+                raise e.within(f"{_path(path, key)}[{index}]") from None
+    if not value:
+        return _NO_ITEMS
+    raise RecordError(_path(path, key), f"expected an array of objects, got {_kind(value)}")
+
+# Every record keeps its raw dict as raw: template_index hashes it to pick the question
+
+class CotStep(NamedTuple):
+    description: Optional[str]  # None renders as "Step <n>"
+    input_requirements: Sequence[str]
+    validation_criteria: Sequence[str]
+    potential_errors: Sequence[str]
+    expected_outcomes: Sequence[str]
+
+class CotRecord(NamedTuple):
+    raw: Dict[str, Any]
+    title: str
+    domain: str
+    description: str
+    complexity: str
+    prerequisites: Sequence[str]
+    steps: Sequence[CotStep]
+    key_concepts: Sequence[str]
+    best_practices: Sequence[str]
+    common_applications: Sequence[str]
+
+# Alternative spellings of a field are read as "key if set, else fallback key",
+# with None when neither is set so the converter applies its default
+
+def _decode_cot_step(step: Dict[str, Any]) -> CotStep:
+    return CotStep(
+        _text(step, 'description', None),
+        _texts(step, 'input_requirements'),
+        _texts(step, 'validation_criteria'),
+        _texts(step, 'potential_errors'),
+        _texts(step, 'expected_outcomes')
+    )
+
+def decode_cot(item: Dict[str, Any]) -> CotRecord:
+    return CotRecord(
+        item,
+        _text(item, 'title', 'Chain-of-Thought Reasoning'),
+        _text(item, 'domain', 'general'),
+        _text(item, 'description'),
+        _text(item, 'complexity', 'medium'),
+        _texts(item, 'prerequisites'),
+        _objects(item, 'steps', _decode_cot_step),
+        _texts(item, 'key_concepts'),
+        _texts(item, 'best_practices'),
+        _texts(item, 'common_applications')
+    )
+
+class Concept(NamedTuple):
+    label: Optional[str]  # name, else id; None when the concept has neither
+    definition: str  # definition, else description
+    type: str
+
+class Relationship(NamedTuple):
+    source: Scalar
+    target: Scalar
+    relation: Optional[str]  # type, else relation; None renders a generic verb
+    confidence: Scalar
+
+class Attribute(NamedTuple):
+    name: Scalar
+    value: Scalar
+
+class SemanticRecord(NamedTuple):
+    raw: Dict[str, Any]
+    concept_name: str
+    domain: str
+    description: str
+    concepts: Sequence[Concept]
+    relationships: Sequence[Relationship]
+    attributes: Sequence[Attribute]
+
+def _decode_concept(concept: Dict[str, Any]) -> Concept:
+    return Concept(
+        _text(concept, 'name') if concept.get('name') is not None else _text(concept, 'id', None),
+        _text(concept, 'definition') if concept.get('definition') is not None else _text(concept, 'description'),
+        _text(concept, 'type')
+    )
+
+def _decode_relationship(relationship: Dict[str, Any]) -> Relationship:
+    return Relationship(
+        _scalar(relationship, 'source'),
+        _scalar(relationship, 'target'),
+        _text(relationship, 'type') if relationship.get('type') is not None else _text(relationship, 'relation', None),
+        _scalar(relationship, 'confidence', 0)
+    )
+
+def _decode_attribute(attribute: Dict[str, Any]) -> Attribute:
+    return Attribute(
+        _scalar(attribute, 'name') if attribute.get('name') is not None else _scalar(attribute, 'attribute_name'),
+        _scalar(attribute, 'value') if attribute.get('value') is not None else _scalar(attribute, 'attribute_value')
+    )
+
+def _semantic_network(item: Dict[str, Any]) -> Sequence[Concept]:
+    return _objects(_object(item, 'memory_content'), 'concepts', _decode_concept, path="memory_content")
+
+def decode_semantic_network(item: Dict[str, Any]) -> Optional[SemanticRecord]:
+    """The concept network layout: memory_content.concepts names the concept; None for other layouts"""
+    
+    concepts = _semantic_network(item)
+    if not concepts:
+        return None
+    
+    memory_content = item['memory_content']
+    label = concepts[0].label
+    return SemanticRecord(
+        item,
+        label if label is not None else 'concept',
+        _text(item, 'domain', 'knowledge'),
+        _text(item, 'description'),
+        concepts,
+        _objects(memory_content, 'relationships', _decode_relationship, path="memory_content"),
+        _objects(memory_content, 'attributes', _decode_attribute, path="memory_content")
+    )
+
+def decode_semantic_concept(item: Dict[str, Any]) -> Optional[SemanticRecord]:
+    """The single concept layout: a concept object names the concept and its domain; None for other layouts"""
+    
+    if _semantic_network(item):
+        return None
+    
+    memory_content = _object(item, 'memory_content')
+    concept = _object(item, 'concept')
+    return SemanticRecord(
+        item,
+        _text(concept, 'name', 'concept', path="concept"),
+        _text(concept, 'domain', 'general', path="concept"),
+        _text(item, 'description'),
+        _NO_ITEMS,
+        _objects(memory_content, 'relationships', _decode_relationship, path="memory_content"),
+        _objects(memory_content, 'attributes', _decode_attribute, path="memory_content")
+    )
+
+class EpisodeEvent(NamedTuple):
+    description: str
+
+class EpisodicRecord(NamedTuple):
+    raw: Dict[str, Any]
+    scenario: str
+    setting: str
+    timeline: Sequence[EpisodeEvent]
+    has_outcome: bool
+    success: bool
+    lessons_learned: Sequence[str]
+
+def _decode_event(event: Dict[str, Any]) -> EpisodeEvent:
+    return EpisodeEvent(_text(event, 'description'))
+
+def decode_episodic(item: Dict[str, Any]) -> EpisodicRecord:
+    scenario = _object(item, 'scenario')
+    outcome = _object(item, 'outcome')
+    if scenario.get('description') is not None:
+        scenario_desc = _text(scenario, 'description', path="scenario")
+    else:
+        scenario_desc = _text(item, 'scenario_description', 'a research experience')
+    
+    # Only a missing flag means success; any value present counts by its truth
+    success = bool(outcome.get('success', True))
+    
+    return EpisodicRecord(
+        item,
+        scenario_desc,
+        _text(_object(item, 'context'), 'setting', path="context"),
+        _objects(item, 'timeline', _decode_event),
+        bool(outcome),
+        success,
+        _texts(outcome, 'lessons_learned', path="outcome")
+    )
+
+class ProcedureStep(NamedTuple):
+    description: Optional[str]  # description, else action; None renders as "Step <n>"
+    step_id: Scalar
+    expected_duration: Scalar
+    action: str
+    details: Sequence[str]
+
+class ProceduralRecord(NamedTuple):
+    raw: Dict[str, Any]
+    title: str
+    domain: str
+    description: str
+    steps: Sequence[ProcedureStep]
+    conditions: Sequence[str]
+    best_practices: Sequence[str]
+    common_pitfalls: Sequence[str]
+
+def _decode_procedure_step(step: Dict[str, Any]) -> ProcedureStep:
+    return ProcedureStep(
+        _text(step, 'description') if step.get('description') is not None else _text(step, 'action', None),
+        _scalar(step, 'step_id'),
+        _scalar(step, 'expected_duration'),
+        _text(step, 'action'),
+        _texts(step, 'details')
+    )
+
+def decode_procedural(item: Dict[str, Any]) -> ProceduralRecord:
+    memory_content = _object(item, 'memory_content')
+    return ProceduralRecord(
+        item,
+        _text(item, 'title', 'Procedural Knowledge'),
+        _text(item, 'domain', 'general'),
+        _text(item, 'description'),
+        _objects(memory_content, 'steps', _decode_procedure_step, path="memory_content"),
+        _texts(memory_content, 'conditions', path="memory_content"),
+        _texts(memory_content, 'best_practices', path="memory_content"),
+        _texts(memory_content, 'common_pitfalls', path="memory_content")
+    )
+
+class RealtimeRecord(NamedTuple):
+    raw: Dict[str, Any]
+    scenario: str
+    current_state: str
+    immediate_observations: Sequence[str]
+    immediate_adjustments: Sequence[str]
+    quick_wins: Sequence[str]
+    warning_signs: Sequence[str]
+
+def decode_realtime(item: Dict[str, Any]) -> RealtimeRecord:
+    return RealtimeRecord(
+        item,
+        _text(item, 'scenario_description', 'complex problem-solving'),
+        _text(_object(item, 'current_situation'), 'current_state', path="current_situation"),
+        _texts(item, 'immediate_observations'),
+        _texts(item, 'immediate_adjustments'),
+        _texts(item, 'quick_wins'),
+        _texts(item, 'warning_signs')
+    )
+
+class StrategyRecord(NamedTuple):
+    raw: Dict[str, Any]
+    scenario: str
+    timeframe: str
+    strategic_patterns: Sequence[str]
+    opportunities: Sequence[str]
+    risks: Sequence[str]
+    strategic_recommendations: Sequence[str]
+
+def decode_strategy(item: Dict[str, Any]) -> StrategyRecord:
+    return StrategyRecord(
+        item,
+        _text(item, 'scenario_description', 'strategic planning'),
+        _text(_object(item, 'strategic_context'), 'timeframe', path="strategic_context"),
+        _texts(item, 'strategic_patterns'),
+        _texts(item, 'opportunities'),
+        _texts(item, 'risks'),
+        _texts(item, 'strategic_recommendations')
+    )
+
+class DeepRecord(NamedTuple):
+    raw: Dict[str, Any]
+    scenario: str
+    core_issue: str
+    underlying_patterns: Sequence[str]
+    root_causes: Sequence[str]
+    long_term_implications: Sequence[str]
+    learning_insights: Sequence[str]
+    system_level_recommendations: Sequence[str]
+
+def decode_deep(item: Dict[str, Any]) -> DeepRecord:
+    return DeepRecord(
+        item,
+        _text(item, 'scenario_description', 'complex situation'),
+        _text(_object(item, 'fundamental_analysis'), 'core_issue', path="fundamental_analysis"),
+        _texts(item, 'underlying_patterns'),
+        _texts(item, 'root_causes'),
+        _texts(item, 'long_term_implications'),
+        _texts(item, 'learning_insights'),
+        _texts(item, 'system_level_recommendations')
+    )
+
+# Layout decoders of each data type, in detection order. A decoder returns
+# None for a record in another of its type's layouts and raises RecordError
+# for a record in its own layout that is malformed.
+RECORD_LAYOUTS: Dict[str, Dict[str, Callable[[Dict[str, Any]], Optional[NamedTuple]]]] = {
+    "cot": {"cot": decode_cot},
+    "semantic_memory": {"concept_network": decode_semantic_network, "single_concept": decode_semantic_concept},
+    "episodic_memory": {"episode": decode_episodic},
+    "procedural_memory": {"procedure": decode_procedural},
+    "realtime_reflection": {"realtime": decode_realtime},
+    "strategy_reflection": {"strategy": decode_strategy},
+    "deep_reflection": {"deep": decode_deep}
+}
+
+class RecordDecoder:
+    """Decode the records of one input file into typed records.
+    
+    The layout is detected from the first record and tried first for every
+    later one; a record in another of the data type's layouts (files may mix
+    them) is decoded by the layout it fits. decode raises RecordError with
+    the path of the first value that does not fit the schema.
+    """
+    
+    __slots__ = ("layouts", "layout", "_decode")
+    
+    def __init__(self, data_type: str):
+        self.layouts = RECORD_LAYOUTS[data_type]
+        self.layout = None
+        self._decode = None
+    
+    def decode(self, item: Any) -> NamedTuple:
+        if item.__class__ is not dict:
+            raise RecordError("", f"expected an object, got {_kind(item)}")
+        
+        if self._decode is not None:
+            record = self._decode(item)
+            if record is not None:
+                return record
+        
+        for layout, decode in self.layouts.items():
+            record = decode(item)
+            if record is not None:
+                if self._decode is None:
+                    self.layout, self._decode = layout, decode
+                return record
+        
+        raise RecordError("", f"matches none of the layouts {', '.join(self.layouts)}")
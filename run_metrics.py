@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Run Metrics
+Per-stage wall time, CPU time, record and byte counts and peak memory of a
+pipeline run, and a sampling profiler for hot code, recorded in
+conversion_info.json and dataset_info.json
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then not reported
+    resource = None
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class StageStats:
+    """Totals of one stage; the peak RSS is the highest seen by any process when it ran"""
+    
+    __slots__ = ("wall", "cpu", "records", "bytes_read", "bytes_written", "peak_rss")
+    
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.records = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss = None
+    
+    def note_memory(self):
+        peak = peak_rss_bytes()
+        if peak is not None:
+            self.peak_rss = max(self.peak_rss or 0, peak)
+    
+    def merge(self, other: "StageStats"):
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.records += other.records
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        if other.peak_rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, other.peak_rss)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wall_seconds": round(self.wall, 6),
+            "cpu_seconds": round(self.cpu, 6),
+            "records": self.records,
+            "records_per_sec": round(self.records / self.wall, 1) if self.wall > 0 else None,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_bytes": self.peak_rss
+        }
+
+class RunMetrics:
+    """Stage statistics of a run, accumulated by stage name.
+    
+    stage() times a block and timed() times the production of each item of
+    an iterator. Timed sections may nest (a stream read inside a stage, or one
+    timed iterator consuming another); every stage then gets its exclusive
+    time, without the time of the sections inside it. Hot per-record loops
+    measure their own wall time and report it with add() instead.
+    
+    Metrics of pool workers are merged into the parent's with merge(), so
+    with several workers a stage's time is summed over processes and can
+    exceed the elapsed time of the run.
+    """
+    
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self.samples = Counter()  # collapsed stack -> samples, from SamplingProfiler
+        self._active = []  # [name, wall start, cpu start, nested wall, nested cpu] per open section
+    
+    def get(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+    
+    def add(self, name: str, wall: float = 0.0, cpu: float = 0.0, records: int = 0,
+            bytes_read: int = 0, bytes_written: int = 0) -> StageStats:
+        stats = self.get(name)
+        stats.wall += wall
+        stats.cpu += cpu
+        stats.records += records
+        stats.bytes_read += bytes_read
+        stats.bytes_written += bytes_written
+        stats.note_memory()
+        return stats
+    
+    def _start(self, name: str):
+        self._active.append([name, time.perf_counter(), time.process_time(), 0.0, 0.0])
+    
+    def _stop(self) -> StageStats:
+        name, wall_start, cpu_start, nested_wall, nested_cpu = self._active.pop()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        if self._active:
+            self._active[-1][3] += wall
+            self._active[-1][4] += cpu
+        
+        stats = self.get(name)
+        stats.wall += wall - nested_wall
+        stats.cpu += cpu - nested_cpu
+        return stats
+    
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        """Time a block as stage name; the block may add records and bytes to the yielded stats"""
+        self._start(name)
+        try:
+            yield self.get(name)
+        finally:
+            self._stop().note_memory()
+    
+    def timed(self, items: Iterable[Any], name: str) -> Iterator[Any]:
+        """Pass items through, timing the work of producing each one as stage name"""
+        
+        iterator = iter(items)
+        while True:
+            self._start(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._stop().note_memory()
+                return
+            except BaseException:
+                self._stop()
+                raise
+            self._stop().records += 1
+            yield item
+    
+    def merge(self, other: "RunMetrics"):
+        for name, stats in other.stages.items():
+            self.get(name).merge(stats)
+        self.samples.update(other.samples)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: stats.to_dict() for name, stats in self.stages.items()}
+
+class LapTimer:
+    """Split the wall time of a hot loop between stages with one clock read per step.
+    
+    lap(name) charges the time since the previous lap (or restart) to stage
+    name; restart() after resuming from a yield leaves the consumer's time
+    out. Reading the CPU clock per step would cost several times as much, so
+    record() estimates each stage's CPU time from its wall time and the
+    process's CPU/wall ratio over the whole loop.
+    """
+    
+    __slots__ = ("times", "_last", "_wall_start", "_cpu_start")
+    
+    def __init__(self):
+        self.times = {}
+        self._wall_start = self._last = time.perf_counter()
+        self._cpu_start = time.process_time()
+    
+    def restart(self):
+        self._last = time.perf_counter()
+    
+    def lap(self, name: str):
+        now = time.perf_counter()
+        self.times[name] = self.times.get(name, 0.0) + now - self._last
+        self._last = now
+    
+    def record(self, metrics: RunMetrics, records: Dict[str, int] = None, bytes_read: Dict[str, int] = None):
+        """Add the lap times, with records and bytes read per stage, to metrics"""
+        
+        elapsed = time.perf_counter() - self._wall_start
+        cpu_ratio = (time.process_time() - self._cpu_start) / elapsed if elapsed > 0 else 0.0
+        for name, wall in self.times.items():
+            metrics.add(name, wall, wall * cpu_ratio, (records or {}).get(name, 0), (bytes_read or {}).get(name, 0))
+
+def print_stages(metrics: RunMetrics, elapsed: float = None):
+    """Console table of the stages, slowest first"""
+    
+    title = "\nStage timings" + (f" ({elapsed:.1f}s elapsed)" if elapsed is not None else "") + ":"
+    print(title)
+    for name, stats in sorted(metrics.stages.items(), key=lambda item: -item[1].wall):
+        rate = f"{stats.records / stats.wall:,.0f} records/sec" if stats.records and stats.wall > 0 else ""
+        print(f"  {name:<10} {stats.wall:8.2f}s wall {stats.cpu:8.2f}s CPU  {stats.records:>10,} records  {rate}")
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """Sample the calling thread's stack every interval seconds from a background thread.
+    
+    Samples are counted as collapsed stacks ("outer;...;inner"), the input
+    format of flamegraph.pl and speedscope. Sampling costs the profiled code
+    almost nothing, but a sample can only be taken when the interpreter
+    switches threads (every 5 ms by default), so shorter intervals add little.
+    """
+    
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._labels = {}
+        self._thread_id = None
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+    
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self._thread.join()
+        return self.samples
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+def top_functions(samples: Counter, count: int = 10) -> Dict[str, int]:
+    """Innermost functions with the most samples (self time)"""
+    
+    leaves = Counter()
+    for stack, hits in samples.items():
+        leaves[stack.rsplit(";", 1)[-1]] += hits
+    return dict(leaves.most_common(count))
+
+def write_collapsed_stacks(path: str, samples: Counter):
+    """Save samples as "stack count" lines for flame graph tools"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, hits in samples.most_common():
+            f.write(f"{stack} {hits}\n")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Single-Pass Record Sampling
+Picks a reproducible uniform or stratified sample of a consolidated input file
+in one streaming pass, as an alternative to keeping the first N records
+"""
+
+import hashlib
+import heapq
+import json
+import os
+from collections import Counter, defaultdict
+from typing import Dict, Any, Optional
+
+import json_backend
+from sharegpt_io import iter_input_records, record_bytes, write_json_atomic
+
+# "first" keeps today's first-N truncation
+SAMPLE_MODES = ("first", "uniform", "stratified")
+
+def _stratum_of(item: Any, stratify_by: str) -> str:
+    """Value of a dotted field path such as "domain" or "concept.domain", or "unknown" """
+    value = item
+    for key in stratify_by.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return "unknown"
+        value = value[key]
+    return str(value)
+
+def _allocate(sample_size: int, stratum_counts: Dict[str, int]) -> Dict[str, int]:
+    """Split sample_size across strata in proportion to their size (largest remainder)"""
+    total = sum(stratum_counts.values())
+    if total <= sample_size:
+        return dict(stratum_counts)
+    
+    quotas = {stratum: sample_size * count / total for stratum, count in stratum_counts.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    
+    # Hand out the remaining slots by largest fractional part, ties by name
+    remaining = sample_size - sum(allocation.values())
+    by_remainder = sorted(quotas, key=lambda stratum: (allocation[stratum] - quotas[stratum], stratum))
+    for stratum in by_remainder[:remaining]:
+        allocation[stratum] += 1
+    
+    return allocation
+
+def sample_records(input_file: str, sample_file: str, sample_size: int, seed: int = 42,
+                   stratify_by: Optional[str] = None) -> Dict[str, Any]:
+    """Write a sample of sample_size records from input_file to sample_file as JSONL
+    
+    Each record gets a 64-bit key from a hash of its content keyed with seed,
+    and the records with the smallest keys are kept (bottom-k sampling). That is
+    a uniform sample without replacement that depends only on the content and
+    the seed, not on record order. With stratify_by, every stratum keeps its own
+    bottom-k and the sample is split across strata in proportion to their size.
+    
+    Only the candidate heaps (sample_size keys per stratum) are held in memory;
+    candidate records are spilled to a temporary file and the selected ones are
+    copied to sample_file in their original order. Malformed records, lines
+    that are not valid JSON or not valid UTF-8, are counted and never selected.
+    """
+    
+    seed_key = str(seed).encode('utf-8')
+    heaps = defaultdict(list)  # stratum -> max-heap of (-key, spill_offset, spill_length)
+    stratum_counts = Counter()
+    malformed = 0
+    
+    spill_file = f"{sample_file}.spill"
+    with open(spill_file, 'wb') as spill:
+        for raw, item in iter_input_records(input_file):
+            if item is None:
+                try:
+                    item = json_backend.loads(raw)
+                except ValueError:  # JSONDecodeError, or UnicodeDecodeError for invalid UTF-8
+                    malformed += 1
+                    continue
+            
+            data = record_bytes(raw, item)
+            key = int.from_bytes(hashlib.blake2b(data, digest_size=8, key=seed_key).digest(), 'big')
+            stratum = _stratum_of(item, stratify_by) if stratify_by else "all"
+            stratum_counts[stratum] += 1
+            
+            heap = heaps[stratum]
+            if len(heap) < sample_size:
+                heapq.heappush(heap, (-key, spill.tell(), len(data)))
+            elif key < -heap[0][0]:
+                heapq.heapreplace(heap, (-key, spill.tell(), len(data)))
+            else:
+                continue
+            
+            spill.write(data + b"\n")
+    
+    allocation = _allocate(sample_size, stratum_counts)
+    
+    selected = []
+    for stratum, heap in heaps.items():
+        # Largest -key first is the smallest key first
+        selected.extend((offset, length) for _, offset, length in heapq.nlargest(allocation[stratum], heap))
+    selected.sort()
+    
+    tmp_file = f"{sample_file}.tmp"
+    with open(spill_file, 'rb') as spill, open(tmp_file, 'wb') as out:
+        for offset, length in selected:
+            spill.seek(offset)
+            out.write(spill.read(length) + b"\n")
+    os.replace(tmp_file, sample_file)
+    os.remove(spill_file)
+    
+    return {
+        "records_seen": sum(stratum_counts.values()),
+        "malformed": malformed,
+        "selected": len(selected),
+        "strata": {
+            stratum: {"records": stratum_counts[stratum], "selected": allocation[stratum]}
+            for stratum in sorted(stratum_counts)
+        } if stratify_by else {}
+    }
+
+def build_sample(input_file: str, sample_file: str, sample_size: int, mode: str, seed: int = 42,
+                 stratify_by: Optional[str] = None) -> Dict[str, Any]:
+    """Create sample_file for the given mode, reusing it if the input and settings are unchanged
+    
+    Returns the sampling summary; "reused" is True when the existing sample was kept.
+    """
+    
+    if mode not in SAMPLE_MODES[1:]:
+        raise ValueError(f"Unknown sample mode: {mode}")
+    
+    stat = os.stat(input_file)
+    settings = {
+        "input_file": os.path.abspath(input_file),
+        "input_size": stat.st_size,
+        "input_mtime": stat.st_mtime,
+        "sample_size": sample_size,
+        "mode": mode,
+        "seed": seed,
+        "stratify_by": stratify_by if mode == "stratified" else None
+    }
+    
+    meta_file = f"{sample_file}.meta.json"
+    if os.path.exists(sample_file) and os.path.exists(meta_file):
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("settings") == settings:
+            return {**meta["summary"], "reused": True}
+    
+    summary = sample_records(input_file, sample_file, sample_size, seed, settings["stratify_by"])
+    write_json_atomic(meta_file, {"settings": settings, "summary": summary})
+    return {**summary, "reused": False}
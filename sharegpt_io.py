@@ -0,0 +1,1028 @@
+#!/usr/bin/env python3
+"""
+ShareGPT File I/O Helpers
+Streaming writers and readers shared by the conversion and dataset scripts
+"""
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+from array import array
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, TextIO, Tuple
+
+import json_backend
+
+try:
+    import zstandard
+except ImportError:  # only needed for the jsonl.zst format
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the parquet format
+    pa = pq = None
+
+# Supported on-disk layouts for converted conversations
+OUTPUT_FORMATS = ("json", "jsonl", "jsonl.zst", "parquet")
+
+# Formats written as a directory of compressed shards plus a manifest
+SHARD_FORMATS = ("jsonl.zst", "parquet")
+SHARD_MANIFEST = "manifest.json"
+SHARD_VERSION = 1
+
+# zstd level for jsonl.zst shards; higher levels gain little once the shared
+# strings are dictionary-encoded
+ZSTD_LEVEL = 6
+
+# Extensions a ShareGPT file or shard directory may have, in lookup order
+SHAREGPT_SUFFIXES = (".json", ".jsonl", ".jsonl.zst", ".parquet")
+
+# Sidecars that must not sit next to their files: loaders such as HF datasets
+# pick split files out of a directory by name and would read them as data
+SIDECAR_DIR = "sidecar_cache"
+
+def require_format_support(output_format: str):
+    """Raise RuntimeError if the optional package an output format needs is missing"""
+    
+    if output_format == "jsonl.zst" and zstandard is None:
+        raise RuntimeError("The jsonl.zst format needs the zstandard package (pip install zstandard)")
+    if output_format == "parquet" and pq is None:
+        raise RuntimeError("The parquet format needs the pyarrow package (pip install pyarrow)")
+
+def sidecar_path(filepath: str, suffix: str) -> str:
+    """Where the sidecar of filepath with suffix is kept, under SIDECAR_DIR
+    
+    Sidecars are grouped per directory of filepath, in a folder named after
+    it and a hash of its absolute path so that equally named directories do
+    not share one.
+    """
+    
+    directory = os.path.dirname(os.path.abspath(filepath))
+    tag = hashlib.blake2b(directory.encode('utf-8'), digest_size=4).hexdigest()
+    return os.path.join(SIDECAR_DIR, f"{os.path.basename(directory)}-{tag}", os.path.basename(filepath) + suffix)
+
+def find_sharegpt_file(base_path: str) -> Optional[str]:
+    """First existing ShareGPT file or shard directory for base_path given without extension"""
+    
+    for suffix in SHAREGPT_SUFFIXES:
+        if os.path.exists(base_path + suffix):
+            return base_path + suffix
+    return None
+
+def output_path_for_format(output_file: str, output_format: str) -> str:
+    """Return output_file with the extension matching the output format"""
+    
+    root, _ = os.path.splitext(output_file)
+    return f"{root}.{output_format}"
+
+def encode_conversation(conversation: Dict[str, Any], output_format: str) -> str:
+    """Serialize a single conversation for the given output format
+    
+    Shard formats take the compact JSONL form and re-encode it when writing.
+    Encoding goes through the selected JSON backend (see json_backend).
+    """
+    
+    if output_format != "json":
+        return json_backend.dumps(conversation)
+    
+    # Same layout as an element of json.dump(list, indent=2)
+    return "  " + json_backend.dumps_indented(conversation).replace("\n", "\n  ")
+
+def partial_path(output_file: str) -> str:
+    """Temporary file (or shard directory) a writer streams into before it is moved into place"""
+    return f"{output_file}.tmp"
+
+class ShareGPTWriter:
+    """Write conversations to disk as soon as they are converted.
+    
+    The "json" format produces the same bytes as json.dump(conversations, indent=2)
+    and the "jsonl" format writes one compact conversation per line. At most
+    buffer_size encoded conversations are held in memory at any time. Output goes
+    to a temporary file that only replaces output_file on close, and nothing is
+    left behind when no conversation was written unless keep_empty is set.
+    
+    checkpoint() makes everything written so far durable and returns the byte
+    offset of the temporary file; passing that offset and the count back as
+    resume_offset/resume_count continues the same partial file after a crash.
+    
+    With index, the byte offset of every conversation is noted as it is
+    written and saved as the file's index sidecar on close (see write_index).
+    A resumed file has its offsets scanned again instead.
+    """
+    
+    def __init__(self, output_file: str, output_format: str = "json", buffer_size: int = 256,
+                 resume_offset: int = None, resume_count: int = 0, keep_empty: bool = False,
+                 index: bool = True):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        
+        self.output_file = output_file
+        self.output_format = output_format
+        self.buffer_size = buffer_size
+        self.keep_empty = keep_empty
+        self.index = index
+        self.count = 0
+        
+        self._buffer = []
+        self._tmp_file = partial_path(output_file)
+        self._position = resume_offset or 0
+        # Offsets of the records before a resume point are not known
+        self._offsets = array('Q') if index and resume_offset is None else None
+        
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        if resume_offset is None:
+            self._f = open(self._tmp_file, 'wb')
+        else:
+            # Drop anything written after the last checkpoint
+            self._f = open(self._tmp_file, 'r+b')
+            self._f.truncate(resume_offset)
+            self._f.seek(resume_offset)
+            self.count = resume_count
+    
+    def write(self, conversation: Dict[str, Any]):
+        """Encode and queue one conversation"""
+        self.write_encoded(encode_conversation(conversation, self.output_format))
+    
+    def write_encoded(self, text: str):
+        """Queue one conversation already produced by encode_conversation"""
+        self._buffer.append(text)
+        self.count += 1
+        
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+    
+    def flush(self):
+        """Write buffered conversations to the temporary file"""
+        if not self._buffer:
+            return
+        
+        items = [text.encode('utf-8') for text in self._buffer]
+        if self.output_format == "jsonl":
+            prefix, separator = b"", b"\n"
+            data = separator.join(items) + separator
+        else:
+            # Opening bracket before the first element, comma before the rest
+            prefix = b"[\n" if self.count == len(self._buffer) else b",\n"
+            separator = b",\n"
+            data = prefix + separator.join(items)
+        
+        if self._offsets is not None:
+            position = self._position + len(prefix)
+            for item in items:
+                # Point at the value itself, past the indentation of the json format
+                self._offsets.append(position + _WHITESPACE_BYTES.match(item).end())
+                position += len(item) + len(separator)
+        
+        self._f.write(data)
+        self._position += len(data)
+        self._buffer = []
+    
+    def checkpoint(self) -> int:
+        """Flush and fsync the temporary file, returning its durable length in bytes"""
+        self.flush()
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return self._f.tell()
+    
+    def close(self) -> int:
+        """Finish the file and move it into place, returning the conversation count"""
+        self.flush()
+        end = self._position
+        
+        if self.output_format == "json":
+            if self.count:
+                self._f.write(b"\n]")
+            elif self.keep_empty:
+                self._f.write(b"[]")
+        self._f.close()
+        
+        if not (self.count or self.keep_empty):
+            os.remove(self._tmp_file)
+            return self.count
+        
+        os.replace(self._tmp_file, self.output_file)
+        if self._offsets is not None:
+            write_index(self.output_file, self._offsets, end)
+        elif self.index:
+            build_index(self.output_file)
+        
+        return self.count
+    
+    def abort(self):
+        """Discard everything written so far"""
+        self._buffer = []
+        self._f.close()
+        if os.path.exists(self._tmp_file):
+            os.remove(self._tmp_file)
+    
+    def release(self):
+        """Close the temporary file as it is, for a later run to resume from its last checkpoint"""
+        self._buffer = []
+        self._f.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def _check_fields(conversation: Dict[str, Any]):
+    """Compressed formats store messages and data_source only; refuse to drop anything else"""
+    
+    extra = set(conversation) - {"messages", "data_source"}
+    if extra:
+        raise ValueError(f"Cannot store conversation fields {sorted(extra)} in a compressed format")
+
+class StringDictionary:
+    """Append-only table mapping repeated strings to small integer ids"""
+    
+    def __init__(self, values: List[str] = ()):
+        self.values = list(values)
+        self._ids = {value: index for index, value in enumerate(self.values)}
+    
+    def encode(self, value: str) -> int:
+        index = self._ids.get(value)
+        if index is None:
+            index = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+def _dictionary_row(conversation: Dict[str, Any], dictionary: StringDictionary) -> Dict[str, Any]:
+    """Compact row of a conversation: roles, data_source and system prompts become dictionary ids"""
+    
+    _check_fields(conversation)
+    row = {"m": [
+        [dictionary.encode(message['role']),
+         dictionary.encode(message['content']) if message['role'] == 'system' else message['content']]
+        for message in conversation.get('messages') or []
+    ]}
+    if 'data_source' in conversation:
+        row["d"] = dictionary.encode(conversation['data_source'])
+    return row
+
+def _conversation_from_dictionary_row(row: Dict[str, Any], values: List[str]) -> Dict[str, Any]:
+    conversation = {"messages": [
+        {"role": values[role], "content": values[content] if isinstance(content, int) else content}
+        for role, content in row["m"]
+    ]}
+    if "d" in row:
+        conversation['data_source'] = values[row["d"]]
+    return conversation
+
+def _parquet_schema(split_system: bool):
+    message = pa.struct([("role", pa.string()), ("content", pa.string())])
+    fields = [("messages", pa.list_(message))]
+    if split_system:
+        fields.append(("system", pa.string()))
+    fields.append(("data_source", pa.string()))
+    return pa.schema(fields)
+
+def _parquet_row(conversation: Dict[str, Any], split_system: bool) -> Dict[str, Any]:
+    _check_fields(conversation)
+    messages = conversation.get('messages') or []
+    row = {}
+    if split_system:
+        row["system"] = None
+        if messages and messages[0].get('role') == 'system':
+            row["system"] = messages[0]['content']
+            messages = messages[1:]
+    row["messages"] = messages
+    row["data_source"] = conversation.get('data_source')
+    return row
+
+def _conversation_from_parquet_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    messages = row["messages"] or []
+    system = row.get("system")
+    if system is not None:
+        messages = [{"role": "system", "content": system}] + messages
+    conversation = {"messages": messages}
+    if row["data_source"] is not None:
+        conversation['data_source'] = row["data_source"]
+    return conversation
+
+def _fsync_path(path: str):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+class ParquetFileWriter:
+    """Write conversations to one zstd-compressed Parquet file, a row per conversation.
+    
+    Columns are messages (a list of role/content structs) and data_source,
+    and Parquet dictionary-encodes the repeated role and data_source values.
+    With split_system the leading system message moves to a dictionary-encoded
+    system column of its own, so a shared prompt is stored once per row group;
+    without it the file is plain ShareGPT that datasets and Axolotl can load.
+    As with ShareGPTWriter, output goes to a temporary file moved into place
+    on close.
+    """
+    
+    def __init__(self, output_file: str, split_system: bool = False, row_group_size: int = 1024,
+                 keep_empty: bool = False):
+        require_format_support("parquet")
+        
+        self.output_file = output_file
+        self.split_system = split_system
+        self.row_group_size = row_group_size
+        self.keep_empty = keep_empty
+        self.count = 0
+        
+        self._rows = []
+        self._schema = _parquet_schema(split_system)
+        self._tmp_file = partial_path(output_file)
+        
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._writer = pq.ParquetWriter(self._tmp_file, self._schema, compression="zstd")
+    
+    def write(self, conversation: Dict[str, Any]):
+        """Queue one conversation, writing a row group every row_group_size"""
+        self._rows.append(_parquet_row(conversation, self.split_system))
+        self.count += 1
+        
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+    
+    def write_encoded(self, text: str):
+        """Queue one conversation produced by encode_conversation"""
+        self.write(json_backend.loads(text))
+    
+    def flush(self):
+        if not self._rows:
+            return
+        self._writer.write_table(pa.Table.from_pylist(self._rows, schema=self._schema))
+        self._rows = []
+    
+    def close(self) -> int:
+        """Finish the file and move it into place, returning the conversation count"""
+        self.flush()
+        self._writer.close()
+        
+        if self.count or self.keep_empty:
+            os.replace(self._tmp_file, self.output_file)
+        else:
+            os.remove(self._tmp_file)
+        
+        return self.count
+    
+    def abort(self):
+        """Discard everything written so far"""
+        self._rows = []
+        self._writer.close()
+        if os.path.exists(self._tmp_file):
+            os.remove(self._tmp_file)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+class ZstdJsonlWriter:
+    """Write dictionary-encoded conversation rows as one zstd-compressed JSONL frame.
+    
+    Each line is a compact row ({"m": [[role, content], ...], "d": data_source})
+    in which roles, data_source and system prompts are ids into dictionary; the
+    dictionary itself is stored by the caller, in the shard manifest.
+    """
+    
+    def __init__(self, output_file: str, dictionary: StringDictionary, buffer_size: int = 256):
+        require_format_support("jsonl.zst")
+        
+        self.output_file = output_file
+        self.dictionary = dictionary
+        self.buffer_size = buffer_size
+        self.count = 0
+        
+        self._buffer = []
+        self._tmp_file = partial_path(output_file)
+        self._f = open(self._tmp_file, 'wb')
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    
+    def write(self, conversation: Dict[str, Any]):
+        self._buffer.append(json_backend.dumps(_dictionary_row(conversation, self.dictionary)))
+        self.count += 1
+        
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+    
+    def write_encoded(self, text: str):
+        self.write(json_backend.loads(text))
+    
+    def flush(self):
+        if not self._buffer:
+            return
+        self._f.write(self._compressor.compress(("\n".join(self._buffer) + "\n").encode('utf-8')))
+        self._buffer = []
+    
+    def close(self) -> int:
+        self.flush()
+        self._f.write(self._compressor.flush())
+        self._f.close()
+        os.replace(self._tmp_file, self.output_file)
+        return self.count
+    
+    def abort(self):
+        self._buffer = []
+        self._f.close()
+        if os.path.exists(self._tmp_file):
+            os.remove(self._tmp_file)
+
+class ShardWriter:
+    """Write conversations as a directory of compressed shards plus a manifest.
+    
+    "jsonl.zst" shards are ZstdJsonlWriter files sharing the string dictionary
+    kept in the manifest; "parquet" shards are ParquetFileWriter files with the
+    system prompt in its own column. Either way the conversations come back
+    unchanged from iter_sharegpt_file. A shard is closed every shard_size
+    conversations and at every checkpoint(), which returns the total size of
+    the closed shards; passing that and the count back as
+    resume_offset/resume_count continues the partial directory after a crash,
+    as with ShareGPTWriter. The directory replaces output_file on close.
+    """
+    
+    def __init__(self, output_file: str, output_format: str, shard_size: int = 100_000,
+                 resume_offset: int = None, resume_count: int = 0, keep_empty: bool = False):
+        if output_format not in SHARD_FORMATS:
+            raise ValueError(f"Unknown shard format: {output_format}")
+        require_format_support(output_format)
+        
+        self.output_file = output_file
+        self.output_format = output_format
+        self.shard_size = shard_size
+        self.keep_empty = keep_empty
+        self.count = 0
+        self.shards = []  # manifest entries of the closed shards
+        self.dictionary = StringDictionary()
+        
+        self._shard = None
+        self._json_bytes = 0  # approximate JSONL size of the current shard
+        self._tmp_dir = partial_path(output_file)
+        
+        if resume_offset is None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            os.makedirs(self._tmp_dir)
+            return
+        
+        # Keep the shards closed by the checkpoint and drop any written after it
+        manifest = read_shard_manifest(self._tmp_dir)
+        size = 0
+        for entry in manifest["shards"]:
+            if size + entry["bytes"] > resume_offset:
+                break
+            size += entry["bytes"]
+            self.shards.append(entry)
+        # Ids are only ever appended, so a later dictionary still decodes earlier shards
+        self.dictionary = StringDictionary(manifest["dictionary"])
+        self.count = resume_count
+        
+        kept = {entry["file"] for entry in self.shards} | {SHARD_MANIFEST}
+        for name in os.listdir(self._tmp_dir):
+            if name not in kept:
+                os.remove(os.path.join(self._tmp_dir, name))
+    
+    def write(self, conversation: Dict[str, Any]):
+        """Add one conversation to the current shard"""
+        self.write_encoded(encode_conversation(conversation, "jsonl"))
+    
+    def write_encoded(self, text: str):
+        """Add one conversation produced by encode_conversation"""
+        
+        if self._shard is None:
+            name = f"shard-{len(self.shards):05d}.{self.output_format}"
+            path = os.path.join(self._tmp_dir, name)
+            if self.output_format == "parquet":
+                self._shard = ParquetFileWriter(path, split_system=True)
+            else:
+                self._shard = ZstdJsonlWriter(path, self.dictionary)
+            self._json_bytes = 0
+        
+        self._shard.write(json_backend.loads(text))
+        self._json_bytes += len(text) + 1
+        self.count += 1
+        
+        if self._shard.count >= self.shard_size:
+            self._close_shard()
+    
+    def _close_shard(self):
+        if self._shard is None:
+            return
+        
+        shard, self._shard = self._shard, None
+        records = shard.close()
+        _fsync_path(shard.output_file)
+        self.shards.append({
+            "file": os.path.basename(shard.output_file),
+            "records": records,
+            "bytes": os.path.getsize(shard.output_file),
+            "json_bytes": self._json_bytes
+        })
+    
+    def _write_manifest(self):
+        write_json_atomic(os.path.join(self._tmp_dir, SHARD_MANIFEST), {
+            "version": SHARD_VERSION,
+            "format": self.output_format,
+            "records": self.count,
+            "dictionary": self.dictionary.values,
+            "shards": self.shards,
+            "updated": datetime.now().isoformat()
+        })
+    
+    def checkpoint(self) -> int:
+        """Close the current shard and save the manifest, returning the size of all closed shards"""
+        self._close_shard()
+        self._write_manifest()
+        return sum(entry["bytes"] for entry in self.shards)
+    
+    def close(self) -> int:
+        """Finish the directory and move it into place, returning the conversation count"""
+        self._close_shard()
+        self._write_manifest()
+        
+        if self.count or self.keep_empty:
+            if os.path.isdir(self.output_file):
+                shutil.rmtree(self.output_file)
+            os.replace(self._tmp_dir, self.output_file)
+        else:
+            shutil.rmtree(self._tmp_dir)
+        
+        return self.count
+    
+    def abort(self):
+        """Discard everything written so far"""
+        if self._shard is not None:
+            self._shard.abort()
+            self._shard = None
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+    
+    def release(self):
+        """Drop the open shard and keep the directory, for a later run to resume from its last checkpoint"""
+        if self._shard is not None:
+            self._shard.abort()
+            self._shard = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def open_writer(output_file: str, output_format: str, **kwargs):
+    """ShareGPTWriter for the plain JSON formats, ShardWriter for the compressed ones"""
+    
+    if output_format in SHARD_FORMATS:
+        return ShardWriter(output_file, output_format, **kwargs)
+    return ShareGPTWriter(output_file, output_format, **kwargs)
+
+def path_size(path: str) -> int:
+    """Size in bytes of a file, or of every file in a shard directory"""
+    
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def json_size(path: str) -> int:
+    """Approximate size of a ShareGPT file's conversations once loaded as JSON
+    
+    The same as path_size except for shard directories, whose manifest keeps
+    the uncompressed size of each shard.
+    """
+    
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(entry["json_bytes"] for entry in read_shard_manifest(path)["shards"])
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+def iter_json_array(f: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the items of a top-level JSON array one at a time.
+    
+    The file is read in chunks and consumed text is dropped as soon as an item
+    has been decoded, so memory is bounded by the largest single item and the
+    first item is available without reading the rest of the file. A top-level
+    value that is not an array is yielded as a single item. Malformed input
+    raises json.JSONDecodeError when it is reached.
+    """
+    
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    
+    def read_more(size: int):
+        nonlocal buf, pos, eof
+        chunk = f.read(size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+    
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                return
+            read_more(chunk_size)
+    
+    def decode_value() -> Any:
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Grow geometrically so one large item is not re-scanned per chunk
+                read_more(max(chunk_size, len(buf) - pos))
+                continue
+            
+            # A number cut off by the chunk boundary (e.g. "2." of "2.5e10") decodes early
+            truncated = end == len(buf) or (buf[pos] not in '{["' and buf[end] in _NUMBER_CHARS)
+            if truncated and not eof:
+                read_more(chunk_size)
+                continue
+            
+            pos = end
+            return value
+    
+    skip_whitespace()
+    if pos >= len(buf):
+        raise json.JSONDecodeError("Expecting value", buf, pos)
+    
+    if buf[pos] != '[':
+        yield decode_value()
+        return
+    
+    pos += 1
+    skip_whitespace()
+    if pos < len(buf) and buf[pos] == ']':
+        return
+    
+    while True:
+        skip_whitespace()
+        yield decode_value()
+        
+        skip_whitespace()
+        if pos >= len(buf):
+            raise json.JSONDecodeError("Unterminated array", buf, pos)
+        if buf[pos] == ']':
+            return
+        if buf[pos] != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+        pos += 1
+
+# Strings (with escapes) are matched whole so brackets inside them are skipped
+_JSON_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+_WHITESPACE_BYTES = re.compile(rb'[ \t\n\r]*')
+
+def plan_jsonl_chunks(input_file: str, chunk_bytes: int, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) byte ranges of about chunk_bytes that end on a line boundary
+    
+    start must itself be a line boundary, such as the end of an earlier range.
+    """
+    
+    with open(input_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        while start < size:
+            f.seek(min(start + chunk_bytes, size) - 1)
+            f.readline()
+            end = f.tell()
+            yield start, end
+            start = end
+
+def plan_json_array_chunks(input_file: str, chunk_bytes: int, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) byte ranges of about chunk_bytes holding whole top-level array items.
+    
+    Ranges are cut right after an item closes at depth 1, so each range holds a
+    comma-separated run of complete items that load_json_array_range can parse
+    on its own. A top-level value that is not an array becomes a single range.
+    A non-zero start must be the end of an earlier range.
+    """
+    
+    with open(input_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise json.JSONDecodeError("Expecting value", "", 0)
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if start == 0:
+                first = _WHITESPACE_BYTES.match(mm).end()
+                if first >= size:
+                    raise json.JSONDecodeError("Expecting value", "", first)
+                if mm[first] != ord('['):
+                    yield first, size
+                    return
+                start = first + 1
+            
+            depth = 1
+            for match in _JSON_TOKEN.finditer(mm, start):
+                char = mm[match.start()]
+                if char == ord('"'):
+                    continue
+                if char in (ord('['), ord('{')):
+                    depth += 1
+                    continue
+                
+                depth -= 1
+                if depth == 0:
+                    yield start, match.start()
+                    return
+                if depth == 1 and match.end() - start >= chunk_bytes:
+                    yield start, match.end()
+                    start = match.end()
+            
+            # Unterminated array, parsing the last range reports the error
+            yield start, size
+
+def plan_input_chunks(input_file: str, chunk_bytes: int, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """Split a .json array or .jsonl input into byte ranges of whole records"""
+    
+    if input_file.endswith('.json'):
+        return plan_json_array_chunks(input_file, chunk_bytes, start)
+    return plan_jsonl_chunks(input_file, chunk_bytes, start)
+
+# Index sidecar: header, then records + 1 little-endian uint64 offsets where
+# record i spans [offsets[i], offsets[i + 1]) up to trailing separators
+INDEX_MAGIC = b"SGPTIDX1"
+_INDEX_HEADER = struct.Struct('<8sQQQ')  # magic, file size, file mtime_ns, records
+
+def index_path(filepath: str) -> str:
+    """Record offset index of a ShareGPT file, kept out of its directory"""
+    return sidecar_path(filepath, ".idx")
+
+def write_index(filepath: str, offsets: array, end: int):
+    """Save the start offsets of the records of filepath and the end of the last one
+    
+    The size and modification time of filepath are stored with the offsets so
+    an index left over from an earlier version of the file is not used.
+    """
+    
+    stat = os.stat(filepath)
+    os.makedirs(os.path.dirname(index_path(filepath)), exist_ok=True)
+    tmp_path = f"{index_path(filepath)}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets)))
+        offsets.tofile(f)
+        array('Q', [end]).tofile(f)
+    os.replace(tmp_path, index_path(filepath))
+
+def load_index(filepath: str) -> Optional[array]:
+    """The records + 1 offsets of filepath, or None if it has no current index"""
+    
+    sidecar = index_path(filepath)
+    if not os.path.exists(sidecar):
+        return None
+    
+    stat = os.stat(filepath)
+    with open(sidecar, 'rb') as f:
+        header = f.read(_INDEX_HEADER.size)
+        if len(header) < _INDEX_HEADER.size:
+            return None
+        magic, size, mtime_ns, records = _INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            return None
+        
+        offsets = array('Q')
+        try:
+            offsets.fromfile(f, records + 1)
+        except EOFError:
+            return None
+    return offsets
+
+def scan_record_offsets(filepath: str) -> Tuple[array, int]:
+    """Start offsets of the records of a .json array or .jsonl file and the end of the last one
+    
+    Array items are found with the same bracket scan as plan_json_array_chunks;
+    items must be objects, arrays or strings, as ShareGPT conversations are.
+    """
+    
+    offsets = array('Q')
+    
+    if not filepath.endswith('.json'):
+        position = 0
+        end = 0
+        with open(filepath, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(position)
+                    end = position + len(line)
+                position += len(line)
+        return offsets, end
+    
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return offsets, 0
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            first = _WHITESPACE_BYTES.match(mm).end()
+            if first >= len(mm) or mm[first] != ord('['):
+                # A single top-level value is one record
+                offsets.append(first)
+                return offsets, len(mm)
+            
+            depth = 1
+            end = first + 1
+            for match in _JSON_TOKEN.finditer(mm, first + 1):
+                char = mm[match.start()]
+                if depth == 1 and char in (ord('"'), ord('['), ord('{')):
+                    offsets.append(match.start())
+                if char == ord('"'):
+                    if depth == 1:
+                        end = match.end()
+                    continue
+                if char in (ord('['), ord('{')):
+                    depth += 1
+                    continue
+                
+                depth -= 1
+                if depth == 0:
+                    break
+                if depth == 1:
+                    end = match.end()
+            return offsets, end
+
+def build_index(filepath: str) -> array:
+    """Scan filepath, save its index sidecar and return the records + 1 offsets"""
+    
+    offsets, end = scan_record_offsets(filepath)
+    write_index(filepath, offsets, end)
+    offsets.append(end)
+    return offsets
+
+def load_json_array_range(input_file: str, start: int, end: int) -> List[Any]:
+    """Parse the array items in a byte range produced by plan_json_array_chunks"""
+    
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    return parse_json_array_chunk(data)
+
+def parse_json_array_chunk(data: bytes) -> List[Any]:
+    """Parse the array items in the bytes of a range produced by plan_json_array_chunks"""
+    
+    data = data.lstrip()
+    if data.startswith(b','):
+        data = data[1:]
+    return json_backend.loads(b'[' + data + b']')
+
+def iter_jsonl_range(input_file: str, start: int = 0, end: int = None) -> Iterator[bytes]:
+    """Yield the raw lines of a JSONL file that start inside [start, end)"""
+    
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line
+
+# Built once: json.dumps with non-default options constructs a new encoder per call.
+# Always the standard library, whatever the JSON backend: record hashes pick the
+# answer templates, so they must not depend on which encoder is installed.
+_CANONICAL_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(',', ':'), check_circular=False)
+
+def canonical_json(item: Any) -> str:
+    """Serialize a record with sorted keys so equal records hash equally"""
+    return _CANONICAL_ENCODER.encode(item)
+
+def record_bytes(raw: Optional[bytes], item: Any) -> bytes:
+    """Bytes identifying a record: its raw JSONL line, or canonical JSON for array items"""
+    return raw.strip() if raw is not None else canonical_json(item).encode('utf-8')
+
+def iter_input_records(input_file: str, start: int = 0, end: int = None) -> Iterator[Tuple[Optional[bytes], Any]]:
+    """Yield (raw_line, item) for each record, optionally limited to a byte range
+    
+    JSONL records come back undecoded (item is None) so callers can skip
+    parsing when the raw line is enough; JSON array items come back decoded
+    with no raw line.
+    """
+    
+    if input_file.endswith('.json'):
+        if end is None:
+            with open(input_file, 'r', encoding='utf-8') as f:
+                for item in iter_json_array(f):
+                    yield None, item
+        else:
+            for item in load_json_array_range(input_file, start, end):
+                yield None, item
+    else:
+        for line in iter_jsonl_range(input_file, start, end):
+            yield line, None
+
+def iter_chunk_records(data: bytes, is_json: bool) -> Iterator[Tuple[Optional[bytes], Any]]:
+    """Yield (raw_line, item) for each record of a byte-range chunk already read into memory
+    
+    The records are the same as iter_input_records gives for that range of the file.
+    """
+    
+    if is_json:
+        for item in parse_json_array_chunk(data):
+            yield None, item
+    else:
+        # Split on newlines only, as reading the file line by line does
+        for line in io.BytesIO(data):
+            yield line, None
+
+def write_json_atomic(path: str, data: Any):
+    """Write a small JSON document so readers see either the old or the new version"""
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_shard_manifest(shard_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(shard_dir, SHARD_MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def iter_parquet_file(filepath: str, batch_size: int = 1024) -> Iterator[Dict[str, Any]]:
+    """Yield conversations from a Parquet file written by ParquetFileWriter"""
+    
+    require_format_support("parquet")
+    for batch in pq.ParquetFile(filepath).iter_batches(batch_size=batch_size):
+        for row in batch.to_pylist():
+            yield _conversation_from_parquet_row(row)
+
+def iter_zstd_jsonl_file(filepath: str, values: List[str]) -> Iterator[Dict[str, Any]]:
+    """Yield conversations from a ZstdJsonlWriter file, decoding ids with the dictionary values"""
+    
+    require_format_support("jsonl.zst")
+    with open(filepath, 'rb') as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+        for line in io.TextIOWrapper(reader, encoding='utf-8'):
+            if line.strip():
+                yield _conversation_from_dictionary_row(json_backend.loads(line), values)
+
+def iter_shard_directory(shard_dir: str) -> Iterator[Dict[str, Any]]:
+    """Yield conversations from the shards of a ShardWriter directory in write order"""
+    
+    manifest = read_shard_manifest(shard_dir)
+    for entry in manifest["shards"]:
+        filepath = os.path.join(shard_dir, entry["file"])
+        if manifest["format"] == "parquet":
+            yield from iter_parquet_file(filepath)
+        else:
+            yield from iter_zstd_jsonl_file(filepath, manifest["dictionary"])
+
+def iter_sharegpt_file(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Yield conversations from a ShareGPT .json array, .jsonl or .parquet file or a shard directory"""
+    
+    if os.path.isdir(filepath):
+        yield from iter_shard_directory(filepath)
+        return
+    if str(filepath).endswith('.parquet'):
+        yield from iter_parquet_file(filepath)
+        return
+    
+    if str(filepath).endswith('.jsonl'):
+        with open(filepath, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json_backend.loads(line)
+        return
+    
+    with open(filepath, 'r', encoding='utf-8') as f:
+        yield from iter_json_array(f)
+
+def read_sharegpt_file(filepath: str) -> List[Dict[str, Any]]:
+    """All conversations of a ShareGPT file or shard directory
+    
+    A .json array is decoded in a single call instead of streamed item by
+    item, which is several times faster with the orjson backend.
+    """
+    
+    if os.path.isdir(filepath) or not str(filepath).endswith('.json'):
+        return list(iter_sharegpt_file(filepath))
+    
+    with open(filepath, 'rb') as f:
+        conversations = json_backend.loads(f.read())
+    # A top-level value that is not an array is a single conversation, as in iter_json_array
+    return conversations if isinstance(conversations, list) else [conversations]
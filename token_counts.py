@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Token Counts
+Counts Phi-4 tokens for every conversation in large tokenizer batches, keeps
+per-message counts in a persistent content-addressed cache and flags records
+longer than the training sequence length
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, Any, Iterable, List
+
+from sharegpt_io import find_sharegpt_file, iter_sharegpt_file, sidecar_path, write_json_atomic
+from dataset_stats import file_hash, file_signature, sidecar_is_current, LengthStats
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # Only needed when counts have to be computed
+    AutoTokenizer = None
+
+# Match phi4_axolotl_config_fixed.yml
+DEFAULT_TOKENIZER = "microsoft/Phi-4-reasoning-plus"
+DEFAULT_SEQUENCE_LEN = 4096
+DEFAULT_CACHE = "token_cache/token_counts.sqlite"
+
+# Bump when the rendering or the sidecar layout changes
+TOKEN_COUNTS_VERSION = 1
+
+def render_message(message: Dict[str, Any]) -> str:
+    """One message as the phi_3 chat template renders it for training"""
+    return f"<|{message['role']}|>\n{message['content']}<|end|>\n"
+
+def message_key(text: str) -> bytes:
+    """Content hash of a rendered message"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def token_counts_path(filepath: str) -> str:
+    """Sidecar with the per-conversation token counts of a ShareGPT file, kept out of its directory"""
+    return sidecar_path(filepath, ".tokens.json")
+
+class TokenCountCache:
+    """SQLite store of token counts per rendered message, shared by every file and run.
+    
+    Keys are 16-byte content hashes, so the system prompt and any message
+    repeated across files or splits are only tokenized once per tokenizer.
+    """
+    
+    def __init__(self, path: str, tokenizer_name: str):
+        self.path = path
+        self.tokenizer_name = tokenizer_name
+        
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS token_counts (
+                message_hash BLOB NOT NULL,
+                tokenizer TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (message_hash, tokenizer)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+    
+    def get_many(self, keys: List[bytes], batch_size: int = 500) -> Dict[bytes, int]:
+        """Return the cached counts of whichever keys are present"""
+        
+        found = {}
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT message_hash, tokens FROM token_counts WHERE tokenizer = ? AND message_hash IN ({placeholders})",
+                (self.tokenizer_name, *batch)
+            )
+            found.update(rows)
+        return found
+    
+    def put_many(self, counts: Dict[bytes, int]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO token_counts VALUES (?, ?, ?)",
+                [(key, self.tokenizer_name, tokens) for key, tokens in counts.items()]
+            )
+    
+    def close(self):
+        self._conn.close()
+
+def load_tokenizer(tokenizer_name: str):
+    """Load the fast tokenizer, preferring files already in the local cache"""
+    
+    if AutoTokenizer is None:
+        raise RuntimeError("transformers is not installed; run pip install -r requirements_training.txt")
+    
+    try:
+        return AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True, local_files_only=True)
+    except OSError:
+        return AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+
+class TokenCounter:
+    """Count tokens per message, tokenizing only messages missing from the cache.
+    
+    Messages are collected until batch_size distinct uncached messages are
+    pending and then tokenized in one call, which lets the fast tokenizer
+    spread the batch over all cores. The tokenizer is only loaded once a batch
+    actually needs it, so fully cached files work without transformers.
+    """
+    
+    def __init__(self, cache: TokenCountCache, batch_size: int = 2048):
+        self.cache = cache
+        self.batch_size = batch_size
+        self.hits = 0
+        self.tokenized = 0
+        
+        self._tokenizer = None
+        self._known = {}
+    
+    def _tokenize(self, texts: Dict[bytes, str]):
+        if self._tokenizer is None:
+            self._tokenizer = load_tokenizer(self.cache.tokenizer_name)
+        
+        keys = list(texts)
+        encoded = self._tokenizer([texts[key] for key in keys], add_special_tokens=False)["input_ids"]
+        counts = {key: len(ids) for key, ids in zip(keys, encoded)}
+        
+        self.cache.put_many(counts)
+        self._known.update(counts)
+        self.tokenized += len(counts)
+    
+    def _resolve(self, pending: Dict[bytes, str]):
+        """Fill _known for every pending message, from the cache or the tokenizer"""
+        
+        cached = self.cache.get_many([key for key in pending if key not in self._known])
+        self._known.update(cached)
+        self.hits += len(cached)
+        
+        missing = {key: text for key, text in pending.items() if key not in self._known}
+        if missing:
+            self._tokenize(missing)
+    
+    def count_conversations(self, conversations: Iterable[Dict[str, Any]]) -> List[int]:
+        """Total tokens of every conversation, in input order"""
+        
+        conversation_keys = []
+        pending = {}
+        
+        for conv in conversations:
+            keys = []
+            for message in conv.get('messages') or []:
+                text = render_message(message)
+                key = message_key(text)
+                keys.append(key)
+                if key not in self._known:
+                    pending[key] = text
+            conversation_keys.append(keys)
+            
+            if len(pending) >= self.batch_size:
+                self._resolve(pending)
+                pending = {}
+        
+        if pending:
+            self._resolve(pending)
+        
+        return [sum(self._known[key] for key in keys) for keys in conversation_keys]
+
+def file_token_counts(filepath: str, counter: TokenCounter,
+                      sequence_len: int = DEFAULT_SEQUENCE_LEN) -> Dict[str, Any]:
+    """Token counts of every conversation in a ShareGPT file, from its sidecar when current
+    
+    The sidecar is keyed by the file's signature or content hash (see
+    dataset_stats.sidecar_is_current) and the tokenizer. Records
+    longer than sequence_len are listed under "over_length".
+    """
+    
+    sidecar = token_counts_path(filepath)
+    
+    report = None
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        if (report.get("version") != TOKEN_COUNTS_VERSION or report.get("tokenizer") != counter.cache.tokenizer_name
+                or not sidecar_is_current(sidecar, report, filepath)):
+            report = None
+    
+    if report is None:
+        sources = []
+        
+        def track_sources(conversations):
+            for conv in conversations:
+                sources.append(conv.get('data_source', 'unknown'))
+                yield conv
+        
+        counts = counter.count_conversations(track_sources(iter_sharegpt_file(filepath)))
+        report = {
+            "version": TOKEN_COUNTS_VERSION,
+            "file": os.path.basename(filepath),
+            "file_hash": file_hash(filepath),
+            **file_signature(filepath),
+            "tokenizer": counter.cache.tokenizer_name,
+            "created": datetime.now().isoformat(),
+            "data_sources": sources,
+            "tokens": counts
+        }
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        write_json_atomic(sidecar, report)
+    
+    # Flagging is cheap, so a different sequence_len does not invalidate the sidecar
+    report["sequence_len"] = sequence_len
+    report["over_length"] = [
+        {"index": index, "data_source": source, "tokens": tokens}
+        for index, (source, tokens) in enumerate(zip(report["data_sources"], report["tokens"]))
+        if tokens > sequence_len
+    ]
+    return report
+
+def print_token_report(name: str, report: Dict[str, Any]):
+    """Print token length percentiles and over-length records of one file"""
+    
+    lengths = LengthStats()
+    for tokens in report["tokens"]:
+        lengths.add(tokens)
+    summary = lengths.summary()
+    
+    print(f"\n{name}: {summary['count']:,} conversations")
+    if not summary["count"]:
+        return
+    
+    p = summary["percentiles"]
+    print(f"  Tokens: mean {summary['mean']:.0f}, p50 {p['p50']:,}, p95 {p['p95']:,}, "
+          f"p99 {p['p99']:,}, max {summary['max']:,}")
+    
+    over_length = report["over_length"]
+    if over_length:
+        print(f"  ⚠ {len(over_length):,} conversations exceed {report['sequence_len']:,} tokens and will be truncated")
+        for record in over_length[:5]:
+            print(f"    #{record['index']} ({record['data_source']}): {record['tokens']:,} tokens")
+    else:
+        print(f"  ✓ All conversations fit in {report['sequence_len']:,} tokens")
+
+def main():
+    parser = argparse.ArgumentParser(description="Count tokens of ShareGPT conversations")
+    parser.add_argument("files", nargs="*",
+                        help="ShareGPT .json, .jsonl or .parquet files or shard directories "
+                             "(default: the final dataset splits)")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER,
+                        help="Tokenizer name or local path (default: %(default)s)")
+    parser.add_argument("--sequence-len", type=int, default=DEFAULT_SEQUENCE_LEN,
+                        help="Flag conversations longer than this many tokens (default: %(default)s)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE,
+                        help="Token count cache database (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=2048,
+                        help="Messages per tokenizer call (default: %(default)s)")
+    args = parser.parse_args()
+    
+    files = args.files or [
+        find_sharegpt_file(base) or f"{base}.json"
+        for base in (os.path.join("final_rich_dataset_fixed", split) for split in ("train", "validation", "test"))
+    ]
+    
+    cache = TokenCountCache(args.cache, args.tokenizer)
+    counter = TokenCounter(cache, args.batch_size)
+    over_length = 0
+    
+    try:
+        for filepath in files:
+            report = file_token_counts(filepath, counter, args.sequence_len)
+            print_token_report(os.path.basename(filepath), report)
+            over_length += len(report["over_length"])
+    finally:
+        cache.close()
+    
+    print(f"\nToken cache: {counter.hits:,} messages reused, {counter.tokenized:,} tokenized")
+    print(f"Over-length conversations: {over_length:,}")
+
+if __name__ == "__main__":
+    main()
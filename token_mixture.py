@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Token Budget Mixture
+Selects the conversations of each source so the training mix is set by
+tokens rather than record counts: a total token budget is divided between the
+sources by weight and filled from their cached token counts
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime
+from typing import Dict, Any, List
+
+from sharegpt_io import ShareGPTWriter, find_sharegpt_file, iter_sharegpt_file, write_json_atomic
+from token_counts import (
+    DEFAULT_CACHE, DEFAULT_SEQUENCE_LEN, DEFAULT_TOKENIZER, TokenCountCache, TokenCounter, file_token_counts
+)
+
+# Conversion output of every source, as named by convert_all_data (without extension)
+SOURCE_FILES = {
+    "cot": "rich_sharegpt_cot_data",
+    "semantic_memory": "rich_sharegpt_semantic_memory",
+    "episodic_memory": "rich_sharegpt_episodic_memory",
+    "procedural_memory": "rich_sharegpt_procedural_memory",
+    "realtime_reflection": "rich_sharegpt_realtime_reflection",
+    "strategy_reflection": "rich_sharegpt_strategy_reflection",
+    "deep_reflection": "rich_sharegpt_deep_reflection"
+}
+
+# The sources create_final_fixed_dataset includes, weighted equally
+DEFAULT_WEIGHTS = {"cot": 1.0, "semantic_memory": 1.0, "episodic_memory": 1.0, "procedural_memory": 1.0}
+
+def parse_weights(specs: List[str]) -> Dict[str, float]:
+    """Weights from "source=weight" arguments"""
+    
+    weights = {}
+    for spec in specs:
+        source, sep, value = spec.partition("=")
+        if not sep or source not in SOURCE_FILES:
+            raise ValueError(f"Expected source=weight with a source from {', '.join(SOURCE_FILES)}: {spec}")
+        weights[source] = float(value)
+        if weights[source] < 0:
+            raise ValueError(f"Weights cannot be negative: {spec}")
+    return weights
+
+def split_budget(budget: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """Each source's share of budget tokens, in proportion to its weight"""
+    
+    total_weight = sum(weights.values())
+    if total_weight <= 0:
+        raise ValueError("At least one source needs a positive weight")
+    return {source: int(budget * weight / total_weight) for source, weight in weights.items()}
+
+def select_records(tokens: List[int], budget: int, seed: int = 42,
+                   sequence_len: int = DEFAULT_SEQUENCE_LEN) -> Dict[str, Any]:
+    """Pick records in a seeded random order until the next one would exceed budget tokens
+    
+    A record counts with the tokens it is trained on, at most sequence_len, so
+    the selection overshoots nothing and falls short of budget by less than
+    one record unless the source runs out. indices are in file order.
+    """
+    
+    order = list(range(len(tokens)))
+    random.Random(seed).shuffle(order)
+    
+    selected = []
+    used = 0
+    for index in order:
+        trained = min(tokens[index], sequence_len)
+        if used + trained > budget:
+            break
+        selected.append(index)
+        used += trained
+    selected.sort()
+    
+    available = sum(min(count, sequence_len) for count in tokens)
+    return {
+        "indices": selected,
+        "records": len(selected),
+        "tokens": used,
+        "available_records": len(tokens),
+        "available_tokens": available,
+        "short_tokens": budget - used if len(selected) == len(tokens) else 0
+    }
+
+def write_selection(source_file: str, output_file: str, indices: List[int]) -> int:
+    """Copy the conversations at indices (in file order) from source_file to output_file"""
+    
+    wanted = iter(indices)
+    next_index = next(wanted, None)
+    with ShareGPTWriter(output_file, "json", keep_empty=True) as writer:
+        for index, conversation in enumerate(iter_sharegpt_file(source_file)):
+            if next_index is None:
+                break
+            if index == next_index:
+                writer.write(conversation)
+                next_index = next(wanted, None)
+    return writer.count
+
+def main():
+    parser = argparse.ArgumentParser(description="Select a token-budgeted mixture of the converted sources")
+    parser.add_argument("--budget", type=int, required=True,
+                        help="Total tokens per epoch to select across all sources")
+    parser.add_argument("--weights", nargs="+", metavar="SOURCE=WEIGHT",
+                        help="Relative token share of each source (default: "
+                             + " ".join(f"{source}={weight:g}" for source, weight in DEFAULT_WEIGHTS.items()) + ")")
+    parser.add_argument("--source-dir", default="processed_rich_fixed",
+                        help="Directory with the ShareGPT conversions (default: %(default)s)")
+    parser.add_argument("--output-dir", default="processed_rich_mixture",
+                        help="Directory for the selected conversions, readable by create_final_fixed_dataset.py "
+                             "--source-dir (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Seed for the order records are selected in (default: %(default)s)")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER,
+                        help="Tokenizer name or local path (default: %(default)s)")
+    parser.add_argument("--sequence-len", type=int, default=DEFAULT_SEQUENCE_LEN,
+                        help="Tokens a record is trained on at most (default: %(default)s)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE,
+                        help="Token count cache database (default: %(default)s)")
+    parser.add_argument("--epochs", type=int, default=3,
+                        help="Epochs planned, for the training token total (default: %(default)s)")
+    parser.add_argument("--tokens-per-second", type=float,
+                        help="Measured training throughput, to estimate the GPU hours of the mixture")
+    args = parser.parse_args()
+    
+    try:
+        weights = parse_weights(args.weights) if args.weights else dict(DEFAULT_WEIGHTS)
+        budgets = split_budget(args.budget, weights)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    print("=== Token Budget Mixture ===")
+    print(f"Budget: {args.budget:,} tokens per epoch\n")
+    
+    cache = TokenCountCache(args.cache, args.tokenizer)
+    counter = TokenCounter(cache)
+    sources = {}
+    
+    try:
+        for source, budget in budgets.items():
+            source_file = find_sharegpt_file(os.path.join(args.source_dir, SOURCE_FILES[source]))
+            if source_file is None:
+                print(f"Warning: no conversions of {source} in {args.source_dir}, skipping")
+                continue
+            
+            report = file_token_counts(source_file, counter, args.sequence_len)
+            selection = select_records(report["tokens"], budget, args.seed, args.sequence_len)
+            output_file = os.path.join(args.output_dir, f"{SOURCE_FILES[source]}.json")
+            write_selection(source_file, output_file, selection.pop("indices"))
+            
+            sources[source] = {"file": os.path.basename(output_file), "weight": weights[source],
+                               "budget_tokens": budget, **selection}
+            print(f"{source}: {selection['records']:,} of {selection['available_records']:,} conversations, "
+                  f"{selection['tokens']:,} of {budget:,} tokens")
+            if selection["short_tokens"]:
+                print(f"  ⚠ Only {selection['available_tokens']:,} tokens available, "
+                      f"{selection['short_tokens']:,} short of the budget")
+    finally:
+        cache.close()
+    
+    selected = sum(source["tokens"] for source in sources.values())
+    plan = {
+        "created": datetime.now().isoformat(),
+        "budget_tokens": args.budget,
+        "selected_tokens": selected,
+        "seed": args.seed,
+        "tokenizer": args.tokenizer,
+        "sequence_len": args.sequence_len,
+        "epochs": args.epochs,
+        "training_tokens": selected * args.epochs,
+        "sources": sources
+    }
+    
+    print(f"\nSelected {selected:,} tokens per epoch, {selected * args.epochs:,} over {args.epochs} epochs")
+    if args.tokens_per_second:
+        plan["tokens_per_second"] = args.tokens_per_second
+        plan["gpu_hours"] = round(selected * args.epochs / args.tokens_per_second / 3600, 2)
+        print(f"Estimated training time: {plan['gpu_hours']:,} hours at {args.tokens_per_second:,.0f} tokens/sec")
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    plan_file = os.path.join(args.output_dir, "mixture_plan.json")
+    write_json_atomic(plan_file, plan)
+    print(f"Plan saved to {plan_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized Training Store
+Tokenizes the final dataset splits once and writes token ids, assistant-only
+loss masks and record offsets as flat arrays that training can memory-map
+
+Axolotl does not read this store: it loads the splits from the dataset
+directory and keeps its own tokenized copy in dataset_prepared_path. The
+store serves custom training loops and offline tools (packing_planner.py
+--from-store), and lives outside the dataset directory, where HF datasets
+would take its files for split data.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+from array import array
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+from dataset_stats import file_hash
+from sharegpt_io import find_sharegpt_file, iter_sharegpt_file, write_json_atomic
+from token_counts import DEFAULT_TOKENIZER, DEFAULT_SEQUENCE_LEN, load_tokenizer
+
+# Bump when the rendering, masking or array layout changes
+STORE_VERSION = 1
+
+DEFAULT_STORE_DIR = "tokenized_dataset"
+
+# Array files of one split and their element types (array typecodes)
+ARRAY_FILES = {
+    "input_ids": ("input_ids.bin", 'I'),  # uint32, the Phi-4 vocabulary does not fit in 16 bits
+    "loss_mask": ("loss_mask.bin", 'B'),  # 1 where the token is trained on
+    "offsets": ("offsets.bin", 'Q')  # record i spans [offsets[i], offsets[i + 1])
+}
+
+def split_message(message: Dict[str, Any]) -> Tuple[str, str]:
+    """phi_3 rendering of a message as (header, body); only assistant bodies are trained on"""
+    return f"<|{message['role']}|>\n", f"{message['content']}<|end|>\n"
+
+def tokenize_conversations(tokenizer, conversations: List[Dict[str, Any]]) -> List[Tuple[List[int], List[int]]]:
+    """Token ids and loss mask of each conversation, tokenizing all of its messages in one batch
+    
+    Every message is tokenized whole, exactly as token_counts counts it, and
+    the character offsets of the tokens decide which ones fall in the body of
+    an assistant message (train_on_inputs: false).
+    """
+    
+    texts = []
+    body_starts = []
+    for conv in conversations:
+        for message in conv.get('messages') or []:
+            header, body = split_message(message)
+            texts.append(header + body)
+            body_starts.append(len(header) if message['role'] == 'assistant' else None)
+    
+    encoded = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+    
+    results = []
+    index = 0
+    for conv in conversations:
+        ids = []
+        mask = []
+        for _ in conv.get('messages') or []:
+            body_start = body_starts[index]
+            ids.extend(encoded["input_ids"][index])
+            if body_start is None:
+                mask.extend([0] * len(encoded["input_ids"][index]))
+            else:
+                mask.extend(1 if start >= body_start else 0 for start, _ in encoded["offset_mapping"][index])
+            index += 1
+        results.append((ids, mask))
+    return results
+
+def store_is_current(split_dir: str, source_hash: str, tokenizer_name: str, sequence_len: int) -> bool:
+    """True if split_dir was built from the same file with the same settings"""
+    
+    meta_file = os.path.join(split_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        return False
+    
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return (meta.get("version") == STORE_VERSION and meta.get("source_hash") == source_hash
+            and meta.get("tokenizer") == tokenizer_name and meta.get("sequence_len") == sequence_len)
+
+def build_split(tokenizer, source_file: str, split_dir: str, tokenizer_name: str,
+                sequence_len: int = DEFAULT_SEQUENCE_LEN, batch_size: int = 256) -> Dict[str, Any]:
+    """Tokenize one split into split_dir, streaming batch_size conversations at a time
+    
+    Conversations longer than sequence_len are dropped, as Axolotl drops them,
+    and their count is recorded in meta.json.
+    """
+    
+    tmp_dir = f"{split_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    
+    files = {name: open(os.path.join(tmp_dir, filename), 'wb') for name, (filename, _) in ARRAY_FILES.items()}
+    records = 0
+    dropped = 0
+    tokens = 0
+    trained_tokens = 0
+    
+    def write_batch(batch):
+        nonlocal records, dropped, tokens, trained_tokens
+        for ids, mask in tokenize_conversations(tokenizer, batch):
+            if len(ids) > sequence_len:
+                dropped += 1
+                continue
+            array(ARRAY_FILES["input_ids"][1], ids).tofile(files["input_ids"])
+            array(ARRAY_FILES["loss_mask"][1], mask).tofile(files["loss_mask"])
+            records += 1
+            tokens += len(ids)
+            trained_tokens += sum(mask)
+            array(ARRAY_FILES["offsets"][1], [tokens]).tofile(files["offsets"])
+    
+    try:
+        array(ARRAY_FILES["offsets"][1], [0]).tofile(files["offsets"])
+        
+        batch = []
+        for conv in iter_sharegpt_file(source_file):
+            batch.append(conv)
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+    finally:
+        for f in files.values():
+            f.close()
+    
+    meta = {
+        "version": STORE_VERSION,
+        "source_file": os.path.basename(source_file),
+        "source_hash": file_hash(source_file),
+        "tokenizer": tokenizer_name,
+        "sequence_len": sequence_len,
+        "chat_template": "phi_3",
+        "train_on_inputs": False,
+        "records": records,
+        "dropped_over_length": dropped,
+        "tokens": tokens,
+        "trained_tokens": trained_tokens,
+        "arrays": {name: {"file": filename, "typecode": typecode} for name, (filename, typecode) in ARRAY_FILES.items()},
+        "created": datetime.now().isoformat()
+    }
+    write_json_atomic(os.path.join(tmp_dir, "meta.json"), meta)
+    
+    # Swap the finished split in whole
+    shutil.rmtree(split_dir, ignore_errors=True)
+    os.replace(tmp_dir, split_dir)
+    return meta
+
+class TokenizedSplit:
+    """Read-only view of a built split; records are slices of the memory-mapped arrays.
+    
+    Nothing is copied: store[i] returns (input_ids, loss_mask) memoryviews into
+    the page cache, which numpy.frombuffer or torch.frombuffer can wrap as is.
+    """
+    
+    def __init__(self, split_dir: str):
+        with open(os.path.join(split_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        
+        self._maps = []
+        self._buffers = []
+        self._views = {}
+        for name, (filename, typecode) in ARRAY_FILES.items():
+            with open(os.path.join(split_dir, filename), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._views[name] = memoryview(b'').cast(typecode)
+                    continue
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer = memoryview(mapped)
+            self._maps.append(mapped)
+            self._buffers.append(buffer)
+            self._views[name] = buffer.cast(typecode)
+    
+    def __len__(self) -> int:
+        return len(self._views["offsets"]) - 1
+    
+    def __getitem__(self, index: int) -> Tuple[memoryview, memoryview]:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self._views["offsets"][index], self._views["offsets"][index + 1]
+        return self._views["input_ids"][start:end], self._views["loss_mask"][start:end]
+    
+    def lengths(self) -> List[int]:
+        """Token length of every record"""
+        offsets = self._views["offsets"]
+        return [offsets[i + 1] - offsets[i] for i in range(len(self))]
+    
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        for buffer in self._buffers:
+            buffer.release()
+        for mapped in self._maps:
+            mapped.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pre-tokenized training store")
+    parser.add_argument("--dataset-dir", default="final_rich_dataset_fixed",
+                        help="Directory with the split files (default: %(default)s)")
+    parser.add_argument("--output-dir", default=DEFAULT_STORE_DIR,
+                        help="Store directory, outside the dataset directory (default: %(default)s)")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER,
+                        help="Tokenizer name or local path (default: %(default)s)")
+    parser.add_argument("--sequence-len", type=int, default=DEFAULT_SEQUENCE_LEN,
+                        help="Drop conversations longer than this many tokens (default: %(default)s)")
+    parser.add_argument("--splits", nargs="+", default=["train", "validation", "test"])
+    args = parser.parse_args()
+    
+    output_dir = args.output_dir
+    tokenizer = None
+    
+    print("=== Building Pre-tokenized Store ===")
+    for split_name in args.splits:
+        source_file = find_sharegpt_file(os.path.join(args.dataset_dir, split_name))
+        if source_file is None:
+            print(f"Warning: {split_name} split not found in {args.dataset_dir}")
+            continue
+        
+        split_dir = os.path.join(output_dir, split_name)
+        if store_is_current(split_dir, file_hash(source_file), args.tokenizer, args.sequence_len):
+            print(f"{split_name}: up to date")
+            continue
+        
+        if tokenizer is None:
+            tokenizer = load_tokenizer(args.tokenizer)
+        
+        meta = build_split(tokenizer, source_file, split_dir, args.tokenizer, args.sequence_len)
+        print(f"{split_name}: {meta['records']:,} conversations, {meta['tokens']:,} tokens "
+              f"({meta['trained_tokens'] / meta['tokens'] * 100 if meta['tokens'] else 0:.1f}% trained)")
+        if meta["dropped_over_length"]:
+            print(f"  ⚠ Dropped {meta['dropped_over_length']:,} conversations over {args.sequence_len:,} tokens")
+    
+    print(f"Store: {output_dir}")
+
+if __name__ == "__main__":
+    main()